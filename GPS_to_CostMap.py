@@ -1,149 +1,254 @@
 import os
-import pandas as pd
+import sys
+from functools import partial
 import numpy as np
 from pykml.factory import KML_ElementMaker as KML
-from lxml import etree
-from geopy import distance
-
-# Change the below variable to be which ever file you want to parse out.
-# If left blank it will run all files in the FILES_TO_WORK directory
-GPS_DATA_FILENAME = ""
-
-
-def main(file):
+from nmea_parser import uncompressed_name, CHUNK_SIZE
+from gps_stream import iter_gps_data, track_parameters, Feed
+from gps_track import Track
+from turn_detection import turn_windows, turn_events, settled_fixes, context_start
+from stop_detection import stop_events, settled_stops
+import spatial_dedup
+from spatial_dedup import remove_nearby_points
+from kml_writer import kml_file, shared_style, style_url
+from profiling import stage
+
+# Defaults of the hazards command, see gps_cli: logs read when no file is given and where hazards are written
+INPUT_DIRECTORY = "FILES_TO_WORK/"
+OUTPUT_DIRECTORY = "Output_CostMap/"
+# Set to True to process files chunk by chunk with bounded memory, for logs too large to load at once
+STREAMING = False
+# Number of processes used when several logs are given, None uses every core
+WORKERS = None
+
+# Set to True to reuse the results of logs that have not changed since the last run, see result_cache
+USE_CACHE = False
+# Set to True to write compressed .kmz files instead of .kml
+KMZ_OUTPUT = False
+# Set to True to add the hazards of the logs given to the hazards command to this cost map, kept from run to run,
+# see cost_map, and write it to OUTPUT_DIRECTORY as Cost_Map.kml
+UPDATE_COST_MAP = False
+COST_MAP_FILE = "Cost_Map.npz"
+# Set to True to add them to this store of hazards by map tile, see hazard_store, and export the tiles they change
+# to OUTPUT_DIRECTORY + HAZARD_TILES
+UPDATE_HAZARD_STORE = False
+HAZARD_STORE_DIRECTORY = "Hazard_Store/"
+HAZARD_TILES = "Hazard_Tiles"
+
+TURN_WINDOW = 4.0  # seconds of heading change averaged around each fix, see turn_detection
+TURN_RATE = 4.0  # degrees per second, over TURN_WINDOW, above which the car is turning
+TURN_ANGLE = 30.0  # smallest change in heading in degrees of a turn
+TURN_SPEEDS = (3, 25)  # speeds in MPH of a turn
+DWELL_SPEED = 2.0  # MPH at or below which the car is standing, see stop_detection
+MOVING_SPEED = 10.0  # MPH from which the car is driving again, ending a stop
+STOP_DURATIONS = (2.0, 300.0)  # seconds a stop stands, standing longer is parking
+TURN_RADIUS = 8  # meters within which only the first turn is kept
+STOP_RADIUS = 15  # meters within which only the first stop is kept
+HAZARD_COLUMNS = ["time", "longitude", "latitude", "speed", "angle"]  # what stops and turns are found from
+
+
+def main(file, stream=False, cache=USE_CACHE, track=None):
     """
     Runs the main program.
     :param file: the file
+    :param stream: process the file chunk by chunk with bounded memory, see stream_hazards
+    :param cache: reuse the results and track stored for the same file contents
+    :param track: the gps_track.Track of the file, i.e shared with GPS_to_KML, None to make one
     :return: stops, left_turn, right_turn
     """
-    GPGGA_data, GPRMC_data = set_gps_data(file)
-    GPSData = format_gps_data(GPRMC_data, GPGGA_data)
-
-    pd.set_option('display.max_columns', 20)
-    change_in_direction = GPSData["angle"].values
-    change_in_direction = np.array(change_in_direction).astype(float)  # convert elements to float
-    change_in_direction[1:] = change_in_direction[1:] - change_in_direction[:-1]
-    for idx, direction in enumerate(change_in_direction):
-        # loops through the angle column to eliminate very large directional changes
-        # because signs cause huge direction changes when crossing an axis
-        # (i.e from 1 to 359 is only 2 degrees in practice)
-        diff = direction % 360
-        result = diff if diff < 180 else 360 - diff
-        sign = 1 if (0 <= direction <= 180) or (-180 >= direction >= -360) else -1
-        change_in_direction[idx] = result * sign
-    change_in_direction[0] = change_in_direction[1]
-    change_in_direction[-1] = change_in_direction[-2]
-    GPSData["angle difference"] = change_in_direction
-    left_turns = GPSData[np.logical_and(GPSData["angle difference"] < -5, GPSData["speed"] > 3)]
-    left_turns = left_turns[np.logical_and(left_turns["angle difference"] > -8, left_turns["speed"] < 25)]
-    right_turns = GPSData[np.logical_and(GPSData["angle difference"] > 5, GPSData["speed"] > 3)]
-    right_turns = right_turns[np.logical_and(right_turns["angle difference"] < 8, right_turns["speed"] < 25)]
-    right_turn_list = []
-    points_to_delete = set()
-    for row in right_turns.iterrows():  # there's probably a more efficient way to convert the column to a list
-        right_turn_list.append([row[1][2], row[1][1]])
-    for idx in range(len(right_turn_list)):
-        for j in range(idx + 1, len(right_turn_list)):
-            dist = distance.distance(right_turn_list[idx], right_turn_list[j]).m
-            if dist < 8:  # multiple consecutive points where the car is not moving are removed
-                points_to_delete.add(j)
-    right_turn_list = [right_turn_list[i] for i in range(len(right_turn_list)) if i not in points_to_delete]
-
-    points_to_delete = set()
-    left_turn_list = []
-    for row in left_turns.iterrows():
-        left_turn_list.append([row[1][2], row[1][1]])
-    for idx in range(len(left_turn_list)):
-        for j in range(idx + 1, len(left_turn_list)):
-            dist = distance.distance(left_turn_list[idx], left_turn_list[j]).m
-            if dist < 8:  # multiple consecutive points where the car is not moving are removed
-                points_to_delete.add(j)
-    left_turn_list = [left_turn_list[i] for i in range(len(left_turn_list)) if i not in points_to_delete]
-
-    GPSData["speedavg"] = GPSData["speed"].rolling(10, center=True).mean()
-    stops = GPSData[np.logical_and(GPSData["speed"] > 9, GPSData["speed"] < 12)]
-    stops = stops[np.logical_and(stops["speedavg"] > 9, stops["speedavg"] < 12)]
-    stopping_points = []
-    for row in stops.iterrows():
-        stopping_points.append([row[1][2], row[1][1]])
-    points_to_delete = set()
-    for idx in range(len(stopping_points)):
-        for j in range(idx + 1, len(stopping_points)):
-            dist = distance.distance(stopping_points[idx], stopping_points[j]).m
-            if dist < 15:  # multiple consecutive points where the car is not moving are removed
-                points_to_delete.add(j)
-    new_stopping_list = [stopping_points[i] for i in range(len(stopping_points)) if i not in points_to_delete]
-    coordinates = ""
-    for row in GPSData.iterrows():
-        if pd.notnull(row[1][0]):
-            coordinates += f"{row[1][2]},{row[1][1]},0.0\n"
+    track = Track(file, cache) if track is None else track
+    return track.cached("hazards", hazard_parameters(), partial(find_all_hazards, track, stream))
 
+
+def find_all_hazards(track, stream=False):
+    """
+    Finds the stops and turns of a file.
+    :param track: the gps_track.Track of the file
+    :param stream: process the file chunk by chunk with bounded memory, see stream_hazards
+    :return: stops, left_turn, right_turn
+    """
+    if stream:
+        stops, left_turns, right_turns = [], [], []
+        with stage("stream hazards") as record:
+            for new_stops, new_left_turns, new_right_turns in stream_hazards(track.file):
+                stops += new_stops
+                left_turns += new_left_turns
+                right_turns += new_right_turns
+            record["rows out"] = len(stops) + len(left_turns) + len(right_turns)
+        return stops, left_turns, right_turns
+
+    GPSData = track.frame()
+
+    with stage("turn detection", len(GPSData)) as record:
+        stopping_points, left_turn_list, right_turn_list = find_hazards(GPSData)
+        record["rows out"] = len(stopping_points) + len(left_turn_list) + len(right_turn_list)
+
+    with stage("dedup", record["rows out"]) as record:
+        right_turn_list = remove_nearby_points(right_turn_list, TURN_RADIUS)
+        left_turn_list = remove_nearby_points(left_turn_list, TURN_RADIUS)
+        new_stopping_list = remove_nearby_points(stopping_points, STOP_RADIUS)
+        record["rows out"] = len(new_stopping_list) + len(left_turn_list) + len(right_turn_list)
     return new_stopping_list, left_turn_list, right_turn_list
 
 
+def hazard_parameters():
+    """
+    :return: the settings stops and turns depend on, part of their cache key
+    """
+    return {"turn window": TURN_WINDOW, "turn rate": TURN_RATE, "turn angle": TURN_ANGLE,
+            "turn speeds": TURN_SPEEDS, "dwell speed": DWELL_SPEED, "moving speed": MOVING_SPEED,
+            "stop durations": STOP_DURATIONS, "turn radius": TURN_RADIUS,
+            "stop radius": STOP_RADIUS, "exact distances": spatial_dedup.EXACT_CHECK, **track_parameters()}
+
+
+def stream_hazards(file, chunk_size=CHUNK_SIZE):
+    """
+    Finds stops and turns the way main does, but chunk by chunk with bounded memory.
+    :param file: the file
+    :param chunk_size: number of bytes parsed at a time
+    :return: generator of the stops, left turns and right turns found in each chunk
+    """
+    return detect_hazards(iter_gps_data(file, chunk_size=chunk_size))
+
+
+def hazards_alongside(frames, found):
+    """
+    Passes on the fixes a route is drawn from while finding the stops and turns of all the
+    fixes, so one streamed pass over a log gives both, see gps_cli.
+    :param frames: iterable of the DataFrames of all the fixes and of the fixes drawn, see
+        gps_stream.iter_gps_frames
+    :param found: list the stops, left turns and right turns are appended to once frames runs out
+    :return: generator of the non-empty DataFrames of the fixes drawn
+    """
+    hazard_frames = Feed()
+    hazards = detect_hazards(hazard_frames)
+    stops, left_turns, right_turns = [], [], []
+    for GPSData, routeData in frames:
+        if len(GPSData):
+            hazard_frames.push(GPSData)
+            new_stops, new_left_turns, new_right_turns = next(hazards)
+            stops += new_stops
+            left_turns += new_left_turns
+            right_turns += new_right_turns
+        if len(routeData):
+            yield routeData
+    new_stops, new_left_turns, new_right_turns = next(hazards)  # the last fixes, see detect_hazards
+    found.append((stops + new_stops, left_turns + new_left_turns, right_turns + new_right_turns))
+
+
+def detect_hazards(frames):
+    """
+    Finds stops and turns in a track arriving in pieces. Fixes are classified once the
+    fixes after them that the turn windows need have arrived, and never in the middle of a
+    stop, unless it already stood long enough to be parking, or of a turn, and the fixes
+    before them are kept as context, so the results are the same as for the whole track at once.
+    Exactly one result is yielded per piece taken from frames, then one more for the last
+    fixes once frames runs out, so frames can be fed one piece at a time as they arrive.
+    :param frames: iterable of DataFrames, or dictionaries of NumPy columns, of consecutive
+    fixes, see iter_gps_data
+    :return: generator of the stops, left turns and right turns found so far that are not
+    near earlier ones
+    """
+    earlier_stops, earlier_left_turns, earlier_right_turns = [], [], []
+    history = None  # fixes kept for context, then fixes still waiting to be classified
+    classified = 0  # number of context fixes at the start of history
+    for GPSData in frames:
+        GPSData = {name: np.asarray(GPSData[name], dtype=float) for name in HAZARD_COLUMNS}
+        history = GPSData if history is None else {name: np.concatenate((history[name], GPSData[name]))
+                                                   for name in HAZARD_COLUMNS}
+        windows = _turn_windows(history)
+        ready = _settled(history, windows, classified)
+        stops, left_turns, right_turns = [], [], []
+        if ready > classified:
+            stops, left_turns, right_turns = find_hazards(history, classified, ready, windows)
+            keep_from = context_start(windows, TURN_WINDOW, ready)
+            history = {name: column[keep_from:] for name, column in history.items()}
+            classified = ready - keep_from
+        yield (remove_nearby_points(stops, STOP_RADIUS, earlier_stops),
+               remove_nearby_points(left_turns, TURN_RADIUS, earlier_left_turns),
+               remove_nearby_points(right_turns, TURN_RADIUS, earlier_right_turns))
+    stops, left_turns, right_turns = [], [], []
+    if history is not None and len(history["speed"]) > classified:
+        stops, left_turns, right_turns = find_hazards(history, classified)
+    yield (remove_nearby_points(stops, STOP_RADIUS, earlier_stops),
+           remove_nearby_points(left_turns, TURN_RADIUS, earlier_left_turns),
+           remove_nearby_points(right_turns, TURN_RADIUS, earlier_right_turns))
+
+
+def _settled(history, windows, begin):
+    """
+    :return: number of fixes of history that can be classified before more fixes arrive,
+        cutting neither a stop nor a turn, see stop_detection and turn_detection
+    """
+    ready = len(history["speed"])
+    while True:  # each cut can only move back, until both agree
+        settled = settled_stops(windows["ticks"], history["speed"], DWELL_SPEED, MOVING_SPEED, STOP_DURATIONS[1],
+                                begin, settled_fixes(windows, TURN_WINDOW, begin, ready, final=False))
+        if settled == ready:
+            return ready
+        ready = settled
+
+
+def _turn_windows(GPSData):
+    """
+    :return: the turn windows of a track with the current settings, see turn_detection.turn_windows
+    """
+    return turn_windows(np.asarray(GPSData["time"]), np.asarray(GPSData["angle"]), np.asarray(GPSData["speed"]),
+                        TURN_WINDOW, TURN_RATE, TURN_SPEEDS)
+
+
+def find_hazards(GPSData, begin=0, end=None, windows=None):
+    """
+    Finds the stops and turns of a track, see stop_detection and turn_detection.
+    :param GPSData: DataFrame, or dictionary of NumPy columns, with the HAZARD_COLUMNS
+    :param begin: first fix classified, the ones before are context
+    :param end: fix after the last one classified, never inside a stop or a turn, None for every fix
+    :param windows: turn windows of GPSData, see _turn_windows, None to compute them
+    :return: stops, left turns and right turns as lists of [longitude, latitude], stops where
+        the car stood the longest and turns at their peak
+    """
+    speed = np.asarray(GPSData["speed"], dtype=float)
+    longitudes = np.asarray(GPSData["longitude"], dtype=float)
+    latitudes = np.asarray(GPSData["latitude"], dtype=float)
+    stops = stop_events(np.asarray(GPSData["time"]), longitudes, latitudes, speed, DWELL_SPEED, MOVING_SPEED,
+                        STOP_DURATIONS, begin, end)
+    turns = turn_events(_turn_windows(GPSData) if windows is None else windows, speed, TURN_ANGLE, TURN_SPEEDS,
+                        begin, end)
+    peaks = np.column_stack((longitudes, latitudes))[turns["peak"]]
+    return (np.column_stack((stops["longitude"], stops["latitude"])).tolist(), peaks[turns["angle"] < 0].tolist(),
+            peaks[turns["angle"] > 0].tolist())
+
+
 def kml_stops(kml_coordinates, docs):
     """
     creates a purple placemark for every coordinate classified as a stop
     """
-    for coord in kml_coordinates:
-        doc = KML.Placemark(
-            KML.description("Stop"),
-            KML.Style(
-                KML.IconStyle(
-                    KML.color("ff780078"),
-                    KML.Icon(
-                        KML.href("http://maps.google.com/mapfiles/kml/paddle/1.png")
-                    )
-                )
-            ),
-            KML.Point(
-                KML.coordinates(
-                    str(coord[0]) + "," + str(coord[1]) + ",0.0"
-                )
-            )
-        )
-        docs.append(doc)
+    kml_points(kml_coordinates, docs, "Stop", "stop")
 
 
 def kml_left_turns(kml_coordinates, docs):
     """
     creates a yellow placemark for every coordinate classified as a left turn
     """
-    for coord in kml_coordinates:
-        doc = KML.Placemark(
-            KML.description("Left Turn"),
-            KML.Style(
-                KML.IconStyle(
-                    KML.color("FF14F0FF"),
-                    KML.Icon(
-                        KML.href("http://maps.google.com/mapfiles/kml/paddle/1.png")
-                    )
-                )
-            ),
-            KML.Point(
-                KML.coordinates(
-                    str(coord[0]) + "," + str(coord[1]) + ",0.0"
-                )
-            )
-        )
-        docs.append(doc)
+    kml_points(kml_coordinates, docs, "Left Turn", "left_turn")
 
 
 def kml_right_turns(kml_coordinates, docs):
     """
     creates a cyan placemark for every coordinate classified as a right turn
     """
+    kml_points(kml_coordinates, docs, "Right Turn", "right_turn")
+
+
+def kml_points(kml_coordinates, docs, description, style_id):
+    """
+    creates a placemark for every coordinate, using one of HAZARD_STYLES
+    :param docs: a KML.Document, or a document opened with kml_writer.kml_file
+    """
     for coord in kml_coordinates:
         doc = KML.Placemark(
-            KML.description("Right Turn"),
-            KML.Style(
-                KML.IconStyle(
-                    KML.color("ffffff00"),
-                    KML.Icon(
-                        KML.href("http://maps.google.com/mapfiles/kml/paddle/1.png")
-                    )
-                )
-            ),
+            KML.description(description),
+            style_url(style_id),
             KML.Point(
                 KML.coordinates(
                     str(coord[0]) + "," + str(coord[1]) + ",0.0"
@@ -153,198 +258,35 @@ def kml_right_turns(kml_coordinates, docs):
         docs.append(doc)
 
 
-def set_gps_data(data):
-    """
-    Creates three dictionaries of GPS data using GPGGA, GPRMC, and listed coordinates.
-    See: http://aprs.gids.nl/nmea/
-    :param data: Name of a txt file where GPS data is retrieved.
-    :return: GPGGA, GPRMC dictionaries
-    """
-    GPGGA = {"UTC position": [], "latitude": [], "longitude": [],
-             "GPS Fix": [], "# of Satellites": [], "Horizontal dilution of precision": [],
-             "antenna altitude": [], "geoidal separation": [], "age of GPS data": [],
-             "Differential reference station ID": []}
-    GPRMC = {"UTC position": [], "validity": [], "latitude": [], "longitude": [],
-             "speed over ground in knots": [], "track made good in degrees": [],
-             "UT date": [], "variation": [], "checksum": []}
-    with open(data) as gps_file:
-        for line in gps_file:
-            line_tokens = line.split(",")  # splits data by commas
-
-            if line_tokens[0] == "$GPGGA":  # if the first item in a line is GPGGA add it to that dictionary
-                if line_tokens[2] == "" or line_tokens[4] == "":
-                    continue
-                GPGGA["UTC position"].append(float(line_tokens[1]))
-                if line_tokens[3] == "S":
-                    GPGGA["latitude"].append(float(line_tokens[2]) * -1)
-                else:
-                    GPGGA["latitude"].append(float(line_tokens[2]))
-                if line_tokens[5] == "W":
-                    GPGGA["longitude"].append(float(line_tokens[4]) * -1)
-                else:
-                    GPGGA["longitude"].append(float(line_tokens[4]))
-                GPGGA["GPS Fix"].append(int(line_tokens[6]))
-                GPGGA["# of Satellites"].append(int(line_tokens[7]))
-                GPGGA["Horizontal dilution of precision"].append(float(line_tokens[8]))
-                GPGGA["antenna altitude"].append([line_tokens[9], line_tokens[10]])
-                try:
-                    GPGGA["geoidal separation"].append([line_tokens[11], line_tokens[12]])
-                except IndexError:
-                    GPGGA["geoidal separation"].append(None)
-                try:
-                    GPGGA["age of GPS data"].append(line_tokens[13])
-                except IndexError:
-                    GPGGA["age of GPS data"].append(None)
-                try:
-                    GPGGA["Differential reference station ID"].append(line_tokens[14].strip('\n'))
-                except IndexError:
-                    GPGGA["Differential reference station ID"].append(None)
-            elif line_tokens[0] == "$GPRMC":
-                if line_tokens[3] == "" or line_tokens[5] == "":
-                    continue
-                try:
-                    float(line_tokens[5])
-                except ValueError:
-                    continue
-                GPRMC["UTC position"].append(float(line_tokens[1]))
-                GPRMC["validity"].append(line_tokens[2])
-                if line_tokens[4] == "S":
-                    GPRMC["latitude"].append(float(line_tokens[3]) * -1)
-                else:
-                    GPRMC["latitude"].append(float(line_tokens[3]))
-                if line_tokens[6] == "W":
-                    GPRMC["longitude"].append(float(line_tokens[5]) * -1)
-                else:
-                    GPRMC["longitude"].append(float(line_tokens[5]))
-                GPRMC["speed over ground in knots"].append(float(line_tokens[7]))
-                GPRMC["track made good in degrees"].append(float(line_tokens[8]))
-                GPRMC["UT date"].append(line_tokens[9])
-                try:
-                    GPRMC["variation"].append([line_tokens[10], line_tokens[11]])
-                except IndexError:  # if this column is empty make it none for length consistency
-                    GPRMC["variation"].append(None)
-                try:
-                    GPRMC["checksum"].append(line_tokens[12].strip('\n'))
-                except IndexError:
-                    GPRMC["checksum"].append(None)
-    return GPGGA, GPRMC
-
-
-def format_gps_data(GPRMC_data, GPGGA_data):
-    """
-
-    :param GPRMC_data: Data in the GPRMC format.
-    :param GPGGA_data: Data in the GPGGA format.
-    :return: a dictionary with the following:
-        time: The UTC time the position was recorded.
-        Latitude: The latitude of the position.
-        Longitude: The longitude of the position.
-        Speed: The average speed between the previous position and the current one in MPH.
-        Angle: The angle between the previous position and the current one, 0 is due north.
-        Fix Quality: The quality of the gps positioning.
-        Satellites: The number of satellites used in getting the position
-    """
-
-    GPSData = {"time": [], "latitude": [], "longitude": [], "speed": [], "angle": [], "satellites": []}
-
-    counterRMC = 0
-    counterGGA = 0
-    timeRMC = GPRMC_data["UTC position"][counterRMC]
-    timeGGA = GPGGA_data["UTC position"][counterGGA]
-
-    while timeRMC != 0 and timeGGA != 0:
-        if timeRMC == timeGGA:
-            GPSData["time"].append(timeRMC)
-            if GPRMC_data["latitude"][counterRMC] != "":
-                GPSData["latitude"].append(convert_coordinate(GPRMC_data["latitude"][counterRMC]))
-            else:
-                GPSData["latitude"].append(convert_coordinate(GPGGA_data["latitude"][counterGGA]))
-            if GPRMC_data["longitude"][counterRMC] != "":
-                GPSData["longitude"].append(convert_coordinate(GPRMC_data["longitude"][counterRMC]))
-            else:
-                GPSData["longitude"].append(convert_coordinate(GPGGA_data["longitude"][counterGGA]))
-            GPSData["speed"].append(GPRMC_data["speed over ground in knots"][counterRMC] * 1.1508)
-            GPSData["angle"].append(GPRMC_data["track made good in degrees"][counterRMC])
-            GPSData["satellites"].append(GPGGA_data["# of Satellites"][counterGGA])
-            counterRMC += 1
-            counterGGA += 1
-        elif timeRMC < timeGGA:
-            GPSData["time"].append(timeRMC)
-            GPSData["latitude"].append(convert_coordinate(GPRMC_data["latitude"][counterRMC]))
-            GPSData["longitude"].append(convert_coordinate(GPRMC_data["longitude"][counterRMC]))
-            GPSData["speed"].append(GPRMC_data["speed over ground in knots"][counterRMC] * 1.1508)
-            GPSData["angle"].append(GPRMC_data["track made good in degrees"][counterRMC])
-            GPSData["satellites"].append(GPGGA_data["# of Satellites"][counterGGA])
-            counterRMC += 1
-        elif timeGGA < timeRMC:
-            counterGGA += 1
-        if counterRMC >= len(GPRMC_data["UTC position"]) or counterGGA >= len(GPGGA_data["UTC position"]):
-            timeRMC = 0
-            timeGGA = 0
-        else:
-            timeRMC = GPRMC_data["UTC position"][counterRMC]
-            timeGGA = GPGGA_data["UTC position"][counterGGA]
-
-    # convert data into a pandas data frame
-    pd.set_option('display.max_columns', 20)
-    GPSData_df = pd.DataFrame(GPSData)
-    GPSData_df.dropna(inplace=True)  # get rid of NaNs
-    GPSData_df.drop_duplicates(subset=["time"], keep="first", inplace=True)
-
-    return GPSData_df
-
-
-def convert_time(utc_time):
+def icon_style(style_id, color):
     """
-    converts a UTC position from hours, minutes, seconds into just seconds.
-    easier to do math with time in one unit.
-    returns time in seconds.
+    :return: a shared style with a paddle icon of the given color
     """
-    hours = int(utc_time / 10000)
-    minutes_seconds = utc_time % 10000
-    minutes = int(minutes_seconds / 100)
-    seconds = minutes_seconds % 100
-    return hours * 3600 + minutes * 60 + seconds
+    return shared_style(style_id, KML.IconStyle(
+        KML.color(color),
+        KML.Icon(
+            KML.href("http://maps.google.com/mapfiles/kml/paddle/1.png")
+        )
+    ))
 
 
-def convert_coordinate(coordinate):
-    """
-    converts latitude or longitude from degrees + minutes to just degrees
-    returns coordinate in degrees
-    """
-    sign = 1
-    if int(coordinate) < 0:  # i.e if negative, conserve the sign so it doesn't mess up the calculation
-        sign = -1
-    degrees = int(abs(coordinate) / 100)
-    minutes = float(abs(coordinate)) % 100
-    return sign * (degrees + (minutes / 60))
+HAZARD_STYLES = [icon_style("stop", "ff780078"), icon_style("left_turn", "FF14F0FF"),
+                 icon_style("right_turn", "ffffff00")]
 
 
-def create_output_file(header, filename):
+def create_output_file(filename, kmz=KMZ_OUTPUT):
     """
-    :param header: a KML.kml object enclosing documents
-    :param filename: name of the file to write
+    :param filename: name of the file the hazards are for
+    :param kmz: write a compressed .kmz instead of a .kml
+    :return: a document opened with kml_writer.kml_file, with the hazard styles
     """
-    if not os.path.exists('Output_CostMap/'):
-        os.makedirs('Output_CostMap/')
-    outputFilename = "Output_CostMap/" + filename[:-4].split("/")[-1] + "_Hazards.kml"
-    outfile = open(outputFilename, "w")
-    outfile.write(etree.tostring(header, pretty_print=True).decode())
-    outfile.close()
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    outputFilename = (OUTPUT_DIRECTORY + os.path.splitext(os.path.basename(uncompressed_name(filename)))[0]
+                      + ("_Hazards.kmz" if kmz else "_Hazards.kml"))
+    return kml_file(outputFilename, HAZARD_STYLES, kmz)
 
 
 if __name__ == '__main__':
-    if GPS_DATA_FILENAME == "":
-        directory = "FILES_TO_WORK/"
-        costmap = []
-        kml_docs = KML.Document()
-        for fileName in os.listdir(directory):
-            stops, lefts, rights = main(directory+fileName)
-            kml_stops(stops, kml_docs)
-            kml_left_turns(lefts, kml_docs)
-            kml_right_turns(rights, kml_docs)
-        head = KML.kml(kml_docs)
-        create_output_file(head, directory+"Example.kml")
-    else:
-        main(GPS_DATA_FILENAME)
-
+    # the hazards command of gps_cli, with the hazards of all the logs in one Example_Hazards.kml
+    from gps_cli import main as cli
+    sys.exit(cli(["hazards", "--combined", "Example"] + sys.argv[1:]))
@@ -1,267 +1,244 @@
 import os
-import pandas as pd
+import sys
 import numpy as np
 from pykml.factory import KML_ElementMaker as KML
-from lxml import etree
-from geopy import distance
-
-# Change the below variable to be which ever file you want to parse out.
-# If left blank it will run all files in the FILES_TO_WORK directory
-GPS_DATA_FILENAME = ""
-
-
-def main(file):
+from nmea_parser import uncompressed_name
+from gps_stream import iter_gps_data, track_parameters
+from gps_track import Track
+from spatial_dedup import haversine, TOLERANCE
+from kml_writer import kml_file, shared_style, style_url
+from simplify import simplify
+from profiling import stage, count
+
+# Defaults of the route command, see gps_cli: logs read when no file is given and where routes are written
+INPUT_DIRECTORY = "FILES_TO_WORK/"
+OUTPUT_DIRECTORY = "Output_KML/"
+# Set to True to process files chunk by chunk with bounded memory, for logs too large to load at once
+STREAMING = False
+# Number of processes used when several logs are given, None uses every core
+WORKERS = None
+# Set to True to reuse the results of logs that have not changed since the last run, see result_cache
+USE_CACHE = False
+# Set to True to write compressed .kmz files instead of .kml
+KMZ_OUTPUT = False
+
+STRAIGHT_ANGLE = 9  # degrees from the last turning point within which the car is going straight
+STRAIGHT_SPEED = 1.25  # MPH above which the car can be going straight
+GAP = (350, 100000)  # distances in meters from the previous point that start a new segment
+SIMPLIFY_TOLERANCE = 0  # meters a point of the route can be from the line drawn, i.e 1.0, 0 draws every point
+SIMPLIFY_METHOD = "douglas-peucker"  # or "visvalingam", see simplify
+# Levels of detail as (tolerance in meters, minimum size of the segment on screen in pixels), from
+# the coarsest to the finest. Each segment is then drawn once per level, inside a KML Region, and
+# Google Earth only loads the level matching the zoom. Empty draws one level at SIMPLIFY_TOLERANCE.
+LEVELS_OF_DETAIL = []  # i.e [(30, 0), (5, 512), (0, 2048)]
+
+ROUTE_STYLE = shared_style("route", KML.LineStyle(
+    KML.color("ffffff00"),
+    KML.width(8)))
+
+
+def main(file, stream=False, cache=USE_CACHE, kmz=KMZ_OUTPUT, track=None, frames=None):
     """
     Runs the main program.
     :param file: the file
+    :param stream: process the file chunk by chunk with bounded memory instead of loading it at once
+    :param cache: reuse the route segments and track stored for the same file contents
+    :param kmz: write a compressed .kmz instead of a .kml
+    :param track: the gps_track.Track of the file, i.e shared with GPS_to_CostMap, None to make one
+    :param frames: iterable of the DataFrames of the file when streaming, None to stream it here
     :return: N/A
     """
-    GPGGA_data, GPRMC_data = get_gps_data(file)
-    GPSData = format_gps_data(GPRMC_data, GPGGA_data)
-
-    goingStraight = False
-
-    coordinates = [""]
-    previousCoord = [0, 0, 0]
-    straightAngle = 0
-    for row in GPSData.iterrows():
-        if pd.notnull(row[1][0]):
-            direction = row[1][4]
-            speed = row[1][3]
-            if abs(direction - straightAngle) < 9 and speed > 1.25:
-                goingStraight = True
-            else:
-                goingStraight = False
-                straightAngle = direction
-            dist = distance.distance([row[1][2], row[1][1]], [previousCoord[2], previousCoord[1]]).m
-            if 350 < dist < 100000 and goingStraight is False:
-                coordinates.append("")
-            elif dist != 0 and goingStraight is False:
-                coordinates[len(
-                    coordinates) - 1] += f"{row[1][2]},{row[1][1]},0.0\n"  # creates a string of comma-separated coordinates
-            previousCoord = row[1]
-
-    to_kml(coordinates, file)
+    track = Track(file, cache) if track is None else track
+    if track.cache:
+        segments = track.cached("route segments", route_parameters(), lambda: list(find_route(track, stream, frames)))
+    else:
+        segments = find_route(track, stream, frames)
+    with stage("kml write"):
+        to_kml(segments, file, kmz)
 
 
-def to_kml(kml_coordinates, filename):
+def find_route(track, stream=False, frames=None):
     """
-    Creates a KML file using coordinates listed in a txt file.
-    :param kml_coordinates: List of string comma-separated coordinates (longitude, latitude, speed)
-    :param filename: name of the txt file being converted
+    :param track: the gps_track.Track of the file
+    :param stream: process the file chunk by chunk with bounded memory instead of loading it at once
+    :param frames: iterable of the DataFrames of the file when streaming, see iter_gps_data with
+        drop_poor_fixes, None to stream it here
+    :return: route segments, see route_segments, as a generator when streaming
     """
-    docs = KML.kml()
-    doc = KML.Document()
-    placemark = KML.Placemark()
-    for coord_string in kml_coordinates:
-        placemark.append(KML.Style(
-            KML.LineStyle(
-                KML.color("ffffff00"),
-                KML.width(8))), )
-        placemark.append(KML.name("Route"), )
-        placemark.append(KML.description("Route Taken"), )
-        placemark.append(KML.LineString(
-            KML.coordinates(
-                coord_string
-            )
-        ), )
-        doc.append(placemark)
-        placemark = KML.Placemark()
-    docs.append(doc)
-    outputFilename = "Output_KML/" + filename[:-3].split("/")[-1] + "kml"
-    outfile = open(outputFilename, "w")
-    outfile.write(etree.tostring(docs, pretty_print=True).decode())
-    outfile.close()
+    if stream:
+        return route_segments(iter_gps_data(track.file, drop_poor_fixes=True) if frames is None else frames)
+    GPSData = track.frame(drop_poor_fixes=True)
+    with stage("segmentation", len(GPSData)) as record:
+        segments = list(route_segments([GPSData]))
+        record["rows out"] = sum(len(longitudes) for longitudes, _ in segments)
+    return segments
 
 
-def get_gps_data(data):
+def route_parameters():
     """
-    Creates three dictionaries of GPS data using GPGGA, GPRMC, and listed coordinates.
-    See: http://aprs.gids.nl/nmea/
-    :param data: Name of a txt file where GPS data is retrieved.
-    :return: GPGGA, GPRMC, Coords dictionaries
+    :return: the settings route segments depend on, part of their cache key
     """
-    GPGGA = {"UTC position": [], "latitude": [], "longitude": [],
-             "GPS Fix": [], "# of Satellites": [], "Horizontal dilution of precision": [],
-             "antenna altitude": [], "geoidal separation": [], "age of GPS data": [],
-             "Differential reference station ID": []}
-    GPRMC = {"UTC position": [], "validity": [], "latitude": [], "longitude": [],
-             "speed over ground in knots": [], "track made good in degrees": [],
-             "UT date": [], "variation": [], "checksum": []}
-    with open(data) as gps_file:
-        for line in gps_file:
-            line_tokens = line.split(",")  # splits data by commas
-
-            if line_tokens[0] == "$GPGGA":  # if the first item in a line is GPGGA add it to that dictionary
-                if line_tokens[2] == "" or line_tokens[4] == "":
-                    continue
-                GPGGA["UTC position"].append(float(line_tokens[1]))
-                if line_tokens[3] == "S":
-                    GPGGA["latitude"].append(float(line_tokens[2]) * -1)
-                else:
-                    GPGGA["latitude"].append(float(line_tokens[2]))
-                if line_tokens[5] == "W":
-                    GPGGA["longitude"].append(float(line_tokens[4]) * -1)
-                else:
-                    GPGGA["longitude"].append(float(line_tokens[4]))
-                GPGGA["GPS Fix"].append(int(line_tokens[6]))
-                GPGGA["# of Satellites"].append(int(line_tokens[7]))
-                GPGGA["Horizontal dilution of precision"].append(float(line_tokens[8]))
-                GPGGA["antenna altitude"].append([line_tokens[9], line_tokens[10]])
-                try:
-                    GPGGA["geoidal separation"].append([line_tokens[11], line_tokens[12]])
-                except IndexError:
-                    GPGGA["geoidal separation"].append(None)
-                try:
-                    GPGGA["age of GPS data"].append(line_tokens[13])
-                except IndexError:
-                    GPGGA["age of GPS data"].append(None)
-                try:
-                    GPGGA["Differential reference station ID"].append(line_tokens[14].strip('\n'))
-                except IndexError:
-                    GPGGA["Differential reference station ID"].append(None)
-            elif line_tokens[0] == "$GPRMC":
-                if line_tokens[3] == "" or line_tokens[5] == "":
-                    continue
-                try:
-                    float(line_tokens[5])
-                except ValueError:
-                    continue
-                GPRMC["UTC position"].append(float(line_tokens[1]))
-                GPRMC["validity"].append(line_tokens[2])
-                if line_tokens[4] == "S":
-                    GPRMC["latitude"].append(float(line_tokens[3]) * -1)
-                else:
-                    GPRMC["latitude"].append(float(line_tokens[3]))
-                if line_tokens[6] == "W":
-                    GPRMC["longitude"].append(float(line_tokens[5]) * -1)
-                else:
-                    GPRMC["longitude"].append(float(line_tokens[5]))
-                GPRMC["speed over ground in knots"].append(float(line_tokens[7]))
-                GPRMC["track made good in degrees"].append(float(line_tokens[8]))
-                GPRMC["UT date"].append(line_tokens[9])
-                try:
-                    GPRMC["variation"].append([line_tokens[10], line_tokens[11]])
-                except IndexError:  # if this column is empty make it none for length consistency
-                    GPRMC["variation"].append(None)
-                try:
-                    GPRMC["checksum"].append(line_tokens[12].strip('\n'))
-                except IndexError:
-                    GPRMC["checksum"].append(None)
-    return GPGGA, GPRMC
+    return {"straight angle": STRAIGHT_ANGLE, "straight speed": STRAIGHT_SPEED, "gap": GAP, **track_parameters()}
 
 
-def format_gps_data(GPRMC_data, GPGGA_data):
+def route_segments(frames):
     """
-
-    :param GPRMC_data: Data in the GPRMC format.
-    :param GPGGA_data: Data in the GPGGA format.
-    :return: a dictionary with the following:
-        time: The UTC time the position was recorded.
-        Latitude: The latitude of the position.
-        Longitude: The longitude of the position.
-        Speed: The average speed between the previous position and the current one in MPH.
-        Angle: The angle between the previous position and the current one, 0 is due north.
-        Fix Quality: The quality of the gps positioning.
-        Satellites: The number of satellites used in getting the position
+    Splits the route into segments, skipping points where the car is going straight.
+    A new segment is started after a jump of more than 350 meters.
+    :param frames: iterable of DataFrames from gps_track or iter_gps_data, in order
+    :return: generator of the longitudes and latitudes of the points of each segment
     """
+    parts = []  # longitudes, latitudes of the current segment in each frame
+    previousCoord = (0, 0)  # longitude, latitude
+    straightAngle = 0
+    for GPSData in frames:
+        longitudes = GPSData["longitude"].values.astype(float)
+        latitudes = GPSData["latitude"].values.astype(float)
+        points, breaks, straightAngle = segment_route(longitudes, latitudes, GPSData["speed"].values.astype(float),
+                                                      GPSData["angle"].values.astype(float), previousCoord,
+                                                      straightAngle)
+        if len(longitudes):
+            previousCoord = (longitudes[-1], latitudes[-1])
+        segments = np.split(points, breaks)
+        parts.append((longitudes[segments[0]], latitudes[segments[0]]))
+        for segment in segments[1:]:
+            yield join_parts(parts)
+            parts = [(longitudes[segment], latitudes[segment])]
+    yield join_parts(parts)
+
+
+def join_parts(parts):
+    """
+    :param parts: list of longitudes, latitudes arrays
+    :return: the longitudes and latitudes of all the parts, one after the other
+    """
+    if not parts:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
 
-    GPSData = {"time": [], "latitude": [], "longitude": [], "speed": [], "angle": [], "satellites": []}
-
-    counterRMC = 0
-    counterGGA = 0
-    timeRMC = GPRMC_data["UTC position"][counterRMC]
-    timeGGA = GPGGA_data["UTC position"][counterGGA]
-
-    while timeRMC != 0 and timeGGA != 0:
-        if timeRMC == timeGGA:
-            GPSData["time"].append(timeRMC)
-            if GPRMC_data["latitude"][counterRMC] != "":
-                GPSData["latitude"].append(convert_coordinate(GPRMC_data["latitude"][counterRMC]))
-            else:
-                GPSData["latitude"].append(convert_coordinate(GPGGA_data["latitude"][counterGGA]))
-            if GPRMC_data["longitude"][counterRMC] != "":
-                GPSData["longitude"].append(convert_coordinate(GPRMC_data["longitude"][counterRMC]))
-            else:
-                GPSData["longitude"].append(convert_coordinate(GPGGA_data["longitude"][counterGGA]))
-            GPSData["speed"].append(GPRMC_data["speed over ground in knots"][counterRMC] * 1.1508)
-            GPSData["angle"].append(GPRMC_data["track made good in degrees"][counterRMC])
-            GPSData["satellites"].append(GPGGA_data["# of Satellites"][counterGGA])
-            counterRMC += 1
-            counterGGA += 1
-        elif timeRMC < timeGGA:
-            GPSData["time"].append(timeRMC)
-            GPSData["latitude"].append(convert_coordinate(GPRMC_data["latitude"][counterRMC]))
-            GPSData["longitude"].append(convert_coordinate(GPRMC_data["longitude"][counterRMC]))
-            GPSData["speed"].append(GPRMC_data["speed over ground in knots"][counterRMC] * 1.1508)
-            GPSData["angle"].append(GPRMC_data["track made good in degrees"][counterRMC])
-            GPSData["satellites"].append(GPGGA_data["# of Satellites"][counterGGA])
-            counterRMC += 1
-        elif timeGGA < timeRMC:
-            counterGGA += 1
-        if counterRMC >= len(GPRMC_data["UTC position"]) or counterGGA >= len(GPGGA_data["UTC position"]):
-            timeRMC = 0
-            timeGGA = 0
-        else:
-            timeRMC = GPRMC_data["UTC position"][counterRMC]
-            timeGGA = GPGGA_data["UTC position"][counterGGA]
-    num = 0
-    end = len(GPSData["satellites"])
 
-    while num < end:
-        if GPSData["satellites"][num] < 2 or GPSData["speed"][num] < 1:
-            GPSData["time"].pop(num)
-            GPSData["latitude"].pop(num)
-            GPSData["longitude"].pop(num)
-            GPSData["speed"].pop(num)
-            GPSData["angle"].pop(num)
-            GPSData["satellites"].pop(num)
-            end -= 1
+def segment_route(longitudes, latitudes, speeds, angles, previousCoord=(0, 0), straightAngle=0):
+    """
+    Finds the points of the route and where its segments start.
+    A point is skipped when the car is going straight, see going_straight, or when it is at
+    the same position as the previous point. A new segment starts instead of a point 350 m
+    to 100 km away from the previous point (GAP).
+    :param longitudes: array of longitudes
+    :param latitudes: array of latitudes
+    :param speeds: array of speeds in MPH
+    :param angles: array of directions, 0 is due north
+    :param previousCoord: longitude, latitude of the point before the first one
+    :param straightAngle: direction of the last point that was not going straight
+    :return: indexes of the points kept, positions in them where a new segment starts,
+        and the direction of the last point that was not going straight
+    """
+    previousLongitudes = np.concatenate(([previousCoord[0]], longitudes[:-1]))
+    previousLatitudes = np.concatenate(([previousCoord[1]], latitudes[:-1]))
+    dist = haversine(np.radians(longitudes), np.radians(latitudes),
+                     np.radians(previousLongitudes), np.radians(previousLatitudes))
+    # the sphere can be up to 1% off the ellipsoid, distances that close to a limit are measured again
+    uncertain = np.zeros(len(dist), dtype=bool)
+    for limit in GAP:
+        uncertain |= (limit * (1 - TOLERANCE) < dist) & (dist < limit * (1 + TOLERANCE))
+    count("geopy distance calls", np.count_nonzero(uncertain))
+    if uncertain.any():
+        from geopy import distance  # slow to import and rarely needed
+    for idx in np.flatnonzero(uncertain):
+        dist[idx] = distance.distance((latitudes[idx], longitudes[idx]),
+                                      (previousLatitudes[idx], previousLongitudes[idx])).m
+    moved = (longitudes != previousLongitudes) | (latitudes != previousLatitudes)
+    jumped = (GAP[0] < dist) & (dist < GAP[1])
+
+    goingStraight, straightAngle = going_straight(angles, speeds, straightAngle)
+    points = np.flatnonzero(~goingStraight & ~jumped & moved)
+    breaks = np.searchsorted(points, np.flatnonzero(~goingStraight & jumped))
+    return points, breaks, straightAngle
+
+
+def going_straight(angles, speeds, straightAngle=0):
+    """
+    Finds the points where the car is going straight: faster than STRAIGHT_SPEED and within
+    STRAIGHT_ANGLE degrees of the direction of the last point that was not going straight.
+    Each point depends on the one before, so this is one pass over plain lists of floats.
+    :param angles: array of directions, 0 is due north
+    :param speeds: array of speeds in MPH
+    :param straightAngle: direction of the last point that was not going straight
+    :return: boolean array, and the direction of the last point that was not going straight
+    """
+    goingStraight = []
+    for direction, speed in zip(angles.tolist(), speeds.tolist()):
+        if abs(direction - straightAngle) < STRAIGHT_ANGLE and speed > STRAIGHT_SPEED:
+            goingStraight.append(True)
         else:
-            num += 1
-
-    # convert data into a pandas dataframe
-    pd.set_option('display.max_columns', 20)
-    GPSData_df = pd.DataFrame(GPSData)
-    GPSData_df.dropna(inplace=True)  # get rid of NaNs
-    GPSData_df.drop_duplicates(subset=["time"], keep="first", inplace=True)
+            goingStraight.append(False)
+            straightAngle = direction
+    return np.array(goingStraight, dtype=bool), straightAngle
 
-    return GPSData_df
 
-
-def convert_time(utc_time):
+def coordinate_string(longitudes, latitudes):
     """
-    converts a UTC position from hours, minutes, seconds into just seconds.
-    easier to do math with time in one unit.
-    returns time in seconds.
+    :return: a string of comma-separated coordinates, one line per point
     """
-    hours = int(utc_time / 10000)
-    minutes_seconds = utc_time % 10000
-    minutes = int(minutes_seconds / 100)
-    seconds = minutes_seconds % 100
-    return hours * 3600 + minutes * 60 + seconds
+    return "".join([f"{longitude},{latitude},0.0\n"
+                    for longitude, latitude in zip(longitudes.tolist(), latitudes.tolist())])
 
 
-def convert_coordinate(coordinate):
+def to_kml(segments, filename, kmz=KMZ_OUTPUT):
+    """
+    Creates a KML file of the route, simplified to SIMPLIFY_TOLERANCE or as LEVELS_OF_DETAIL.
+    Placemarks are written as segments arrive, so segments can be a generator.
+    :param segments: iterable of the longitudes and latitudes of each segment, see route_segments
+    :param filename: name of the txt file being converted
+    :param kmz: write a compressed .kmz instead of a .kml
+    """
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    outputFilename = (OUTPUT_DIRECTORY + os.path.splitext(os.path.basename(uncompressed_name(filename)))[0]
+                      + (".kmz" if kmz else ".kml"))
+    with kml_file(outputFilename, [ROUTE_STYLE], kmz) as doc:
+        for longitudes, latitudes in segments:
+            count("route points", len(longitudes))
+            if not LEVELS_OF_DETAIL or len(longitudes) == 0:
+                keep = simplify(longitudes, latitudes, SIMPLIFY_TOLERANCE, SIMPLIFY_METHOD)
+                count("route points drawn", np.count_nonzero(keep))
+                doc.append(route_placemark(longitudes[keep], latitudes[keep]))
+                continue
+            for level, (tolerance, minPixels) in enumerate(LEVELS_OF_DETAIL):
+                maxPixels = LEVELS_OF_DETAIL[level + 1][1] if level + 1 < len(LEVELS_OF_DETAIL) else -1
+                keep = simplify(longitudes, latitudes, tolerance, SIMPLIFY_METHOD)
+                doc.append(KML.Folder(
+                    KML.Region(
+                        KML.LatLonAltBox(
+                            KML.north(latitudes.max()),
+                            KML.south(latitudes.min()),
+                            KML.east(longitudes.max()),
+                            KML.west(longitudes.min())
+                        ),
+                        KML.Lod(
+                            KML.minLodPixels(minPixels),
+                            KML.maxLodPixels(maxPixels)
+                        )
+                    ),
+                    route_placemark(longitudes[keep], latitudes[keep])
+                ))
+
+
+def route_placemark(longitudes, latitudes):
     """
-    converts latitude or longitude from degrees + minutes to just degrees
-    returns coordinate in degrees
+    :return: a KML.Placemark drawing a segment of the route
     """
-    sign = 1
-    if int(coordinate) < 0:
-        sign = -1
-    degrees = int(abs(coordinate) / 100)
-    minutes = float(abs(coordinate)) % 100
-    return sign * (degrees + (minutes / 60))
+    return KML.Placemark(
+        style_url("route"),
+        KML.name("Route"),
+        KML.description("Route Taken"),
+        KML.LineString(
+            KML.coordinates(
+                coordinate_string(longitudes, latitudes)
+            )
+        )
+    )
 
 
 if __name__ == '__main__':
-    if not os.path.exists('Output_KML/'):
-        os.makedirs('Output_KML/')
-    if GPS_DATA_FILENAME == "":
-        directory = "FILES_TO_WORK/"
-        costmap = []
-        for fileName in os.listdir(directory):
-            costmap.append(main(directory+fileName))
-    else:
-        main(GPS_DATA_FILENAME)
+    # the route command of gps_cli, i.e python GPS_to_KML.py FILES_TO_WORK/ --workers 4
+    from gps_cli import main as cli
+    sys.exit(cli(["route"] + sys.argv[1:]))
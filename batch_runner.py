@@ -0,0 +1,54 @@
+"""
+Runs one of the scripts' main functions over every file of a directory in parallel.
+
+Files are sent to a pool of worker processes and the results are returned in the order of
+the sorted file names, whatever order the workers finish in, so the combined output of a
+batch is the same from run to run. A file that fails is reported and skipped.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def list_files(directory):
+    """
+    :param directory: the directory, ending with /
+    :return: the files in the directory, sorted by name
+    """
+    return [directory + fileName for fileName in sorted(os.listdir(directory))
+            if os.path.isfile(directory + fileName)]
+
+
+def run_batch(function, files, workers=None):
+    """
+    Calls function on every file, using a pool of processes.
+    :param function: a module level function taking a file name, so it can be sent to the workers
+    :param files: list of file names
+    :param workers: number of processes, None uses every core and 1 runs in this process
+    :return: list of (file, result) for the files that did not fail, in the order of files
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        outcomes = [_call(function, file) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            futures = [executor.submit(_call, function, file) for file in files]
+            outcomes = [future.result() for future in futures]
+
+    results = []
+    for file, (result, error) in zip(files, outcomes):
+        if error is None:
+            results.append((file, result))
+        else:
+            print(f"Skipping {file}: {error}", file=sys.stderr)
+    return results
+
+
+def _call(function, file):
+    """
+    :return: the result of function(file) and None, or None and the error it raised
+    """
+    try:
+        return function(file), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
@@ -0,0 +1,252 @@
+"""
+Benchmarks of the stages of GPS_to_KML and GPS_to_CostMap on synthetic logs, and of both
+from one parse as the batch command of gps_cli runs them.
+
+Logs of each size in SIZES (number of sentences) are made once with nmea_generator and
+kept in BENCHMARK_DIRECTORY. Every stage is run on the output of the stage before it, once
+with tracemalloc to get its peak memory, then REPEATS times to keep the fastest time. The
+results are compared with the saved baseline, if there is one, and a stage more than
+REGRESSION_TOLERANCE and NOISE_SECONDS slower than its baseline is reported as a regression.
+
+The parser is also timed against line_loop, the loop over lines the scripts parsed logs
+with before nmea_parser, on the logs of up to LINE_LOOP_SENTENCES sentences, and the
+speedup is printed for all columns and for the FIX_COLUMNS the scripts decode.
+
+    python benchmark.py                    run SIZES and compare with the baseline
+    python benchmark.py 10000 1000000      run these sizes only
+    python benchmark.py --save             also save the results as the new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+from nmea_generator import generate_nmea
+from nmea_parser import read_nmea, FIX_COLUMNS
+from gps_track import format_gps_data
+import GPS_to_KML
+import GPS_to_CostMap
+from gps_cli import route_and_hazards_file
+from spatial_dedup import remove_nearby_points
+
+SIZES = [10000, 1000000, 10000000]  # sentences in each benchmarked log
+REPEATS = 3  # timed runs of each stage, the fastest is kept
+BENCHMARK_DIRECTORY = "Benchmarks/"
+BASELINE_FILE = BENCHMARK_DIRECTORY + "baseline.json"
+REGRESSION_TOLERANCE = 0.25  # fraction slower than the baseline reported as a regression
+NOISE_SECONDS = 0.01  # differences smaller than this are timer noise, never a regression
+LINE_LOOP_SENTENCES = 1000000  # largest log the line loop is timed on, it takes about a minute per 10M sentences
+# the synthetic drive: 10 Hz, sentences in random order, some lost positions and a tunnel every 10 minutes
+GENERATOR_SETTINGS = {"rate": 10.0, "order": "random", "dropout": 0.01, "outage_every": 600.0,
+                      "outage_length": 15.0, "seed": 0}
+
+
+def main(sizes=SIZES, repeats=REPEATS, save=False):
+    """
+    Runs the benchmarks, prints them next to the baseline and optionally saves them as the new baseline.
+    :return: dictionary of results by "stage @ sentences"
+    """
+    os.makedirs(BENCHMARK_DIRECTORY, exist_ok=True)
+    baseline = load_baseline()
+    results = {}
+    for sentences in sizes:
+        log = benchmark_log(sentences)
+        for stage, seconds, peak in run_stages(log, repeats):
+            name = f"{stage} @ {sentences}"
+            results[name] = {"seconds": seconds, "sentences per second": sentences / seconds,
+                             "peak MB": peak / 2 ** 20}
+            print(report_line(name, results[name], baseline.get("results", {}).get(name)), flush=True)
+        if f"line loop @ {sentences}" in results:
+            loop_seconds = results[f"line loop @ {sentences}"]["seconds"]
+            print(f"parser speedup over the line loop @ {sentences}: "
+                  f"{loop_seconds / results[f'parse @ {sentences}']['seconds']:.1f}x all columns, "
+                  f"{loop_seconds / results[f'parse fix columns @ {sentences}']['seconds']:.1f}x fix columns")
+    if save:
+        with open(BASELINE_FILE, "w") as outfile:
+            json.dump({"machine": machine(), "results": {**baseline.get("results", {}), **results}}, outfile, indent=1)
+        print(f"Saved baseline to {BASELINE_FILE}")
+    return results
+
+
+def benchmark_log(sentences):
+    """
+    :return: name of the synthetic log with this many sentences, generated if it does not exist yet
+    """
+    log = os.path.abspath(os.path.join(BENCHMARK_DIRECTORY, f"synthetic_{sentences}.txt"))
+    if not os.path.exists(log):
+        temporary = log + ".tmp"
+        generate_nmea(temporary, sentences=sentences, **GENERATOR_SETTINGS)
+        os.replace(temporary, log)
+    return log
+
+
+def run_stages(log, repeats):
+    """
+    Runs each stage on the output of the one before.
+    :return: generator of the stage name, fastest time in seconds and peak traced memory in bytes
+    """
+    GPGGA, GPRMC = yield from _stage("parse", repeats, read_nmea, log)
+    yield from _stage("parse fix columns", repeats, read_nmea, log, columns=FIX_COLUMNS)
+    if _sentences(log) <= LINE_LOOP_SENTENCES:
+        yield from _stage("line loop", repeats, line_loop, log)
+    GPSData = yield from _stage("merge", repeats, format_gps_data, GPRMC, GPGGA)
+    hazards = yield from _stage("turn detection", repeats, detect_hazards, GPSData)
+    yield from _stage("dedup", repeats, dedup_hazards, hazards)
+    routeData = format_gps_data(GPRMC, GPGGA, drop_poor_fixes=True)
+    segments = yield from _stage("segmentation", repeats, lambda: list(GPS_to_KML.route_segments([routeData])))
+    with _output_directory():
+        yield from _stage("kml write", repeats, GPS_to_KML.to_kml, segments, log)
+        yield from _stage("GPS_to_KML.main", repeats, GPS_to_KML.main, log, cache=False)
+        yield from _stage("GPS_to_CostMap.main", repeats, GPS_to_CostMap.main, log, cache=False)
+        yield from _stage("route and hazards", repeats, route_and_hazards_file, {}, False, False, False, log)
+
+
+def line_loop(data):
+    """
+    Parses a log one line at a time, as the scripts did before nmea_parser, the reference
+    the parser is measured against.
+    :return: GPGGA, GPRMC dictionaries of lists
+    """
+    GPGGA = {"UTC position": [], "latitude": [], "longitude": [],
+             "GPS Fix": [], "# of Satellites": [], "Horizontal dilution of precision": [],
+             "antenna altitude": [], "geoidal separation": [], "age of GPS data": [],
+             "Differential reference station ID": []}
+    GPRMC = {"UTC position": [], "validity": [], "latitude": [], "longitude": [],
+             "speed over ground in knots": [], "track made good in degrees": [],
+             "UT date": [], "variation": [], "checksum": []}
+    with open(data) as gps_file:
+        for line in gps_file:
+            line_tokens = line.split(",")
+            if line_tokens[0] == "$GPGGA":
+                if line_tokens[2] == "" or line_tokens[4] == "":
+                    continue
+                GPGGA["UTC position"].append(float(line_tokens[1]))
+                GPGGA["latitude"].append(float(line_tokens[2]) * (-1 if line_tokens[3] == "S" else 1))
+                GPGGA["longitude"].append(float(line_tokens[4]) * (-1 if line_tokens[5] == "W" else 1))
+                GPGGA["GPS Fix"].append(int(line_tokens[6]))
+                GPGGA["# of Satellites"].append(int(line_tokens[7]))
+                GPGGA["Horizontal dilution of precision"].append(float(line_tokens[8]))
+                GPGGA["antenna altitude"].append([line_tokens[9], line_tokens[10]])
+                GPGGA["geoidal separation"].append(line_tokens[11:13] if len(line_tokens) > 12 else None)
+                GPGGA["age of GPS data"].append(line_tokens[13] if len(line_tokens) > 13 else None)
+                GPGGA["Differential reference station ID"].append(
+                    line_tokens[14].strip("\n") if len(line_tokens) > 14 else None)
+            elif line_tokens[0] == "$GPRMC":
+                if line_tokens[3] == "" or line_tokens[5] == "":
+                    continue
+                try:
+                    float(line_tokens[5])
+                except ValueError:
+                    continue
+                GPRMC["UTC position"].append(float(line_tokens[1]))
+                GPRMC["validity"].append(line_tokens[2])
+                GPRMC["latitude"].append(float(line_tokens[3]) * (-1 if line_tokens[4] == "S" else 1))
+                GPRMC["longitude"].append(float(line_tokens[5]) * (-1 if line_tokens[6] == "W" else 1))
+                GPRMC["speed over ground in knots"].append(float(line_tokens[7]))
+                GPRMC["track made good in degrees"].append(float(line_tokens[8]))
+                GPRMC["UT date"].append(line_tokens[9])
+                GPRMC["variation"].append(line_tokens[10:12] if len(line_tokens) > 11 else None)
+                GPRMC["checksum"].append(line_tokens[12].strip("\n") if len(line_tokens) > 12 else None)
+    return GPGGA, GPRMC
+
+
+def detect_hazards(GPSData):
+    """
+    :return: the stops, left turns and right turns of a track before near ones are removed
+    """
+    return GPS_to_CostMap.find_hazards({name: GPSData[name].values for name in GPS_to_CostMap.HAZARD_COLUMNS})
+
+
+def dedup_hazards(hazards):
+    """
+    :return: the hazards without the ones near an earlier one, as GPS_to_CostMap keeps them
+    """
+    stops, left_turns, right_turns = hazards
+    return (remove_nearby_points(stops, GPS_to_CostMap.STOP_RADIUS),
+            remove_nearby_points(left_turns, GPS_to_CostMap.TURN_RADIUS),
+            remove_nearby_points(right_turns, GPS_to_CostMap.TURN_RADIUS))
+
+
+def _stage(name, repeats, function, *args, **kwargs):
+    """
+    Runs a stage, yields its measurements and returns its result.
+    """
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    yield name, min(seconds) if seconds else float("nan"), peak
+    return result
+
+
+def _sentences(log):
+    """
+    :return: the number of sentences of a benchmark log, from its name
+    """
+    return int(os.path.basename(log)[len("synthetic_"):-len(".txt")])
+
+
+@contextmanager
+def _output_directory():
+    """
+    Runs the KML writing stages in a temporary directory, so their output is thrown away.
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "Output_KML"))
+        os.makedirs(os.path.join(directory, "Output_CostMap"))
+        os.chdir(directory)
+        try:
+            yield
+        finally:
+            os.chdir(previous)
+
+
+def load_baseline():
+    """
+    :return: the saved baseline, empty if there is none
+    """
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as infile:
+        return json.load(infile)
+
+
+def report_line(name, result, baseline):
+    """
+    :return: a line of the report, comparing result with its baseline if there is one
+    """
+    line = (f"{name:<32} {result['seconds']:9.3f} s {result['sentences per second']:13,.0f} sentences/s "
+            f"{result['peak MB']:9.1f} MB")
+    if baseline:
+        ratio = result["seconds"] / baseline["seconds"]
+        line += f"   {ratio:5.2f}x baseline"
+        if ratio > 1 + REGRESSION_TOLERANCE and result["seconds"] - baseline["seconds"] > NOISE_SECONDS:
+            line += "   REGRESSION"
+    return line
+
+
+def machine():
+    """
+    :return: description of the machine and versions the benchmarks ran with
+    """
+    return {"python": platform.python_version(), "numpy": np.__version__, "processor": platform.processor(),
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the stages of both scripts on synthetic logs.")
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES, help="numbers of sentences to benchmark")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed runs of each stage")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    arguments = parser.parse_args()
+    main(arguments.sizes, arguments.repeats, arguments.save)
@@ -0,0 +1,98 @@
+"""
+Vectorized unit conversions for whole columns of NMEA values.
+
+Each function gives, for every element, the same result as the scalar helpers the scripts
+used, convert_coordinate and convert_time at the end of this module, but takes NumPy
+arrays so a whole log is converted with a few array operations.
+"""
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+# speed over ground is given in knots, multiply by these to get other units
+SPEED_UNITS = {"knots": 1.0, "mph": 1.1508, "km/h": 1.852, "m/s": 1852 / 3600}
+# unit of the speed column of merged tracks, the speed limits of both scripts are in MPH
+SPEED_UNIT = "mph"
+
+
+def degrees(coordinates):
+    """
+    converts an array of latitudes or longitudes from degrees + minutes to just degrees,
+    like convert_coordinate, NaN stays NaN
+    """
+    magnitude = np.abs(coordinates)
+    whole_degrees = np.floor(magnitude / 100)
+    minutes = magnitude % 100
+    return np.where(np.trunc(coordinates) < 0, -1, 1) * (whole_degrees + (minutes / 60))
+
+
+def utc_seconds(utc_times):
+    """
+    converts UTC positions from hours, minutes, seconds into just seconds of the day,
+    like convert_time
+    """
+    hours = np.trunc(utc_times / 10000)
+    minutes_seconds = utc_times % 10000
+    minutes = np.trunc(minutes_seconds / 100)
+    seconds = minutes_seconds % 100
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def convert_speed(knots, unit=SPEED_UNIT):
+    """
+    converts speeds over ground from knots
+    :param knots: array of speeds in knots
+    :param unit: one of SPEED_UNITS
+    :return: array of speeds in unit
+    """
+    if unit not in SPEED_UNITS:
+        raise ValueError(f"unknown speed unit {unit}, expected one of {', '.join(SPEED_UNITS)}")
+    return knots * SPEED_UNITS[unit]
+
+
+def date_days(dates):
+    """
+    converts GPRMC dates, ddmmyy, to days since 1970
+    :param dates: bytes array of dates
+    :return: array of days, NaN where the date is missing or invalid
+    """
+    dates = np.asarray(dates, dtype="S")
+    digits = np.frombuffer(dates.astype("S6").tobytes(), dtype=np.uint8).reshape(-1, 6).astype(np.int64) - ord("0")
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 2] * 10 + digits[:, 3]
+    year = digits[:, 4] * 10 + digits[:, 5]
+    year += np.where(year < 80, 2000, 1900)  # two digit years, GPS started in 1980
+    valid = ((np.char.str_len(dates) == 6) & np.all((digits >= 0) & (digits <= 9), axis=1)
+             & (1 <= month) & (month <= 12) & (1 <= day) & (day <= 31))
+    # days from the civil calendar, see http://howardhinnant.github.io/date_algorithms.html
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return np.where(valid, era * 146097 + day_of_era - 719468, np.nan)
+
+
+def convert_time(utc_time):
+    """
+    converts a UTC position from hours, minutes, seconds into just seconds.
+    easier to do math with time in one unit.
+    returns time in seconds.
+    """
+    hours = int(utc_time / 10000)
+    minutes_seconds = utc_time % 10000
+    minutes = int(minutes_seconds / 100)
+    seconds = minutes_seconds % 100
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def convert_coordinate(coordinate):
+    """
+    converts latitude or longitude from degrees + minutes to just degrees
+    returns coordinate in degrees
+    """
+    sign = 1
+    if int(coordinate) < 0:  # i.e if negative, conserve the sign so it doesn't mess up the calculation
+        sign = -1
+    whole_degrees = int(abs(coordinate) / 100)
+    minutes = float(abs(coordinate)) % 100
+    return sign * (whole_degrees + (minutes / 60))
@@ -0,0 +1,279 @@
+"""
+Cost map of the hazards of many drives, counted per cell of a fixed grid.
+
+Rows of the grid are CELL_SIZE meters of latitude and each row is cut into cells CELL_SIZE
+meters wide at its middle latitude, so a cell is the same everywhere whatever drives were
+added before. A cell is identified by a single integer key, and the map keeps the sorted
+keys of the cells with hazards next to an array of their stop, left turn and right turn
+counts, so adding a drive or looking up a region is a few array operations however many
+hazards have been accumulated.
+
+The map is saved as a .npz file and can be updated as new logs arrive; each drive is
+recorded by the hash of its log and of the settings its hazards were found with, along
+with the cells of its hazards, so adding the same log again does nothing and adding it
+with new settings replaces its hazards. It is exported as KML, one square placemark per
+cell colored by its cost, or as a GeoJSON grid.
+"""
+import json
+import os
+import numpy as np
+from pykml.factory import KML_ElementMaker as KML
+from spatial_dedup import EARTH_RADIUS
+from kml_writer import kml_file, shared_style, style_url
+
+CELL_SIZE = 25  # width of a cell in meters
+HAZARDS = ["stop", "left turn", "right turn"]
+HAZARD_WEIGHTS = np.array([1.0, 1.5, 1.0])  # cost of each of HAZARDS, turning left crosses traffic
+COLUMN_SPAN = 1 << 32  # a key is row * COLUMN_SPAN + column
+INTENSITY_COLORS = ["7f00ff00", "7f00ffaa", "7f00ffff", "7f00aaff", "7f0000ff"]  # aabbggrr, low to high cost
+
+
+class CostMap:
+    """
+    Hazard counts per grid cell, see the module docstring.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros((0, len(HAZARDS)), dtype=np.int64)
+        self.drives = []
+        self.drive_parameters = []  # parameters_hash of the settings of each drive, None if unknown
+        # cell key, kind and index in drives of the hazards of every drive, to take them out again
+        self.hazards = {"key": np.zeros(0, dtype=np.int64), "kind": np.zeros(0, dtype=np.int8),
+                        "drive": np.zeros(0, dtype=np.int32)}
+
+    def add_drive(self, drive, stops, left_turns, right_turns, parameters=None):
+        """
+        Adds the hazards of a drive. A drive added again with other parameters has its
+        hazards replaced, otherwise nothing changes.
+        :param drive: name of the drive, i.e the file_hash of its log
+        :param stops: list of [longitude, latitude]
+        :param left_turns: list of [longitude, latitude]
+        :param right_turns: list of [longitude, latitude]
+        :param parameters: the settings the hazards were found with, see result_cache.parameters_hash
+        :return: whether the map changed
+        """
+        if drive in self.drives:
+            index = self.drives.index(drive)
+            # drives saved before their settings were recorded keep their hazards
+            if parameters is None or self.drive_parameters[index] in (parameters, None):
+                return False
+            self.drive_parameters[index] = parameters
+            replaced = self.hazards["drive"] == index
+            self._count(self.hazards["key"][replaced], self.hazards["kind"][replaced], -1)
+            self.hazards = {name: column[~replaced] for name, column in self.hazards.items()}
+        else:
+            index = len(self.drives)
+            self.drives.append(drive)
+            self.drive_parameters.append(parameters)
+        keys, kinds = self._cell_kinds(stops, left_turns, right_turns)
+        self._count(keys, kinds, 1)
+        self.hazards = {name: np.concatenate((self.hazards[name], column.astype(self.hazards[name].dtype)))
+                        for name, column in (("key", keys), ("kind", kinds),
+                                             ("drive", np.full(len(keys), index)))}
+        return True
+
+    def add_points(self, stops, left_turns, right_turns):
+        """
+        Adds hazards to the counts of their cells, without recording them as a drive.
+        :param stops: list of [longitude, latitude]
+        :param left_turns: list of [longitude, latitude]
+        :param right_turns: list of [longitude, latitude]
+        """
+        self._count(*self._cell_kinds(stops, left_turns, right_turns), 1)
+
+    def _cell_kinds(self, stops, left_turns, right_turns):
+        """
+        :return: arrays of the cell key and the index in HAZARDS of every hazard
+        """
+        keys, kinds = [], []
+        for kind, points in enumerate((stops, left_turns, right_turns)):
+            coordinates = np.array(points, dtype=float).reshape(-1, 2)
+            keys.append(self.cell_keys(coordinates[:, 0], coordinates[:, 1]))
+            kinds.append(np.full(len(coordinates), kind))
+        return np.concatenate(keys), np.concatenate(kinds)
+
+    def _count(self, keys, kinds, step):
+        """
+        Adds step to the counts of the cells of hazards, dropping the cells left without any.
+        :param keys: array of the cell key of every hazard
+        :param kinds: array of the index in HAZARDS of every hazard
+        :param step: 1 to add the hazards, -1 to take them out
+        """
+        new_keys, inverse = np.unique(keys, return_inverse=True)
+        new_counts = np.zeros((len(new_keys), len(HAZARDS)), dtype=np.int64)
+        np.add.at(new_counts, (inverse.reshape(-1), kinds), step)
+        # cells already in the map are added to, the others inserted where they keep the keys sorted
+        positions = np.searchsorted(self.keys, new_keys)
+        found = self.keys[np.minimum(positions, len(self.keys) - 1)] == new_keys if len(self.keys) else \
+            np.zeros(len(new_keys), dtype=bool)
+        self.counts[positions[found]] += new_counts[found]
+        self.keys = np.insert(self.keys, positions[~found], new_keys[~found])
+        self.counts = np.insert(self.counts, positions[~found], new_counts[~found], axis=0)
+        if step < 0:
+            empty = ~self.counts.any(axis=1)
+            self.keys, self.counts = self.keys[~empty], self.counts[~empty]
+
+    def cell_keys(self, longitudes, latitudes):
+        """
+        :param longitudes: array of longitudes in degrees
+        :param latitudes: array of latitudes in degrees
+        :return: array of the keys of the cells holding the points
+        """
+        rows = np.floor(np.radians(latitudes) / self._cell_angle()).astype(np.int64)
+        columns = np.floor(np.radians(longitudes) / self._cell_widths(rows)).astype(np.int64)
+        return rows * COLUMN_SPAN + columns
+
+    def cell_counts(self, longitude, latitude):
+        """
+        :return: the stop, left turn and right turn counts of the cell holding a point
+        """
+        key = self.cell_keys(np.array([longitude]), np.array([latitude]))[0]
+        index = np.searchsorted(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.counts[index].tolist()
+        return [0] * len(HAZARDS)
+
+    def cells_in(self, west, south, east, north):
+        """
+        Finds the cells overlapping a box given in degrees, not crossing the antimeridian.
+        :return: their keys and counts
+        """
+        first_row, last_row = np.floor(np.radians([south, north]) / self._cell_angle()).astype(np.int64)
+        # keys are sorted by row, then column
+        begin, end = np.searchsorted(self.keys, [first_row * COLUMN_SPAN - COLUMN_SPAN // 2,
+                                                 (last_row + 1) * COLUMN_SPAN - COLUMN_SPAN // 2])
+        keys, counts = self.keys[begin:end], self.counts[begin:end]
+        rows, columns = self.rows_columns(keys)
+        widths = self._cell_widths(rows)
+        inside = ((columns >= np.floor(np.radians(west) / widths))
+                  & (columns <= np.floor(np.radians(east) / widths)))
+        return keys[inside], counts[inside]
+
+    def costs(self, counts=None):
+        """
+        :return: the weighted sum of the hazard counts of every cell, or of the given counts
+        """
+        return (self.counts if counts is None else counts) @ HAZARD_WEIGHTS
+
+    def rows_columns(self, keys):
+        """
+        :return: the grid rows and columns of cell keys
+        """
+        rows = np.floor_divide(keys + COLUMN_SPAN // 2, COLUMN_SPAN)
+        return rows, keys - rows * COLUMN_SPAN
+
+    def cell_bounds(self, keys):
+        """
+        :return: west, south, east and north edges in degrees of cells
+        """
+        rows, columns = self.rows_columns(keys)
+        widths = self._cell_widths(rows)
+        return (np.degrees(columns * widths), np.degrees(rows * self._cell_angle()),
+                np.degrees((columns + 1) * widths), np.degrees((rows + 1) * self._cell_angle()))
+
+    def save(self, filename):
+        """
+        Writes the map to a .npz file, replacing it only once complete.
+        """
+        temporary = f"{filename}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, cell_size=self.cell_size, keys=self.keys, counts=self.counts,
+                 drives=np.array(self.drives, dtype=str),
+                 drive_parameters=np.array([parameters or "" for parameters in self.drive_parameters], dtype=str),
+                 **{f"hazard_{name}": column for name, column in self.hazards.items()})
+        os.replace(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        :return: the map saved in a .npz file, or an empty map if there is no such file
+        """
+        if not os.path.exists(filename):
+            return cls()
+        with np.load(filename) as saved:
+            cost_map = cls(float(saved["cell_size"]))
+            cost_map.keys = saved["keys"]
+            cost_map.counts = saved["counts"]
+            cost_map.drives = saved["drives"].tolist()
+            if "drive_parameters" in saved.files:
+                cost_map.drive_parameters = [parameters or None for parameters in saved["drive_parameters"].tolist()]
+                cost_map.hazards = {name: saved[f"hazard_{name}"] for name in cost_map.hazards}
+            else:  # saved before drives were replaceable, their hazards are not known
+                cost_map.drive_parameters = [None] * len(cost_map.drives)
+        return cost_map
+
+    def _cell_angle(self):
+        """
+        :return: height of a row in radians of latitude
+        """
+        return self.cell_size / EARTH_RADIUS
+
+    def _cell_widths(self, rows):
+        """
+        :return: width in radians of longitude of the cells of rows
+        """
+        middles = (rows + 0.5) * self._cell_angle()
+        return self._cell_angle() / np.maximum(np.cos(middles), 1e-9)
+
+
+def intensity_levels(costs):
+    """
+    :return: index in INTENSITY_COLORS of each cost, on a log scale up to the highest cost
+    """
+    if len(costs) == 0:
+        return np.zeros(0, dtype=np.int64)
+    scaled = np.log1p(costs) / np.log1p(costs.max())
+    return np.minimum((scaled * len(INTENSITY_COLORS)).astype(np.int64), len(INTENSITY_COLORS) - 1)
+
+
+def write_kml(cost_map, filename, kmz=False):
+    """
+    Writes one square placemark per cell, colored by its cost.
+    :param cost_map: the CostMap
+    :param filename: name of the KML file
+    :param kmz: write a KMZ, see kml_writer.kml_file
+    """
+    styles = [shared_style(f"cost{level}", KML.LineStyle(KML.width(0)), KML.PolyStyle(KML.color(color)))
+              for level, color in enumerate(INTENSITY_COLORS)]
+    costs = cost_map.costs()
+    levels = intensity_levels(costs)
+    with kml_file(filename, styles, kmz) as doc:
+        for key, counts, cost, level, bounds in _cells(cost_map, costs, levels):
+            west, south, east, north = bounds
+            ring = " ".join(f"{longitude},{latitude}" for longitude, latitude in
+                            ((west, south), (east, south), (east, north), (west, north), (west, south)))
+            doc.append(KML.Placemark(
+                KML.name(f"{cost:g}"),
+                KML.description(", ".join(f"{hazard}s: {count}" for hazard, count in zip(HAZARDS, counts))),
+                style_url(f"cost{level}"),
+                KML.Polygon(KML.outerBoundaryIs(KML.LinearRing(KML.coordinates(ring))))))
+
+
+def write_geojson(cost_map, filename):
+    """
+    Writes the cells as a GeoJSON FeatureCollection of polygons with their counts and cost.
+    :param cost_map: the CostMap
+    :param filename: name of the GeoJSON file
+    """
+    costs = cost_map.costs()
+    with open(filename, "w") as outfile:
+        outfile.write('{"type": "FeatureCollection", "features": [')
+        for index, (key, counts, cost, level, bounds) in enumerate(_cells(cost_map, costs, intensity_levels(costs))):
+            west, south, east, north = bounds
+            feature = {"type": "Feature",
+                       "geometry": {"type": "Polygon", "coordinates": [[[west, south], [east, south], [east, north],
+                                                                        [west, north], [west, south]]]},
+                       "properties": {"cell": key, **dict(zip(HAZARDS, counts)), "cost": cost, "intensity": level}}
+            outfile.write(("\n" if index == 0 else ",\n") + json.dumps(feature))
+        outfile.write("\n]}\n")
+
+
+def _cells(cost_map, costs, levels):
+    """
+    :return: generator of the key, counts, cost, intensity level and bounds of every cell
+    """
+    bounds = np.stack(cost_map.cell_bounds(cost_map.keys), axis=1)
+    for key, counts, cost, level, cell_bounds in zip(cost_map.keys.tolist(), cost_map.counts.tolist(),
+                                                     costs.tolist(), levels.tolist(), bounds.tolist()):
+        yield key, counts, cost, level, cell_bounds
@@ -0,0 +1,572 @@
+"""
+Command line interface of GPS_to_KML, GPS_to_CostMap and the track files.
+
+    python gps_cli.py route FILES_TO_WORK/ -o Output_KML/ --workers 4
+    python gps_cli.py hazards "logs/2026-*.txt.gz" --turn-radius 10 --combined Fleet
+    python gps_cli.py batch FILES_TO_WORK/ --cost-map --hazard-store
+    python gps_cli.py convert logs/drive.txt -o Tracks/
+    python gps_cli.py query --bbox -83.76 42.27 -83.72 42.29 -o Ann_Arbor.kml
+    python gps_cli.py archive "logs/truck7/*.txt" --vehicle truck7
+    python gps_cli.py reanalyze --vehicles truck7 --start 2026-03-01 --end 2026-04-01 --turn-angle 40
+
+Inputs are files, directories (every file in them) or glob patterns, the INPUT_DIRECTORY
+of the script when none is given. Options override the module level settings of the
+scripts for this run, in this process and in each worker, and the route, hazards and batch
+commands take the inputs, output directories, streaming, workers, caching, KMZ output and
+whether to update the cost map and the hazard store not given from those settings. The
+scripts and their dependencies (pandas, pykml, geopy) are only imported by the command that
+needs them, so --help and small files start quickly when called in a loop. The exit status
+is 1 when a file could not be processed.
+The batch command parses each log once for both its route and its hazards, see gps_track.
+The query command reads the hazard store the hazards and batch commands add to, see
+hazard_store, and takes no input files. The archive command adds logs to the Parquet
+archive of tracks, and the reanalyze command finds the stops and turns of the archived
+drives again with the settings given, see track_archive; both need pyarrow.
+"""
+import argparse
+import datetime
+import glob
+import importlib
+import os
+import sys
+import time
+from functools import partial
+
+COMMANDS = ["route", "hazards", "batch", "convert", "query", "archive", "reanalyze"]
+TRACK_EXTENSION = ".track"
+DEFAULT_INPUTS = ["FILES_TO_WORK/"]  # of the convert and archive commands
+DEFAULT_TRACK_DIRECTORY = "Tracks/"
+# Scripts whose INPUT_DIRECTORY, OUTPUT_DIRECTORY, STREAMING, WORKERS, USE_CACHE and KMZ_OUTPUT are the
+# defaults of a command, and those of --cost-map and --hazard-store are UPDATE_COST_MAP and UPDATE_HAZARD_STORE
+# of GPS_to_CostMap
+SCRIPTS = {"route": ["GPS_to_KML"], "hazards": ["GPS_to_CostMap"], "batch": ["GPS_to_KML", "GPS_to_CostMap"]}
+
+
+def main(argv=None):
+    """
+    Runs a command.
+    :param argv: list of arguments, sys.argv[1:] if None
+    :return: exit status
+    """
+    arguments = build_parser().parse_args(argv)
+    if arguments.command in ("query", "reanalyze"):
+        return arguments.run(arguments)
+    if arguments.command in SCRIPTS:
+        _script_defaults(arguments)
+    files = expand_inputs(arguments.inputs or DEFAULT_INPUTS)
+    if not files:
+        print("No input files", file=sys.stderr)
+        return 1
+    return arguments.run(arguments, files)
+
+
+def build_parser():
+    """
+    :return: the argparse parser of every command
+    """
+    parser = argparse.ArgumentParser(description="Converts NMEA logs to routes, hazards and track files.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="{" + ",".join(COMMANDS) + "}")
+
+    route = commands.add_parser("route", help="write the route of each log as KML")
+    _add_common_arguments(route, "OUTPUT_DIRECTORY of GPS_to_KML")
+    _add_route_arguments(route)
+    route.set_defaults(run=run_route)
+
+    hazards = commands.add_parser("hazards", help="write the stops and turns of the logs")
+    _add_common_arguments(hazards, "OUTPUT_DIRECTORY of GPS_to_CostMap")
+    _add_hazard_arguments(hazards)
+    hazards.set_defaults(run=run_hazards)
+
+    batch = commands.add_parser("batch", help="write both the routes and the hazards of the logs, parsing each once")
+    _add_common_arguments(batch, None)
+    batch.add_argument("--route-output", help="directory of the route KML files, "
+                                              "default OUTPUT_DIRECTORY of GPS_to_KML")
+    batch.add_argument("--hazard-output", help="directory of the hazard KML files, "
+                                               "default OUTPUT_DIRECTORY of GPS_to_CostMap")
+    _add_route_arguments(batch)
+    _add_hazard_arguments(batch)
+    batch.set_defaults(run=run_batch_command)
+
+    convert = commands.add_parser("convert", help="parse the logs once into track files, see track_format")
+    convert.add_argument("inputs", nargs="*", help="files, directories or glob patterns, default FILES_TO_WORK/")
+    convert.add_argument("-o", "--output", default=DEFAULT_TRACK_DIRECTORY, help="directory of the track files")
+    convert.add_argument("--workers", type=int, default=None, help="processes, default every core")
+    convert.set_defaults(run=run_convert)
+
+    query = commands.add_parser("query", help="find the hazards of a region in the hazard store")
+    area = query.add_mutually_exclusive_group(required=True)
+    area.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                      help="box in degrees")
+    area.add_argument("--near", type=float, nargs=3, metavar=("LONGITUDE", "LATITUDE", "METERS"),
+                      help="circle around a point")
+    query.add_argument("--store", help="directory of the hazard store, default Hazard_Store/")
+    query.add_argument("-o", "--output", help="KML file the hazards found are written to")
+    query.add_argument("--kmz", action="store_true", help="write a compressed .kmz file")
+    query.set_defaults(run=run_query)
+
+    archive = commands.add_parser("archive", help="add the tracks of the logs to the Parquet archive of tracks")
+    archive.add_argument("inputs", nargs="*", help="files, directories or glob patterns, default FILES_TO_WORK/")
+    archive.add_argument("--vehicle", required=True, help="name of the vehicle that logged them")
+    archive.add_argument("--archive", help="directory of the archive, default Track_Archive/")
+    archive.add_argument("--workers", type=int, default=None, help="processes, default every core")
+    archive.set_defaults(run=run_archive)
+
+    reanalyze = commands.add_parser("reanalyze", help="find the stops and turns of the archived drives again")
+    reanalyze.add_argument("--archive", help="directory of the archive, default Track_Archive/")
+    reanalyze.add_argument("--vehicles", nargs="+", help="names of the vehicles, default every vehicle")
+    reanalyze.add_argument("--start", type=_utc_time, help="UTC time of the first fix, i.e 2026-03-01T08:00")
+    reanalyze.add_argument("--end", type=_utc_time, help="UTC time of the last fix")
+    reanalyze.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                           help="only the fixes inside this box in degrees")
+    reanalyze.add_argument("-o", "--output", help="output directory, default OUTPUT_DIRECTORY of GPS_to_CostMap")
+    reanalyze.add_argument("--name", default="Archive", help="the hazards are written to NAME_Hazards.kml")
+    reanalyze.add_argument("--workers", type=int, default=None, help="processes, default every core, 1 runs here")
+    reanalyze.add_argument("--kmz", action="store_true", help="write a compressed .kmz file")
+    _add_threshold_arguments(reanalyze)
+    reanalyze.set_defaults(run=run_reanalyze)
+    return parser
+
+
+def _add_common_arguments(parser, output):
+    """
+    Adds the arguments of the route, hazards and batch commands, with an --output option unless output is None.
+    Those not given are taken from the scripts, see _script_defaults.
+    :param output: the default of --output, as shown in the help
+    """
+    parser.add_argument("inputs", nargs="*", help="files, directories or glob patterns, default INPUT_DIRECTORY")
+    if output is not None:
+        parser.add_argument("-o", "--output", help=f"output directory, default {output}")
+    parser.add_argument("--workers", type=int, help="processes, default WORKERS, every core if None, 1 runs here")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction,
+                        help="process logs chunk by chunk with bounded memory, default STREAMING")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction,
+                        help="reuse the results of logs that have not changed, default USE_CACHE")
+    parser.add_argument("--cache-dir", help="directory of the cache, see result_cache")
+    parser.add_argument("--kmz", action=argparse.BooleanOptionalAction,
+                        help="write compressed .kmz files, default KMZ_OUTPUT")
+    parser.add_argument("--profile", action="store_true", help="write per-stage timing reports, see profiling")
+    parser.add_argument("--cprofile", metavar="STAGE", help="profile also runs this stage under cProfile, "
+                                                            "i.e \"merge\"")
+
+
+def _add_route_arguments(parser):
+    """
+    Adds the options overriding the settings of GPS_to_KML.
+    """
+    parser.add_argument("--straight-angle", type=float, help="degrees within which the car is going straight")
+    parser.add_argument("--straight-speed", type=float, help="MPH above which the car can be going straight")
+    parser.add_argument("--simplify", type=float, metavar="METERS",
+                        help="route simplification tolerance, i.e 1.0, 0 draws every point")
+    parser.add_argument("--simplify-method", choices=["douglas-peucker", "visvalingam"])
+
+
+def _add_hazard_arguments(parser):
+    """
+    Adds the options overriding the settings of GPS_to_CostMap and of the hazard output.
+    """
+    _add_threshold_arguments(parser)
+    parser.add_argument("--combined", metavar="NAME", help="write the hazards of all the logs to NAME_Hazards.kml "
+                                                           "instead of one file per log")
+    parser.add_argument("--cost-map", nargs="?", const="", metavar="FILE",
+                        help="add the hazards to the cost map FILE, default COST_MAP_FILE, see UPDATE_COST_MAP")
+    parser.add_argument("--no-cost-map", action="store_true", help="do not update the cost map")
+    parser.add_argument("--hazard-store", nargs="?", const="", metavar="DIRECTORY",
+                        help="add the hazards to the store of hazards by map tile in DIRECTORY, "
+                             "default HAZARD_STORE_DIRECTORY, see UPDATE_HAZARD_STORE")
+    parser.add_argument("--no-hazard-store", action="store_true", help="do not update the hazard store")
+
+
+def _add_threshold_arguments(parser):
+    """
+    Adds the options overriding the settings stops and turns are found with in GPS_to_CostMap.
+    """
+    parser.add_argument("--turn-window", type=float, metavar="SECONDS", help="heading change averaged over this time")
+    parser.add_argument("--turn-rate", type=float, help="degrees per second above which the car is turning")
+    parser.add_argument("--turn-angle", type=float, help="smallest change in heading in degrees of a turn")
+    parser.add_argument("--turn-speeds", type=float, nargs=2, metavar=("MIN", "MAX"), help="speeds in MPH of a turn")
+    parser.add_argument("--dwell-speed", type=float, help="MPH at or below which the car is standing")
+    parser.add_argument("--moving-speed", type=float, help="MPH from which the car is driving again, ending a stop")
+    parser.add_argument("--stop-durations", type=float, nargs=2, metavar=("MIN", "MAX"),
+                        help="seconds a stop stands, longer is parking")
+    parser.add_argument("--turn-radius", type=float, help="meters within which only the first turn is kept")
+    parser.add_argument("--stop-radius", type=float, help="meters within which only the first stop is kept")
+
+
+def expand_inputs(patterns):
+    """
+    :param patterns: list of files, directories and glob patterns
+    :return: the files they name, each once, directories and patterns sorted by name
+    """
+    from batch_runner import list_files
+    files, seen = [], set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = list_files(os.path.join(pattern, ""))
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(match for match in glob.glob(pattern) if os.path.isfile(match))
+            if not matches:
+                print(f"No files match {pattern}", file=sys.stderr)
+        files += [match for match in matches if match not in seen]
+        seen.update(matches)
+    return files
+
+
+def settings_of(arguments):
+    """
+    :return: the module level settings the arguments change, by module name
+    """
+    settings = {"GPS_to_KML": {}, "GPS_to_CostMap": {}, "result_cache": {}}  # modules without changes are not imported
+    if arguments.command in ("route", "batch"):
+        output = arguments.output if arguments.command == "route" else arguments.route_output
+        if output is not None:
+            settings["GPS_to_KML"]["OUTPUT_DIRECTORY"] = _directory(output)
+        for option, name in [("straight_angle", "STRAIGHT_ANGLE"), ("straight_speed", "STRAIGHT_SPEED"),
+                             ("simplify", "SIMPLIFY_TOLERANCE"), ("simplify_method", "SIMPLIFY_METHOD")]:
+            if getattr(arguments, option) is not None:
+                settings["GPS_to_KML"][name] = getattr(arguments, option)
+    if arguments.command in ("hazards", "batch", "reanalyze"):
+        output = arguments.output if arguments.command != "batch" else arguments.hazard_output
+        if output is not None:
+            settings["GPS_to_CostMap"]["OUTPUT_DIRECTORY"] = _directory(output)
+        for option, name in [("turn_window", "TURN_WINDOW"), ("turn_rate", "TURN_RATE"),
+                             ("turn_angle", "TURN_ANGLE"), ("turn_speeds", "TURN_SPEEDS"),
+                             ("dwell_speed", "DWELL_SPEED"), ("moving_speed", "MOVING_SPEED"),
+                             ("stop_durations", "STOP_DURATIONS"), ("turn_radius", "TURN_RADIUS"),
+                             ("stop_radius", "STOP_RADIUS")]:
+            value = getattr(arguments, option)
+            if value is not None:
+                settings["GPS_to_CostMap"][name] = tuple(value) if isinstance(value, list) else value
+    if getattr(arguments, "cache_dir", None) is not None:
+        settings["result_cache"]["CACHE_DIRECTORY"] = _directory(arguments.cache_dir)
+    return settings
+
+
+def _script_defaults(arguments):
+    """
+    Fills in the inputs, --stream, --workers, --cache and --kmz not given from the settings of
+    the scripts of the command, see SCRIPTS: their input directories, streaming if one of them
+    streams, the fewest workers one of them sets, caching unless one of them does not cache and
+    KMZ files if one of them writes them. The cost map and the hazard store are only updated when
+    --cost-map and --hazard-store are given or UPDATE_COST_MAP and UPDATE_HAZARD_STORE are set.
+    """
+    scripts = [importlib.import_module(name) for name in SCRIPTS[arguments.command]]
+    if not arguments.inputs:
+        arguments.inputs = list(dict.fromkeys(script.INPUT_DIRECTORY for script in scripts))
+    if arguments.stream is None:
+        arguments.stream = any(script.STREAMING for script in scripts)
+    if arguments.workers is None:
+        workers = [script.WORKERS for script in scripts if script.WORKERS is not None]
+        arguments.workers = min(workers) if workers else None
+    if arguments.cache is None:
+        arguments.cache = all(script.USE_CACHE for script in scripts)
+    if arguments.kmz is None:
+        arguments.kmz = any(script.KMZ_OUTPUT for script in scripts)
+    if "cost_map" in arguments:
+        import GPS_to_CostMap
+        if arguments.cost_map is None and not GPS_to_CostMap.UPDATE_COST_MAP:
+            arguments.no_cost_map = True
+        if arguments.hazard_store is None and not GPS_to_CostMap.UPDATE_HAZARD_STORE:
+            arguments.no_hazard_store = True
+
+
+def configure(settings):
+    """
+    Sets module level settings, importing their modules.
+    :param settings: dictionary of {name: value} by module name, see settings_of
+    """
+    for module_name, values in settings.items():
+        if not values:
+            continue
+        module = importlib.import_module(module_name)
+        for name, value in values.items():
+            setattr(module, name, value)
+
+
+def route_file(settings, stream, cache, kmz, file):
+    """
+    Writes the route of a file, see GPS_to_KML.main.
+    """
+    configure(settings)
+    import GPS_to_KML
+    return GPS_to_KML.main(file, stream, cache, kmz)
+
+
+def hazards_file(settings, stream, cache, file):
+    """
+    :return: the file_hash of a file, computed once with its Track, and its stops, left turns
+        and right turns, see GPS_to_CostMap.main
+    """
+    configure(settings)
+    import GPS_to_CostMap
+    from gps_track import Track
+    track = Track(file, cache)
+    return track.content_hash, GPS_to_CostMap.main(file, stream, cache, track)
+
+
+def route_and_hazards_file(settings, stream, cache, kmz, file):
+    """
+    Writes the route of a file and finds its hazards from one parse of it, see gps_track.
+    When streaming, both come from one pass over the file, see GPS_to_CostMap.hazards_alongside.
+    :return: its file_hash and its stops, left turns and right turns, see hazards_file
+    """
+    configure(settings)
+    import GPS_to_KML
+    import GPS_to_CostMap
+    from gps_track import Track
+    track = Track(file, cache)
+    if not stream:
+        GPS_to_KML.main(file, False, cache, kmz, track)
+        return track.content_hash, GPS_to_CostMap.main(file, False, cache, track)
+    from gps_stream import iter_gps_frames
+    found = []  # the hazards of the pass drawing the route, none when the route was cached
+    GPS_to_KML.main(file, True, cache, kmz, track,
+                    GPS_to_CostMap.hazards_alongside(iter_gps_frames(file, (False, True)), found))
+    return track.content_hash, track.cached("hazards", GPS_to_CostMap.hazard_parameters(),
+                                            lambda: found[0] if found else GPS_to_CostMap.find_all_hazards(track, True))
+
+
+def convert_file(output, file):
+    """
+    Writes the track file of a log.
+    :return: name of the track file
+    """
+    from gps_stream import convert_to_track
+    from nmea_parser import uncompressed_name
+    track_file = os.path.join(output, os.path.splitext(os.path.basename(uncompressed_name(file)))[0] + TRACK_EXTENSION)
+    convert_to_track(file, track_file)
+    return track_file
+
+
+def archive_file(vehicle, directory, file):
+    """
+    Adds the track of a log to the archive, see track_archive.add_log.
+    :return: name of the Parquet file written, None if there was nothing to add
+    """
+    import track_archive
+    return track_archive.add_log(file, vehicle, directory or track_archive.ARCHIVE_DIRECTORY)
+
+
+def reanalyze_file(settings, start, end, bbox, file):
+    """
+    :return: the stops, left turns and right turns of an archived drive, see track_archive.drive_hazards
+    """
+    configure(settings)
+    import track_archive
+    return track_archive.drive_hazards(file, start, end, bbox)
+
+
+def run_route(arguments, files):
+    """
+    Writes the route of every file.
+    :return: exit status
+    """
+    settings = settings_of(arguments)
+    configure(settings)
+    _, failed = _run_files(arguments, partial(route_file, settings, arguments.stream, arguments.cache, arguments.kmz),
+                           files)
+    return 1 if failed else 0
+
+
+def run_hazards(arguments, files):
+    """
+    Writes the hazards of the files and adds them to the cost map and the hazard store if asked.
+    :return: exit status
+    """
+    settings = settings_of(arguments)
+    configure(settings)
+    results, failed = _run_files(arguments, partial(hazards_file, settings, arguments.stream, arguments.cache), files)
+    write_hazards(arguments, results)
+    return 1 if failed else 0
+
+
+def run_batch_command(arguments, files):
+    """
+    Writes the route and the hazards of every file and adds the hazards to the cost map and the
+    hazard store if asked.
+    :return: exit status
+    """
+    settings = settings_of(arguments)
+    configure(settings)
+    results, failed = _run_files(arguments, partial(route_and_hazards_file, settings, arguments.stream,
+                                                    arguments.cache, arguments.kmz), files)
+    write_hazards(arguments, results)
+    return 1 if failed else 0
+
+
+def run_convert(arguments, files):
+    """
+    Writes the track file of every log.
+    :return: exit status
+    """
+    from batch_runner import run_batch
+    os.makedirs(arguments.output, exist_ok=True)
+    results = run_batch(partial(convert_file, arguments.output), files, arguments.workers)
+    for file, track_file in results:
+        print(f"{file} -> {track_file}")
+    return 1 if len(results) < len(files) else 0
+
+
+def run_query(arguments):
+    """
+    Prints the number of hazards of each kind in a region of the hazard store, and writes them if asked.
+    :return: exit status
+    """
+    import GPS_to_CostMap
+    from hazard_store import HazardStore, HAZARDS, hazard_lists
+    store = HazardStore.open(arguments.store or GPS_to_CostMap.HAZARD_STORE_DIRECTORY)
+    if arguments.bbox is not None:
+        found = store.hazards_in(*arguments.bbox)
+    else:
+        found = store.hazards_near(*arguments.near)
+    hazards = hazard_lists(found)
+    for hazard, points in zip(HAZARDS, hazards):
+        print(f"{hazard}s: {len(points)}")
+    if arguments.output is not None:
+        from kml_writer import kml_file
+        with kml_file(arguments.output, GPS_to_CostMap.HAZARD_STYLES, arguments.kmz) as kml_docs:
+            _write_hazards(kml_docs, hazards)
+    return 0
+
+
+def run_archive(arguments, files):
+    """
+    Adds the tracks of every log to the archive.
+    :return: exit status
+    """
+    from batch_runner import run_batch
+    results = run_batch(partial(archive_file, arguments.vehicle, arguments.archive), files, arguments.workers)
+    for file, path in results:
+        print(f"{file} -> {path}" if path is not None else f"{file}: already archived or without a dated fix")
+    return 1 if len(results) < len(files) else 0
+
+
+def run_reanalyze(arguments):
+    """
+    Finds the stops and turns of the archived drives matching the arguments, a drive per
+    worker, and writes them to one hazard file.
+    :return: exit status
+    """
+    import GPS_to_CostMap
+    import track_archive
+    from batch_runner import run_batch
+    settings = settings_of(arguments)
+    configure(settings)
+    drives = track_archive.archived_drives(arguments.archive or track_archive.ARCHIVE_DIRECTORY, arguments.vehicles,
+                                           arguments.start, arguments.end)
+    results = run_batch(partial(reanalyze_file, settings, arguments.start, arguments.end, arguments.bbox), drives,
+                        arguments.workers)
+    with GPS_to_CostMap.create_output_file(arguments.name + ".kml", arguments.kmz) as kml_docs:
+        for _, hazards in results:
+            _write_hazards(kml_docs, hazards)
+    print(f"drives: {len(results)}")
+    for index, name in enumerate(["stops", "left turns", "right turns"]):
+        print(f"{name}: {sum(len(hazards[index]) for _, hazards in results)}")
+    return 1 if len(results) < len(drives) else 0
+
+
+def write_hazards(arguments, results):
+    """
+    Writes the hazard KML files and adds the hazards to the cost map and the hazard store unless
+    --no-cost-map and --no-hazard-store, see _script_defaults.
+    :param results: list of (file, (file_hash, (stops, left turns, right turns))), see hazards_file
+    """
+    import GPS_to_CostMap
+    if arguments.combined is not None:
+        with GPS_to_CostMap.create_output_file(arguments.combined + ".kml", arguments.kmz) as kml_docs:
+            for _, (_, hazards) in results:
+                _write_hazards(kml_docs, hazards)
+    else:
+        for file, (_, hazards) in results:
+            with GPS_to_CostMap.create_output_file(file, arguments.kmz) as kml_docs:
+                _write_hazards(kml_docs, hazards)
+    if not arguments.no_cost_map:
+        _update_cost_map(arguments, results)
+    if not arguments.no_hazard_store:
+        _update_hazard_store(arguments, results)
+
+
+def _update_cost_map(arguments, results):
+    """
+    Adds the hazards of new drives, and of drives found again with other settings, to the
+    cost map and writes it as KML.
+    """
+    import GPS_to_CostMap
+    from result_cache import parameters_hash
+    from cost_map import CostMap, write_kml as write_cost_map_kml
+    cost_map_file = arguments.cost_map or GPS_to_CostMap.COST_MAP_FILE
+    costMap = CostMap.load(cost_map_file)
+    parameters = parameters_hash(GPS_to_CostMap.hazard_parameters())
+    for _, (content_hash, (stops, lefts, rights)) in results:
+        costMap.add_drive(content_hash, stops, lefts, rights, parameters)
+    costMap.save(cost_map_file)
+    write_cost_map_kml(costMap, GPS_to_CostMap.OUTPUT_DIRECTORY + "Cost_Map" + (".kmz" if arguments.kmz else ".kml"),
+                       arguments.kmz)
+
+
+def _update_hazard_store(arguments, results):
+    """
+    Adds the hazards of new drives, and of drives found again with other settings, to the
+    hazard store and exports the tiles they changed.
+    """
+    import GPS_to_CostMap
+    from result_cache import parameters_hash
+    from hazard_store import HazardStore, write_tiles
+    store = HazardStore.open(arguments.hazard_store or GPS_to_CostMap.HAZARD_STORE_DIRECTORY)
+    parameters = parameters_hash(GPS_to_CostMap.hazard_parameters())
+    for _, (content_hash, (stops, lefts, rights)) in results:
+        store.add_drive(content_hash, stops, lefts, rights, parameters)
+    changed = store.save()
+    write_tiles(store, GPS_to_CostMap.OUTPUT_DIRECTORY + GPS_to_CostMap.HAZARD_TILES, changed, arguments.kmz)
+
+
+def _write_hazards(kml_docs, hazards):
+    """
+    Appends a placemark for each stop, left turn and right turn to a hazard document.
+    """
+    import GPS_to_CostMap
+    stops, lefts, rights = hazards
+    GPS_to_CostMap.kml_stops(stops, kml_docs)
+    GPS_to_CostMap.kml_left_turns(lefts, kml_docs)
+    GPS_to_CostMap.kml_right_turns(rights, kml_docs)
+
+
+def _run_files(arguments, function, files):
+    """
+    Calls function on every file with run_batch, profiled if asked.
+    :return: list of (file, result) of the files that did not fail, and whether some failed
+    """
+    from batch_runner import run_batch
+    profile = arguments.profile or arguments.cprofile
+    if profile:
+        from profiling import profiled
+        function = partial(profiled, function, cprofile_stage=arguments.cprofile)
+    start = time.perf_counter()
+    results = run_batch(function, files, arguments.workers)
+    if profile:
+        from profiling import write_batch_report
+        write_batch_report([report for _, (_, report) in results], time.perf_counter() - start)
+        results = [(file, result) for file, (result, _) in results]
+    return results, len(results) < len(files)
+
+
+def _utc_time(text):
+    """
+    :return: seconds since 1970 of an ISO date or time, in UTC unless it gives its offset
+    """
+    moment = datetime.datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def _directory(path):
+    """
+    :return: path ending with a separator, as the scripts join their output directories
+    """
+    return os.path.join(path, "")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
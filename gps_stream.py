@@ -0,0 +1,348 @@
+"""
+Streaming, bounded-memory version of the gps_track.read_gps_data/format_gps_data stage.
+
+The log is parsed a block at a time by nmea_parser and GPRMC/GPGGA sentences are merged by
+UTC time as they arrive; sentences that cannot be matched yet are carried over to the next
+block. Every stage is a generator of pandas DataFrames holding a slice of the track, so
+memory is bounded by the parser block size instead of the length of the drive.
+
+GPRMC fixes that jump away from the fixes on both sides of them, further than their
+reported speeds allow, while those two agree with each other are position glitches and
+are dropped before merging, see teleports.
+"""
+from collections import deque
+import numpy as np
+from nmea_parser import iter_nmea, validation_parameters, CHUNK_SIZE, FIX_COLUMNS
+from track_format import COLUMNS, is_track_file, iter_track, write_track
+from conversions import SECONDS_PER_DAY, SPEED_UNIT, SPEED_UNITS, degrees, utc_seconds, date_days, convert_speed
+from spatial_dedup import haversine
+from profiling import count
+
+JUMP_DISTANCE = 50.0  # meters between two fixes more than their speeds explain before it is a jump
+JUMP_SPEED_FACTOR = 1.5  # the car can seem this much faster than its reported speed between two fixes
+DUPLICATE_WINDOW = 4096  # most recent fix times a chunk is checked against for duplicated times
+
+
+def iter_gps_data(file, drop_poor_fixes=False, chunk_size=CHUNK_SIZE):
+    """
+    Streams the rows format_gps_data returns for a file, one parser block at a time.
+    :param file: Name of a txt file where GPS data is retrieved, or of a track file.
+    :param drop_poor_fixes: drop fixes with fewer than 2 satellites or slower than 1 mph, as GPS_to_KML does
+    :param chunk_size: number of bytes parsed at a time
+    :return: generator of DataFrames with time, seconds, latitude, longitude, speed, angle and satellites columns
+    """
+    for GPSData_df, in iter_gps_frames(file, (drop_poor_fixes,), chunk_size):
+        if len(GPSData_df):
+            yield GPSData_df
+
+
+def iter_gps_frames(file, drop_poor_fixes=(False, True), chunk_size=CHUNK_SIZE):
+    """
+    Streams a file once for several ways of cleaning it, see iter_gps_data.
+    :param file: Name of a txt file where GPS data is retrieved, or of a track file.
+    :param drop_poor_fixes: tuple of the drop_poor_fixes of each DataFrame, see iter_gps_data
+    :param chunk_size: number of bytes parsed at a time
+    :return: generator of a tuple of DataFrames per parser block, one per drop_poor_fixes, possibly empty
+    """
+    return clean_frames(iter_merged_data(file, chunk_size), drop_poor_fixes)
+
+
+def clean_frames(chunks, drop_poor_fixes=(False,)):
+    """
+    Turns consecutive chunks of merged columns into the DataFrames iter_gps_data streams.
+    :param chunks: iterable of dictionaries of merged NumPy columns, see merge_gps_data
+    :param drop_poor_fixes: tuple of the drop_poor_fixes of each DataFrame, see iter_gps_data
+    :return: generator of a tuple of DataFrames per chunk, one per drop_poor_fixes, possibly empty
+    """
+    recent = [np.zeros(0) for _ in drop_poor_fixes]
+    row_counts = [0] * len(drop_poor_fixes)
+    for GPSData in chunks:
+        frames = []
+        for index, drop in enumerate(drop_poor_fixes):
+            rows = good_fixes(GPSData) if drop else GPSData
+            GPSData_df = gps_data_frame(rows, row_counts[index])
+            row_counts[index] += len(rows["time"])
+            # times of earlier chunks are dropped too, keeping the first, like drop_duplicates
+            keep, recent[index] = new_times(GPSData_df["seconds"].values, recent[index])
+            frames.append(GPSData_df[keep])
+        yield tuple(frames)
+
+
+def new_times(seconds, recent):
+    """
+    Finds the fixes of a chunk whose time was not seen yet. The merged times only go back
+    with duplicated or reordered sentences, so only the last DUPLICATE_WINDOW times kept
+    are remembered, which bounds memory however long the log is.
+    :param seconds: the "seconds" of consecutive fixes, see merge_gps_data
+    :param recent: the times of the last fixes kept before them
+    :return: mask of the first fix of every time not in recent, and the times to check the next chunk against
+    """
+    keep = np.zeros(len(seconds), dtype=bool)
+    keep[np.unique(seconds, return_index=True)[1]] = True
+    if len(recent):
+        keep &= ~np.isin(seconds, recent)
+    return keep, np.concatenate((recent, seconds[keep]))[-DUPLICATE_WINDOW:]
+
+
+def iter_merged_data(file, chunk_size=CHUNK_SIZE):
+    """
+    :param file: Name of a txt file where GPS data is retrieved, or of a track file.
+    :param chunk_size: number of bytes read at a time
+    :return: generator of dictionaries of merged NumPy columns, see merge_gps_data
+    """
+    if is_track_file(file):
+        return iter_track(file, chunk_size)
+    return merge_gps_data(iter_nmea(file, chunk_size, FIX_COLUMNS))
+
+
+def convert_to_track(data, track_file, chunk_size=CHUNK_SIZE):
+    """
+    Parses and merges a NMEA log and writes it as a track file, see track_format.
+    :param data: Name of a txt file where GPS data is retrieved.
+    :param track_file: name of the track file to write
+    :param chunk_size: number of bytes parsed at a time
+    """
+    chunks = list(iter_merged_data(data, chunk_size))
+    write_track({name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.zeros(0, dtype)
+                 for name, dtype in COLUMNS}, track_file)
+
+
+def track_parameters():
+    """
+    :return: the settings deciding which sentences and fixes are dropped, part of the cache key of tracks
+    """
+    return {**validation_parameters(), "jump distance": JUMP_DISTANCE, "jump speed factor": JUMP_SPEED_FACTOR}
+
+
+def good_fixes(GPSData):
+    """
+    :param GPSData: dictionary of merged NumPy columns
+    :return: the fixes with at least 2 satellites and not slower than 1 mph, as GPS_to_KML keeps
+    """
+    keep = (GPSData["satellites"] >= 2) & ~(GPSData["speed"] < 1)
+    return {key: column[keep] for key, column in GPSData.items()}
+
+
+def gps_data_frame(GPSData, start=0):
+    """
+    Turns merged columns into the DataFrame format_gps_data returns.
+    :param GPSData: dictionary of merged NumPy columns
+    :param start: index of the first row
+    :return: DataFrame without NaNs or duplicated times, compared as "seconds" so days do not collide
+    """
+    import pandas as pd  # imported on first use, so commands that never build a DataFrame start quickly
+    GPSData_df = pd.DataFrame(GPSData, index=pd.RangeIndex(start, start + len(GPSData["time"])))
+    if "satellites" in GPSData_df:  # track files store them as int32
+        GPSData_df["satellites"] = GPSData_df["satellites"].astype(np.int64)
+    GPSData_df.dropna(inplace=True)
+    GPSData_df.drop_duplicates(subset=["seconds"], keep="first", inplace=True)
+    return GPSData_df
+
+
+def merge_columns(GPRMC_data, GPGGA_data):
+    """
+    Merges whole GPRMC and GPGGA columns, see merge_gps_data.
+    :return: dictionary of merged NumPy columns
+    """
+    chunks = list(merge_gps_data([(GPGGA_data, GPRMC_data)]))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def merge_gps_data(chunks):
+    """
+    Merges streamed GPRMC and GPGGA columns by UTC time: every GPRMC fix is kept with the
+    satellite count of the first GPGGA fix not older than it, each GPGGA fix going to at
+    most one GPRMC fix with the same time. Merging ends when either sentence type runs out.
+    Times are compared as seconds from the GPRMC "UT date", so logs go on past midnight,
+    and each fix keeps them as its "seconds", since 1970 once a date is known.
+    :param chunks: iterable of GPGGA, GPRMC column dictionaries from nmea_parser
+    :return: generator of dictionaries of merged NumPy columns
+    """
+    RMC = {"time": np.zeros(0), "seconds": np.zeros(0), "latitude": np.zeros(0), "longitude": np.zeros(0),
+           "speed": np.zeros(0), "angle": np.zeros(0)}
+    GGA = {"seconds": np.zeros(0), "satellites": np.zeros(0, dtype=np.int64)}
+    undated_GGA = []  # GPGGA columns received before the first GPRMC fix gave them a date
+    clockRMC = {"day": 0, "seconds": None, "dated": False}
+    previousRMC = {key: column[:0] for key, column in RMC.items()}  # the last consumed fix, to check the next one
+    clockGGA = {"day": None, "seconds": None}
+    chunks = iter(chunks)
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        if not final:
+            GPGGA, GPRMC = chunk
+            timed = ~np.isnan(GPRMC["UTC position"])
+            RMC = {"time": np.concatenate((RMC["time"], GPRMC["UTC position"][timed])),
+                   "seconds": np.concatenate((RMC["seconds"], elapsed_seconds(
+                       GPRMC["UTC position"][timed], clockRMC, date_days(GPRMC["UT date"][timed])))),
+                   "latitude": np.concatenate((RMC["latitude"], GPRMC["latitude"][timed])),
+                   "longitude": np.concatenate((RMC["longitude"], GPRMC["longitude"][timed])),
+                   "speed": np.concatenate((RMC["speed"], GPRMC["speed over ground in knots"][timed])),
+                   "angle": np.concatenate((RMC["angle"], GPRMC["track made good in degrees"][timed]))}
+            timed = ~np.isnan(GPGGA["UTC position"])
+            undated_GGA.append((GPGGA["UTC position"][timed], GPGGA["# of Satellites"][timed]))
+        if clockGGA["day"] is None and len(RMC["seconds"]) and any(len(times) for times, _ in undated_GGA):
+            # the GPGGA fixes take the day that puts their first fix closest to the first GPRMC fix
+            first = next(times[0] for times, _ in undated_GGA if len(times))
+            clockGGA["day"] = round((RMC["seconds"][0] - utc_seconds(first)) / SECONDS_PER_DAY)
+        if clockGGA["day"] is not None:
+            for times, satellites in undated_GGA:
+                GGA = {"seconds": np.concatenate((GGA["seconds"], elapsed_seconds(times, clockGGA))),
+                       "satellites": np.concatenate((GGA["satellites"], satellites))}
+            undated_GGA = []
+
+        matches_rmc, matches_gga, consumed_rmc, consumed_gga = match_times(RMC["seconds"], GGA["seconds"], final)
+        # the fix after the last consumed one, when it has arrived, tells whether that one jumped
+        checked = {key: np.concatenate((previousRMC[key], column[:consumed_rmc + 1])) for key, column in RMC.items()}
+        jumped = np.concatenate(([False], teleports(checked), [False]))[len(previousRMC["seconds"]):][:consumed_rmc]
+        kept = ~jumped[matches_rmc]
+        count("RMC skipped: teleport", len(kept) - np.count_nonzero(kept))
+        matches_rmc, matches_gga = matches_rmc[kept], matches_gga[kept]
+        if consumed_rmc:
+            previousRMC = {key: column[consumed_rmc - 1:consumed_rmc] for key, column in RMC.items()}
+        yield {"time": RMC["time"][matches_rmc],
+               "seconds": RMC["seconds"][matches_rmc],
+               "latitude": degrees(RMC["latitude"][matches_rmc]),
+               "longitude": degrees(RMC["longitude"][matches_rmc]),
+               "speed": convert_speed(RMC["speed"][matches_rmc], SPEED_UNIT),
+               "angle": RMC["angle"][matches_rmc],
+               "satellites": GGA["satellites"][matches_gga]}
+        RMC = {key: column[consumed_rmc:] for key, column in RMC.items()}
+        GGA = {key: column[consumed_gga:] for key, column in GGA.items()}
+
+
+def teleports(RMC):
+    """
+    Finds position glitches: fixes further from both the fix before and the fix after them
+    than the speeds of the two fixes explain, while those two are close enough to each other.
+    :param RMC: dictionary of the "seconds", "latitude" and "longitude", as NMEA degrees and
+        minutes, and "speed" in knots of consecutive GPRMC fixes
+    :return: boolean array of the fixes between the first and the last one, which are only compared with
+    """
+    if len(RMC["seconds"]) < 3:
+        return np.zeros(max(len(RMC["seconds"]) - 2, 0), dtype=bool)
+    fixes = {"seconds": RMC["seconds"], "lambda": np.radians(degrees(RMC["longitude"])),
+             "phi": np.radians(degrees(RMC["latitude"])), "speed": RMC["speed"] * SPEED_UNITS["m/s"]}
+    steps = _jumps({key: column[:-1] for key, column in fixes.items()},
+                   {key: column[1:] for key, column in fixes.items()})
+    across = _jumps({key: column[:-2] for key, column in fixes.items()},
+                    {key: column[2:] for key, column in fixes.items()})
+    return steps[:-1] & steps[1:] & ~across
+
+
+def _jumps(fixes, others):
+    """
+    :return: whether each fix is further from the other fix than their speeds explain
+    """
+    distances = haversine(fixes["lambda"], fixes["phi"], others["lambda"], others["phi"])
+    allowed = (JUMP_SPEED_FACTOR * np.maximum(fixes["speed"], others["speed"])
+               * np.abs(others["seconds"] - fixes["seconds"]) + JUMP_DISTANCE)
+    return distances > allowed
+
+
+def match_times(timesRMC, timesGGA, final=True):
+    """
+    Pairs GPRMC and GPGGA fixes by time in linear time, the way the format_gps_data while loop did.
+    :param timesRMC: GPRMC times
+    :param timesGGA: GPGGA times
+    :param final: no more fixes will follow, otherwise fixes that later ones could change are left
+    :return: matched GPRMC and GPGGA indexes, and how many of each were consumed
+    """
+    if len(timesRMC) == 0 or len(timesGGA) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0, 0
+    if np.any(timesRMC[1:] < timesRMC[:-1]) or np.any(timesGGA[1:] < timesGGA[:-1]):
+        return _match_unsorted_times(timesRMC, timesGGA)
+    # the first GPGGA fix not older, skipping the ones used by earlier GPRMC fixes of the same time
+    first = np.searchsorted(timesGGA, timesRMC, side="left")
+    same_time = np.searchsorted(timesGGA, timesRMC, side="right") - first
+    run_starts = np.flatnonzero(np.concatenate(([True], timesRMC[1:] != timesRMC[:-1])))
+    run_lengths = np.diff(np.concatenate((run_starts, [len(timesRMC)])))
+    rank = np.arange(len(timesRMC)) - np.repeat(run_starts, run_lengths)
+    matches_gga = first + np.minimum(rank, same_time)
+    matched = matches_gga < len(timesGGA)
+    if not final:
+        matched &= (timesRMC < timesGGA[-1]) & (timesRMC < timesRMC[-1])
+    count = int(np.count_nonzero(matched))  # matched is a prefix as both columns are sorted
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0, 0
+    matches_gga = matches_gga[:count]
+    last = matches_gga[-1]
+    return np.arange(count), matches_gga, count, int(last) + int(timesGGA[last] == timesRMC[count - 1])
+
+
+def _match_unsorted_times(timesRMC, timesGGA):
+    """
+    Walks both time columns the way the format_gps_data while loop does, for fixes out of order.
+    :return: matched GPRMC and GPGGA indexes, and how many of each were consumed
+    """
+    timesRMC = timesRMC.tolist()
+    timesGGA = timesGGA.tolist()
+    matches_rmc = []
+    matches_gga = []
+    counterRMC = 0
+    counterGGA = 0
+    while counterRMC < len(timesRMC) and counterGGA < len(timesGGA):
+        timeRMC = timesRMC[counterRMC]
+        timeGGA = timesGGA[counterGGA]
+        if timeRMC <= timeGGA:
+            matches_rmc.append(counterRMC)
+            matches_gga.append(counterGGA)
+            counterRMC += 1
+            if timeRMC == timeGGA:
+                counterGGA += 1
+        else:
+            counterGGA += 1
+    return np.array(matches_rmc, dtype=np.int64), np.array(matches_gga, dtype=np.int64), counterRMC, counterGGA
+
+
+def elapsed_seconds(utc_times, clock, days=None):
+    """
+    Converts UTC positions to seconds since 1970, counting a day each time the clock goes
+    back by more than half a day (and going back a day if it jumps forward as much).
+    :param utc_times: array of UTC positions, hhmmss.ss
+    :param clock: dictionary with the "day" and "seconds" of the previous fix, and whether
+        a date was seen yet, updated
+    :param days: days since 1970 from the GPRMC date of each fix, NaN where unknown
+    :return: array of seconds
+    """
+    seconds = utc_seconds(utc_times)
+    if len(seconds) == 0:
+        return seconds
+    previous = np.concatenate(([seconds[0] if clock["seconds"] is None else clock["seconds"]], seconds[:-1]))
+    steps = np.cumsum((seconds < previous - SECONDS_PER_DAY / 2).astype(np.int64)
+                      - (seconds > previous + SECONDS_PER_DAY / 2))
+    day = clock["day"] + steps
+    if days is not None and not np.all(np.isnan(days)):
+        # dated fixes set the day, the fixes after them count from there
+        last_dated = np.maximum.accumulate(np.where(np.isnan(days), -1, np.arange(len(days))))
+        if not clock.get("dated"):  # fixes before the first date of the log count back from it
+            last_dated[last_dated < 0] = np.flatnonzero(~np.isnan(days))[0]
+            clock["dated"] = True
+        dated = last_dated >= 0
+        day[dated] = days[last_dated[dated]].astype(np.int64) + steps[dated] - steps[last_dated[dated]]
+    clock["day"] = int(day[-1])
+    clock["seconds"] = seconds[-1]
+    return day * SECONDS_PER_DAY + seconds
+
+
+class Feed:
+    """
+    Iterator over the items pushed into it, stopping whenever it is empty. Lets the
+    generators of this module and of GPS_to_CostMap, which take one item each time they
+    are resumed, be fed as data arrives instead of from a file.
+    """
+
+    def __init__(self):
+        self.items = deque()
+
+    def push(self, item):
+        self.items.append(item)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.items:
+            raise StopIteration
+        return self.items.popleft()
@@ -0,0 +1,127 @@
+"""
+The parsed track of a log, shared by GPS_to_KML and GPS_to_CostMap.
+
+A Track is made from a file name and parses nothing until it is used. The first use
+parses and merges the log, or reads its track file, into columns kept on the object, and
+each script asks it for the DataFrame it works on: the route is drawn from the fixes
+good_fixes keeps, the hazards are found from all of them. Giving both scripts the same
+Track parses the log once for the route and the hazards. With caching on, the columns are
+stored with result_cache under the hash of the log, which is also computed once, so the
+route and hazards commands run one after the other parse it only once as well.
+"""
+import numpy as np
+from nmea_parser import read_nmea, FIX_COLUMNS
+from gps_stream import gps_data_frame, good_fixes, merge_columns, track_parameters
+from track_format import is_track_file, read_track
+from result_cache import cached, file_hash
+from profiling import stage
+
+
+class Track:
+    """
+    The fixes of a log, parsed and merged on first use, see the module docstring.
+    """
+
+    def __init__(self, file, cache=True):
+        self.file = file
+        self.cache = cache
+        self._content_hash = None
+        self._columns = None
+        self._frames = {}  # DataFrames made so far, by drop_poor_fixes
+
+    @property
+    def content_hash(self):
+        """
+        :return: file_hash of the log, computed once
+        """
+        if self._content_hash is None:
+            self._content_hash = file_hash(self.file)
+        return self._content_hash
+
+    @property
+    def columns(self):
+        """
+        :return: dictionary of the merged NumPy columns of the log, see load_track
+        """
+        if self._columns is None:
+            self._columns = self.cached("track", track_parameters(), lambda: load_track(self.file))
+        return self._columns
+
+    def cached(self, name, parameters, function):
+        """
+        :return: what function returns, stored for the contents of the log if caching, see result_cache.cached
+        """
+        if not self.cache:
+            return function()
+        return cached(self.content_hash, name, parameters, function)
+
+    def frame(self, drop_poor_fixes=False):
+        """
+        :param drop_poor_fixes: drop fixes with fewer than 2 satellites or slower than 1 mph, as GPS_to_KML does
+        :return: the DataFrame format_gps_data returns for the log, made once
+        """
+        if drop_poor_fixes not in self._frames:
+            columns = self.columns
+            with stage("data frame", len(columns["time"])) as record:
+                self._frames[drop_poor_fixes] = gps_data_frame(good_fixes(columns) if drop_poor_fixes else columns)
+                record["rows out"] = len(self._frames[drop_poor_fixes])
+        return self._frames[drop_poor_fixes]
+
+
+def load_track(file):
+    """
+    :param file: a NMEA log or a track file, see track_format
+    :return: dictionary of the merged NumPy columns of a file, see gps_stream.merge_gps_data
+    """
+    if is_track_file(file):  # already parsed and merged
+        with stage("read track") as record:
+            GPSData = {name: np.asarray(column) for name, column in read_track(file).items()}
+            record["rows out"] = len(GPSData["time"])
+        return GPSData
+    GPGGA_data, GPRMC_data = read_gps_data(file)
+    with stage("merge", len(GPRMC_data["UTC position"]) + len(GPGGA_data["UTC position"])) as record:
+        GPSData = merge_columns(GPRMC_data, GPGGA_data)
+        record["rows out"] = len(GPSData["time"])
+    return GPSData
+
+
+def read_gps_data(data):
+    """
+    Creates two dictionaries of GPS data using GPGGA and GPRMC sentences, with only the
+    FIX_COLUMNS of nmea_parser that the merge reads.
+    See: http://aprs.gids.nl/nmea/
+    :param data: Name of a txt file where GPS data is retrieved.
+    :return: GPGGA, GPRMC dictionaries of NumPy arrays
+    """
+    with stage("parse") as record:
+        GPGGA_data, GPRMC_data = read_nmea(data, columns=FIX_COLUMNS)
+        record["rows out"] = len(GPGGA_data["UTC position"]) + len(GPRMC_data["UTC position"])
+    return GPGGA_data, GPRMC_data
+
+
+def format_gps_data(GPRMC_data, GPGGA_data, drop_poor_fixes=False):
+    """
+
+    :param GPRMC_data: Data in the GPRMC format.
+    :param GPGGA_data: Data in the GPGGA format.
+    :param drop_poor_fixes: drop fixes with fewer than 2 satellites or slower than 1 mph, as GPS_to_KML does
+    :return: a dictionary with the following:
+        time: The UTC time the position was recorded.
+        seconds: The same time in seconds since 1970, or since the first midnight in logs without a date.
+        Latitude: The latitude of the position.
+        Longitude: The longitude of the position.
+        Speed: The average speed between the previous position and the current one in MPH.
+        Angle: The angle between the previous position and the current one, 0 is due north.
+        Fix Quality: The quality of the gps positioning.
+        Satellites: The number of satellites used in getting the position
+    """
+
+    with stage("merge", len(GPRMC_data["UTC position"]) + len(GPGGA_data["UTC position"])) as record:
+        GPSData = merge_columns(GPRMC_data, GPGGA_data)
+        if drop_poor_fixes:
+            GPSData = good_fixes(GPSData)
+
+        # convert data into a pandas dataframe
+        GPSData = gps_data_frame(GPSData)
+        record["rows out"] = len(GPSData)
+    return GPSData
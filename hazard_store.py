@@ -0,0 +1,279 @@
+"""
+Hazards of many drives stored by map tile, so a region is read without loading the rest.
+
+Tiles are the Web Mercator tiles of online maps at TILE_ZOOM, named by their quadkey, the
+string of digits that also names their parent tiles. Each tile with hazards is a .npz file
+in the store directory holding the longitude, latitude, kind (an index in HAZARDS) and
+drive of each of its hazards, and index.json lists the tiles with their number of hazards
+and the drives added so far, recorded like in the cost map by the hash of their log and of
+the settings their hazards were found with, with the tiles they touch. Adding the same log
+again does nothing and adding it with new settings replaces its hazards. Adding drives
+only rewrites the tiles they touch, and the tiles of the hazards they replace.
+
+A bounding box or radius query reads only the tiles overlapping it. The store is exported
+as one KML file per tile next to a root document with a NetworkLink per tile whose Region
+makes Google Earth load a tile only once it is in view, so viewing any area touches only
+the tiles of that area; tiles rewritten by new drives are the only ones exported again.
+"""
+import json
+import os
+import numpy as np
+from pykml.factory import KML_ElementMaker as KML
+from spatial_dedup import EARTH_RADIUS, haversine
+from kml_writer import kml_file
+
+TILE_ZOOM = 14  # zoom level of the tiles, at 14 a tile is about 2.4 km wide at the equator
+MAX_LATITUDE = 85.05112878  # Web Mercator tiles stop here
+HAZARDS = ["stop", "left turn", "right turn"]
+MIN_LOD_PIXELS = 128  # size on screen a tile needs before Google Earth loads it
+INDEX_FILE = "index.json"
+
+
+class HazardStore:
+    """
+    Hazards by tile in a directory, see the module docstring.
+    """
+
+    def __init__(self, directory, zoom=TILE_ZOOM):
+        self.directory = directory
+        self.zoom = zoom
+        self.tiles = {}  # number of hazards of each saved tile by quadkey
+        self.drives = []
+        self.drive_parameters = []  # parameters_hash of the settings of each drive, None if unknown
+        self.drive_tiles = []  # quadkeys of the tiles with hazards of each drive
+        self._pending = {}  # columns of hazards added since the last save, by quadkey
+        self._replaced = set()  # drives whose saved hazards are dropped by the next save
+
+    @classmethod
+    def open(cls, directory):
+        """
+        :return: the store in a directory, empty if it has no index yet
+        """
+        path = os.path.join(directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return cls(directory)
+        with open(path) as infile:
+            index = json.load(infile)
+        store = cls(directory, index["zoom"])
+        store.tiles = index["tiles"]
+        store.drives = index["drives"]
+        # stores saved before drives were replaceable do not know their settings
+        store.drive_parameters = index.get("drive parameters", [None] * len(store.drives))
+        store.drive_tiles = index.get("drive tiles", [[] for _ in store.drives])
+        return store
+
+    def add_drive(self, drive, stops, left_turns, right_turns, parameters=None):
+        """
+        Adds the hazards of a drive. A drive added again with other parameters has its
+        hazards replaced, otherwise nothing changes. They are written by save.
+        :param drive: name of the drive, i.e the file_hash of its log
+        :param stops: list of [longitude, latitude]
+        :param left_turns: list of [longitude, latitude]
+        :param right_turns: list of [longitude, latitude]
+        :param parameters: the settings the hazards were found with, see result_cache.parameters_hash
+        :return: whether the store changed
+        """
+        if drive in self.drives:
+            index = self.drives.index(drive)
+            if parameters is None or self.drive_parameters[index] in (parameters, None):
+                return False
+            self.drive_parameters[index] = parameters
+            self._replaced.add(index)
+            self._pending = {key: [piece for piece in pieces if piece["drive"][0] != index]
+                             for key, pieces in self._pending.items()}
+            for key in self.drive_tiles[index]:  # rewritten without the hazards replaced
+                self._pending.setdefault(key, [])
+        else:
+            index = len(self.drives)
+            self.drives.append(drive)
+            self.drive_parameters.append(parameters)
+            self.drive_tiles.append([])
+        coordinates, kinds = [], []
+        for kind, points in enumerate((stops, left_turns, right_turns)):
+            coordinates.append(np.array(points, dtype=float).reshape(-1, 2))
+            kinds.append(np.full(len(coordinates[-1]), kind, dtype=np.int8))
+        coordinates = np.concatenate(coordinates)
+        columns = {"longitude": coordinates[:, 0], "latitude": coordinates[:, 1], "kind": np.concatenate(kinds),
+                   "drive": np.full(len(coordinates), index, dtype=np.int32)}
+        x, y = tile_coordinates(columns["longitude"], columns["latitude"], self.zoom)
+        tiles, tile = np.unique(np.column_stack((x, y)), axis=0, return_inverse=True)
+        tile = tile.reshape(-1)
+        order = np.argsort(tile, kind="stable")
+        bounds = np.searchsorted(tile[order], np.arange(len(tiles) + 1))
+        keys = [quadkey(tile_x, tile_y, self.zoom) for tile_x, tile_y in tiles.tolist()]
+        for position, key in enumerate(keys):
+            members = order[bounds[position]:bounds[position + 1]]
+            self._pending.setdefault(key, []).append({name: column[members] for name, column in columns.items()})
+        self.drive_tiles[index] = keys
+        return True
+
+    def save(self):
+        """
+        Writes the tiles changed since the last save, then the index. Tiles left without
+        hazards by replaced drives are deleted.
+        :return: quadkeys of the tiles written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        written = []
+        for key in sorted(self._pending):
+            saved = self.tile(key) if key in self.tiles else _concatenate([])
+            kept = ~np.isin(saved["drive"], list(self._replaced))
+            columns = _concatenate([{name: column[kept] for name, column in saved.items()}] + self._pending[key])
+            path = self._tile_path(key)
+            if len(columns["kind"]) == 0:
+                if key in self.tiles:
+                    os.remove(path)
+                    del self.tiles[key]
+                continue
+            temporary = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(temporary, **columns)
+            os.replace(temporary, path)
+            self.tiles[key] = len(columns["kind"])
+            written.append(key)
+        self._pending = {}
+        self._replaced = set()
+        path = os.path.join(self.directory, INDEX_FILE)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as outfile:
+            json.dump({"zoom": self.zoom, "tiles": self.tiles, "drives": self.drives,
+                       "drive parameters": self.drive_parameters, "drive tiles": self.drive_tiles}, outfile)
+        os.replace(temporary, path)
+        return written
+
+    def tile(self, key):
+        """
+        :return: dictionary of the "longitude", "latitude", "kind" and "drive" columns of a saved tile
+        """
+        with np.load(self._tile_path(key)) as saved:
+            return {name: saved[name] for name in saved.files}
+
+    def tiles_in(self, west, south, east, north):
+        """
+        :return: quadkeys of the saved tiles overlapping a box given in degrees, not crossing the antimeridian
+        """
+        first_x, first_y = tile_coordinates(np.array([west]), np.array([north]), self.zoom)
+        last_x, last_y = tile_coordinates(np.array([east]), np.array([south]), self.zoom)
+        keys = (quadkey(x, y, self.zoom) for x in range(int(first_x[0]), int(last_x[0]) + 1)
+                for y in range(int(first_y[0]), int(last_y[0]) + 1))
+        return [key for key in keys if key in self.tiles]
+
+    def hazards_in(self, west, south, east, north):
+        """
+        Finds the hazards inside a box given in degrees, reading only the tiles overlapping it.
+        :return: dictionary of the "longitude", "latitude", "kind" and "drive" columns of the hazards
+        """
+        found = []
+        for key in self.tiles_in(west, south, east, north):
+            columns = self.tile(key)
+            inside = ((columns["longitude"] >= west) & (columns["longitude"] <= east)
+                      & (columns["latitude"] >= south) & (columns["latitude"] <= north))
+            found.append({name: column[inside] for name, column in columns.items()})
+        return _concatenate(found)
+
+    def hazards_near(self, longitude, latitude, radius):
+        """
+        Finds the hazards within radius meters of a point, reading only the tiles near it.
+        :return: dictionary of the "longitude", "latitude", "kind" and "drive" columns of the hazards
+        """
+        height = np.degrees(radius / EARTH_RADIUS)
+        width = height / max(np.cos(np.radians(min(abs(latitude) + height, 90.0))), 1e-9)
+        found = self.hazards_in(longitude - width, latitude - height, longitude + width, latitude + height)
+        distances = haversine(np.radians(longitude), np.radians(latitude), np.radians(found["longitude"]),
+                              np.radians(found["latitude"]))
+        return {name: column[distances <= radius] for name, column in found.items()}
+
+    def tile_bounds(self, key):
+        """
+        :return: west, south, east and north edges in degrees of a tile
+        """
+        x, y = tile_position(key)
+        tiles = 2 ** len(key)
+        return (x / tiles * 360 - 180, np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / tiles)))),
+                (x + 1) / tiles * 360 - 180, np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / tiles)))))
+
+    def _tile_path(self, key):
+        """
+        :return: path of the .npz file of a tile
+        """
+        return os.path.join(self.directory, key + ".npz")
+
+
+def tile_coordinates(longitudes, latitudes, zoom):
+    """
+    :param longitudes: array of longitudes in degrees
+    :param latitudes: array of latitudes in degrees
+    :param zoom: zoom level of the tiles
+    :return: arrays of the x and y of the tiles holding the points, y grows southward
+    """
+    tiles = 2 ** zoom
+    phis = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitudes) + 180) / 360 * tiles).astype(np.int64)
+    y = np.floor((1 - np.arcsinh(np.tan(phis)) / np.pi) / 2 * tiles).astype(np.int64)
+    return np.clip(x, 0, tiles - 1), np.clip(y, 0, tiles - 1)
+
+
+def quadkey(x, y, zoom):
+    """
+    :return: the quadkey of a tile, one digit per zoom level
+    """
+    return "".join(str(((x >> level) & 1) + 2 * ((y >> level) & 1)) for level in range(zoom - 1, -1, -1))
+
+
+def tile_position(key):
+    """
+    :return: x and y of the tile of a quadkey
+    """
+    x = y = 0
+    for digit in key:
+        x, y = 2 * x + (int(digit) & 1), 2 * y + (int(digit) >> 1)
+    return x, y
+
+
+def hazard_lists(columns):
+    """
+    :return: stops, left turns and right turns of hazard columns as lists of [longitude, latitude]
+    """
+    coordinates = np.column_stack((columns["longitude"], columns["latitude"]))
+    return tuple(coordinates[columns["kind"] == kind].tolist() for kind in range(len(HAZARDS)))
+
+
+def write_tiles(store, directory, keys=None, kmz=False):
+    """
+    Writes the hazards of tiles as one KML file each, named by quadkey, and the root document
+    directory.kml linking to every tile of the store.
+    :param store: the HazardStore
+    :param directory: directory of the tile files, created if needed
+    :param keys: quadkeys of the tiles to write, i.e returned by save, None for every tile
+    :param kmz: write KMZ files, see kml_writer.kml_file
+    :return: name of the root document
+    """
+    import GPS_to_CostMap  # the hazard placemarks and styles
+    extension = ".kmz" if kmz else ".kml"
+    os.makedirs(directory, exist_ok=True)
+    for key in sorted(store.tiles) if keys is None else keys:
+        with kml_file(os.path.join(directory, key + extension), GPS_to_CostMap.HAZARD_STYLES, kmz) as doc:
+            stops, left_turns, right_turns = hazard_lists(store.tile(key))
+            GPS_to_CostMap.kml_stops(stops, doc)
+            GPS_to_CostMap.kml_left_turns(left_turns, doc)
+            GPS_to_CostMap.kml_right_turns(right_turns, doc)
+    root = directory.rstrip("/\\") + extension
+    with kml_file(root, kmz=kmz) as doc:
+        for key in sorted(store.tiles):
+            west, south, east, north = store.tile_bounds(key)
+            doc.append(KML.NetworkLink(
+                KML.name(key),
+                KML.Region(KML.LatLonAltBox(KML.north(north), KML.south(south), KML.east(east), KML.west(west)),
+                           KML.Lod(KML.minLodPixels(MIN_LOD_PIXELS))),
+                KML.Link(KML.href(os.path.basename(directory.rstrip("/\\")) + "/" + key + extension),
+                         KML.viewRefreshMode("onRegion"))))
+    return root
+
+
+def _concatenate(pieces):
+    """
+    :return: the columns of hazard pieces one after the other
+    """
+    if not pieces:
+        return {"longitude": np.zeros(0), "latitude": np.zeros(0), "kind": np.zeros(0, dtype=np.int8),
+                "drive": np.zeros(0, dtype=np.int32)}
+    return {name: np.concatenate([piece[name] for piece in pieces]) for name in pieces[0]}
@@ -0,0 +1,76 @@
+"""
+Writes KML files one placemark at a time.
+
+Placemarks are serialized to the file as soon as they are appended instead of being kept
+in a tree until the whole document is done, so memory does not grow with the number of
+placemarks. Styles are written once at the top of the document and placemarks refer to
+them with a styleUrl.
+"""
+import zipfile
+from contextlib import contextmanager, ExitStack
+from copy import deepcopy
+from lxml import etree
+from pykml.factory import KML_ElementMaker as KML
+
+KML_NAMESPACE = "http://www.opengis.net/kml/2.2"
+NAMESPACES = {None: KML_NAMESPACE,
+              "atom": "http://www.w3.org/2005/Atom",
+              "gx": "http://www.google.com/kml/ext/2.2"}
+
+
+@contextmanager
+def kml_file(filename, styles=(), kmz=False):
+    """
+    Opens a KML document for writing.
+    :param filename: name of the file to write
+    :param styles: KML.Style elements with an id, written before the placemarks
+    :param kmz: write a KMZ, a zip archive holding the document as doc.kml, compressed as it is written
+    :return: a document with an append method writing a placemark to the file
+    """
+    with ExitStack() as stack:
+        if kmz:
+            archive = stack.enter_context(zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED))
+            outfile = stack.enter_context(archive.open("doc.kml", "w"))
+        else:
+            outfile = stack.enter_context(open(filename, "wb"))
+        xf = stack.enter_context(etree.xmlfile(outfile))
+        with xf.element("{%s}kml" % KML_NAMESPACE, nsmap=NAMESPACES):
+            with xf.element("{%s}Document" % KML_NAMESPACE):
+                document = _Document(xf)
+                for style in styles:
+                    document.append(deepcopy(style))
+                yield document
+
+
+def shared_style(style_id, *elements):
+    """
+    :return: a KML.Style with an id placemarks can refer to with style_url
+    """
+    return KML.Style(*elements, id=style_id)
+
+
+def style_url(style_id):
+    """
+    :return: a KML.styleUrl referring to a shared_style of the same document
+    """
+    return KML.styleUrl("#" + style_id)
+
+
+class _Document:
+    """
+    The open Document of a kml_file, takes elements like a KML.Document would.
+    """
+
+    def __init__(self, xf):
+        self.xf = xf
+
+    def append(self, element):
+        """
+        Writes an element, in the namespace of the document rather than declaring it again,
+        extension elements like gx ones keeping theirs. The element is changed in place.
+        """
+        for node in element.iter(tag=etree.Element):
+            if etree.QName(node).namespace == KML_NAMESPACE:
+                node.tag = etree.QName(node).localname
+        etree.cleanup_namespaces(element)
+        self.xf.write(element, pretty_print=True)
@@ -0,0 +1,301 @@
+"""
+Live version of GPS_to_CostMap: receives NMEA sentences from vehicles over TCP or UDP and
+reports stops and turns while they drive.
+
+Every TCP connection, and every UDP address, is one vehicle. The bytes a vehicle sends are
+buffered until FLUSH_INTERVAL has passed, then the whole lines of all vehicles are parsed
+together with nmea_parser, and the sentences of each vehicle are merged with
+gps_stream.merge_gps_data and classified with GPS_to_CostMap.detect_hazards. Each vehicle
+keeps its own merge clock, the fixes its stops and turn windows still need, and the
+hazards it already reported, so what a vehicle sends is classified exactly as
+GPS_to_CostMap would classify the same log. All vehicles are served by one
+asyncio event loop in one process, and the parsing and classification run in a worker
+thread so the loop keeps receiving while they run.
+"""
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from nmea_parser import parse_nmea, parse_nmea_blocks, FIX_COLUMNS
+from gps_stream import merge_gps_data, new_times, Feed
+from GPS_to_CostMap import detect_hazards
+
+HOST = "0.0.0.0"
+TCP_PORT = 10110  # the usual port of NMEA over IP, None to not listen for TCP
+UDP_PORT = 10110  # None to not listen for UDP
+BACKLOG = 1024  # TCP connections waiting to be accepted, so thousands of vehicles can connect at once
+READ_SIZE = 64 * 1024  # bytes read from a TCP connection at a time
+FLUSH_INTERVAL = 1.0  # seconds between classifying what the vehicles sent, about 1 ms of work per vehicle
+MAX_BUFFER = 1024 * 1024  # bytes buffered for a vehicle before it is classified without waiting
+IDLE_TIMEOUT = 60  # seconds without a datagram before a UDP vehicle is finished
+
+
+def print_hazards(vehicle, stops, left_turns, right_turns):
+    """
+    Prints one JSON line per hazard, the default way hazards are reported.
+    :param vehicle: name of the vehicle, i.e "tcp:10.0.0.7:50312"
+    :param stops: list of [longitude, latitude]
+    :param left_turns: list of [longitude, latitude]
+    :param right_turns: list of [longitude, latitude]
+    """
+    for hazard, points in (("stop", stops), ("left turn", left_turns), ("right turn", right_turns)):
+        for longitude, latitude in points:
+            print(json.dumps({"vehicle": vehicle, "hazard": hazard, "longitude": longitude,
+                              "latitude": latitude}), flush=True)
+
+
+class VehicleTracker:
+    """
+    Incremental hazard detection for the sentences of one vehicle.
+    """
+
+    def __init__(self, vehicle):
+        self.vehicle = vehicle
+        self.buffer = bytearray()
+        self.last_received = time.monotonic()
+        self.sentences = Feed()
+        self.frames = Feed()
+        self.merged = merge_gps_data(self.sentences)
+        self.hazards = detect_hazards(self.frames)
+        self.row_count = 0
+        self.recent_times = np.zeros(0)  # times of the last fixes kept, see gps_stream.new_times
+
+    def receive(self, data):
+        """
+        Buffers bytes sent by the vehicle, lines may be split anywhere.
+        """
+        self.buffer += data
+        self.last_received = time.monotonic()
+
+    def take_lines(self):
+        """
+        :return: the whole lines received so far, removed from the buffer
+        """
+        end = self.buffer.rfind(b"\n") + 1
+        lines = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return lines
+
+    def update(self, sentences):
+        """
+        Classifies newly received sentences.
+        :param sentences: GPGGA, GPRMC dictionaries from nmea_parser
+        :return: the stops, left turns and right turns found
+        """
+        self.sentences.push(sentences)
+        return self._classify(next(self.merged))
+
+    def finish(self):
+        """
+        Classifies everything left once the vehicle is gone, including a last line
+        without a newline and the last fixes, which have no fixes after them.
+        :return: the stops, left turns and right turns found
+        """
+        if self.buffer:
+            self.sentences.push(parse_nmea(bytes(self.buffer) + b"\n", FIX_COLUMNS))
+            self.buffer.clear()
+        stops, left_turns, right_turns = [], [], []
+        for GPSData in self.merged:
+            found = self._classify(GPSData)
+            stops, left_turns, right_turns = stops + found[0], left_turns + found[1], right_turns + found[2]
+        found = next(self.hazards)
+        return stops + found[0], left_turns + found[1], right_turns + found[2]
+
+    def _classify(self, GPSData):
+        """
+        Drops fixes with NaNs or times already seen, as gps_data_frame and iter_gps_data
+        do, then passes the others on to detect_hazards.
+        :param GPSData: dictionary of merged NumPy columns
+        :return: the stops, left turns and right turns found once these fixes are added
+        """
+        complete = np.ones(len(GPSData["time"]), dtype=bool)
+        for column in GPSData.values():
+            if column.dtype.kind == "f":
+                complete &= ~np.isnan(column)
+        keep, self.recent_times = new_times(GPSData["seconds"][complete], self.recent_times)
+        if not keep.any():
+            return [], [], []
+        self.frames.push({name: column[complete][keep] for name, column in GPSData.items()})
+        return next(self.hazards)
+
+
+class NMEAServer:
+    """
+    Keeps the VehicleTracker of every connected vehicle and reports their hazards.
+    """
+
+    def __init__(self, on_hazards=print_hazards):
+        """
+        :param on_hazards: function called with the vehicle, stops, left turns and right turns
+        whenever a vehicle has new hazards
+        """
+        self.on_hazards = on_hazards
+        self.trackers = {}
+        self.executor = None  # the worker thread classifying while run is serving
+        self.pending = set()  # futures of the classifications the worker has not reported yet
+
+    def receive(self, vehicle, data):
+        """
+        Buffers bytes sent by a vehicle, starting to track it if it is new.
+        """
+        tracker = self.trackers.get(vehicle)
+        if tracker is None:
+            tracker = self.trackers[vehicle] = VehicleTracker(vehicle)
+        tracker.receive(data)
+        if len(tracker.buffer) > MAX_BUFFER:
+            lines = tracker.take_lines()
+            if lines:
+                self._classify_later([(vehicle, tracker, lines)], [])
+
+    def flush(self):
+        """
+        Classifies what every vehicle sent since the last flush and finishes UDP vehicles
+        that have been quiet for IDLE_TIMEOUT. The lines of all vehicles are parsed together.
+        :return: None, or while run is serving, the future of the classification
+        """
+        now = time.monotonic()
+        updates, finished = [], []
+        for vehicle, tracker in list(self.trackers.items()):
+            if vehicle.startswith("udp:") and now - tracker.last_received > IDLE_TIMEOUT:
+                finished.append((vehicle, self.trackers.pop(vehicle)))
+                continue
+            lines = tracker.take_lines()
+            if lines:
+                updates.append((vehicle, tracker, lines))
+        if updates or finished:
+            return self._classify_later(updates, finished)
+        return None
+
+    def finish(self, vehicle):
+        """
+        Classifies everything left for a vehicle that is gone and forgets it.
+        """
+        tracker = self.trackers.pop(vehicle, None)
+        if tracker is not None:
+            self._classify_later([], [(vehicle, tracker)])
+
+    def _classify_later(self, updates, finished):
+        """
+        Classifies in the worker thread while run is serving, so the event loop keeps receiving,
+        else right away. The worker classifies one batch at a time in the order they come, and the
+        hazards are reported back on the event loop.
+        :param updates: list of (vehicle, VehicleTracker, lines taken from its buffer)
+        :param finished: list of (vehicle, VehicleTracker) of vehicles that are gone
+        :return: None, or the future of the classification
+        """
+        if self.executor is None:
+            self._report_all(_classify(updates, finished))
+            return None
+        future = asyncio.get_running_loop().run_in_executor(self.executor, _classify, updates, finished)
+        self.pending.add(future)
+        future.add_done_callback(self._reported)
+        return future
+
+    def _reported(self, future):
+        """
+        Reports the hazards of a classification done by the worker thread.
+        """
+        self.pending.discard(future)
+        if not future.cancelled():
+            self._report_all(future.result())
+
+    def _report_all(self, found):
+        """
+        Calls on_hazards for each vehicle with any stops or turns.
+        :param found: list of (vehicle, (stops, left turns, right turns))
+        """
+        for vehicle, hazards in found:
+            if any(hazards):
+                self.on_hazards(vehicle, *hazards)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Tracks the vehicle sending on a TCP connection until it disconnects.
+        """
+        host, port = writer.get_extra_info("peername")[:2]
+        vehicle = f"tcp:{host}:{port}"
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.receive(vehicle, data)
+        except ConnectionError:
+            pass
+        finally:
+            self.finish(vehicle)
+            writer.close()
+
+    async def run(self, host=HOST, tcp_port=TCP_PORT, udp_port=UDP_PORT, started=None):
+        """
+        Listens for vehicles and flushes them every FLUSH_INTERVAL, until cancelled. The
+        vehicles are classified by a worker thread, so the event loop keeps receiving meanwhile.
+        :param started: optional future set to the bound (TCP port, UDP port) once listening,
+        useful when a port is 0
+        """
+        loop = asyncio.get_running_loop()
+        server = transport = None
+        ports = [None, None]
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            if tcp_port is not None:
+                server = await asyncio.start_server(self.handle_connection, host, tcp_port, backlog=BACKLOG)
+                ports[0] = server.sockets[0].getsockname()[1]
+            if udp_port is not None:
+                transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(self),
+                                                                   local_addr=(host, udp_port))
+                ports[1] = transport.get_extra_info("sockname")[1]
+            if started is not None:
+                started.set_result(tuple(ports))
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                future = self.flush()
+                if future is not None:
+                    await asyncio.shield(future)  # cancelling the wait must not lose its hazards
+        finally:
+            if server is not None:
+                server.close()
+            if transport is not None:
+                transport.close()
+            if self.pending:
+                await asyncio.wait(self.pending)
+            self.executor.shutdown()
+            self.executor = None
+            for vehicle in list(self.trackers):
+                self.finish(vehicle)
+
+
+def _classify(updates, finished):
+    """
+    Parses the lines of all the vehicles together and classifies them, then finishes the
+    vehicles that are gone.
+    :param updates: list of (vehicle, VehicleTracker, lines taken from its buffer)
+    :param finished: list of (vehicle, VehicleTracker) of vehicles that are gone
+    :return: list of (vehicle, (stops, left turns, right turns))
+    """
+    found = [(vehicle, tracker.finish()) for vehicle, tracker in finished]
+    if updates:
+        blocks = parse_nmea_blocks([lines for _, _, lines in updates], FIX_COLUMNS)
+        found += [(vehicle, tracker.update(sentences)) for (vehicle, tracker, _), sentences in zip(updates, blocks)]
+    return found
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Passes UDP datagrams to an NMEAServer, each sending address being a vehicle.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.receive(f"udp:{addr[0]}:{addr[1]}", data)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(NMEAServer().run())
+    except KeyboardInterrupt:
+        print("Stopped", file=sys.stderr)
@@ -0,0 +1,177 @@
+"""
+Deterministic synthetic NMEA logs, for benchmarks and for trying the scripts without a GPS.
+
+The generated car drives at a cruising speed, turns 90 degrees every turn_every seconds,
+alternately to the right and to the left, and slows down to a stop every stop_every
+seconds. Each epoch gives one GGA and one RMC sentence with valid checksums, in the
+chosen order, followed by a VTG and a GSA sentence if asked, all from the same talker ($GP
+for GPS alone, $GN for a multi-constellation receiver). Sentences can lose their position
+(dropout), as happens with a weak signal, and the receiver can go silent for a while
+(outages), as in a tunnel. The same arguments always give the same file.
+
+The drive is simulated with NumPy for a batch of epochs at a time and only the formatting
+of the sentences is done line by line, so millions of sentences take seconds.
+"""
+import datetime
+import sys
+import numpy as np
+from spatial_dedup import EARTH_RADIUS
+
+BATCH_EPOCHS = 100000  # epochs simulated and written at a time
+METERS_PER_SECOND = 0.44704  # in one MPH
+KNOTS = 1.1508  # MPH in one knot
+ORDERS = ["GGA-RMC", "RMC-GGA", "random"]
+
+
+def generate_nmea(filename, sentences=None, duration=600.0, rate=1.0, order="GGA-RMC", dropout=0.0,
+                  outage_every=0.0, outage_length=0.0, turn_every=60.0, turn_rate=6.5, stop_every=300.0,
+                  stop_length=20.0, cruise_speed=30.0, turn_speed=12.0, start=(42.0, -76.0),
+                  start_time=datetime.datetime(2026, 3, 15, 12, 0, 0), seed=0, talker="GP", extra_sentences=False):
+    """
+    Writes a synthetic NMEA log.
+    :param filename: name of the log to write
+    :param sentences: number of sentences, about, overrides duration
+    :param duration: seconds of driving
+    :param rate: epochs per second
+    :param order: one of ORDERS, order of the GPGGA and GPRMC sentences of an epoch
+    :param dropout: fraction of sentences whose position is missing
+    :param outage_every: seconds between outages, 0 for none
+    :param outage_length: seconds without any sentence in each outage
+    :param turn_every: seconds between turns, 0 for none
+    :param turn_rate: degrees per second turned, GPS_to_CostMap sees a turn above its TURN_RATE
+    :param stop_every: seconds between stops, 0 for none
+    :param stop_length: seconds stopped each time
+    :param cruise_speed: speed in MPH between turns and stops
+    :param turn_speed: speed in MPH while turning
+    :param start: latitude, longitude of the start
+    :param start_time: UTC datetime of the first epoch
+    :param seed: seed of the random choices
+    :param talker: talker ID of the sentences, i.e "GN"
+    :param extra_sentences: add a VTG and a GSA sentence to every epoch
+    :return: number of sentences written
+    """
+    if order not in ORDERS:
+        raise ValueError(f"unknown sentence order {order}, expected one of {', '.join(ORDERS)}")
+    epochs = int(round((sentences / 2) if sentences is not None else duration * rate))
+    rng = np.random.default_rng(seed)
+    state = {"latitude": float(start[0]), "longitude": float(start[1]), "heading": 90.0}
+    midnight = datetime.datetime(start_time.year, start_time.month, start_time.day)
+    start_seconds = (start_time - midnight).total_seconds()
+    written = 0
+    with open(filename, "w", newline="\n") as outfile:
+        for first in range(0, epochs, BATCH_EPOCHS):
+            elapsed = np.arange(first, min(first + BATCH_EPOCHS, epochs)) / rate
+            speed, heading = _drive(elapsed, rate, state, rng, turn_every, turn_rate, stop_every, stop_length,
+                                    cruise_speed, turn_speed)
+            latitude, longitude = _positions(speed, heading, rate, state)
+            lines = _sentences(start_seconds + elapsed, midnight, latitude, longitude, speed, heading, rng,
+                               order, dropout, _silent(elapsed, outage_every, outage_length), talker,
+                               extra_sentences)
+            outfile.write("".join(lines))
+            written += len(lines)
+    return written
+
+
+def _drive(elapsed, rate, state, rng, turn_every, turn_rate, stop_every, stop_length, cruise_speed, turn_speed):
+    """
+    :return: speed in MPH and heading in degrees of each epoch
+    """
+    speed = np.full(len(elapsed), float(cruise_speed))
+    turning = np.zeros(len(elapsed), dtype=bool)
+    turn_rates = np.zeros(len(elapsed))
+    if turn_every > 0:
+        turning = (elapsed % turn_every) < 90 / turn_rate
+        right = (elapsed // turn_every) % 2 == 0
+        turn_rates = np.where(turning, np.where(right, turn_rate, -turn_rate), 0.0)
+        speed[turning] = turn_speed
+    if stop_every > 0:
+        ramp = 10.0  # seconds to slow down or speed up
+        stopping = (elapsed % stop_every) - (stop_every - stop_length - 2 * ramp)
+        slowing = (stopping >= 0) & (stopping < ramp)
+        stopped = (stopping >= ramp) & (stopping < ramp + stop_length)
+        starting = stopping >= ramp + stop_length
+        speed[slowing] = np.minimum(speed[slowing], cruise_speed * (1 - stopping[slowing] / ramp))
+        speed[stopped] = 0.0
+        speed[starting] = np.minimum(speed[starting], cruise_speed * (stopping[starting] - ramp - stop_length) / ramp)
+    jitter = rng.normal(0, 0.3, len(elapsed)) * (speed > 0)  # a parked car keeps its heading
+    heading = (state["heading"] + np.cumsum(turn_rates / rate + jitter)) % 360
+    state["heading"] = float(heading[-1])
+    return speed, heading
+
+
+def _positions(speed, heading, rate, state):
+    """
+    :return: latitude and longitude in degrees of each epoch, after moving at speed along heading
+    """
+    step = speed * METERS_PER_SECOND / rate
+    latitude = state["latitude"] + np.degrees(np.cumsum(step * np.cos(np.radians(heading))) / EARTH_RADIUS)
+    longitude = state["longitude"] + np.degrees(np.cumsum(step * np.sin(np.radians(heading)) / EARTH_RADIUS
+                                                          / np.cos(np.radians(latitude))))
+    state["latitude"], state["longitude"] = float(latitude[-1]), float(longitude[-1])
+    return latitude, longitude
+
+
+def _silent(elapsed, outage_every, outage_length):
+    """
+    :return: whether the receiver is silent at each epoch
+    """
+    if outage_every <= 0 or outage_length <= 0:
+        return np.zeros(len(elapsed), dtype=bool)
+    return (elapsed % outage_every) >= outage_every - outage_length
+
+
+def _sentences(seconds, midnight, latitude, longitude, speed, heading, rng, order, dropout, silent, talker,
+               extra_sentences):
+    """
+    :return: list of the lines of the sentences of the epochs, ending with a newline
+    """
+    days = (seconds // 86400).astype(np.int64)
+    times = ["%02d%02d%05.2f" % (s // 3600, s % 3600 // 60, s % 60) for s in (np.round(seconds % 86400, 2)).tolist()]
+    dates = {day: (midnight + datetime.timedelta(days=day)).strftime("%d%m%y") for day in np.unique(days).tolist()}
+    latitudes, north = _degrees_minutes(latitude, "%02d%07.4f", "N", "S")
+    longitudes, east = _degrees_minutes(longitude, "%03d%07.4f", "E", "W")
+    satellites = np.where(rng.random(len(seconds)) < 0.02, rng.integers(3, 12, len(seconds)), 8).tolist()
+    gga_lost = (rng.random(len(seconds)) < dropout).tolist()
+    rmc_lost = (rng.random(len(seconds)) < dropout).tolist()
+    rmc_first = (rng.random(len(seconds)) < 0.5) if order == "random" else np.full(len(seconds), order == "RMC-GGA")
+    bodies = []
+    for i, (time, day, knots, track) in enumerate(zip(times, days.tolist(), (speed / KNOTS).tolist(),
+                                                      heading.tolist())):
+        if silent[i]:
+            continue
+        position = ",,,," if gga_lost[i] else f"{latitudes[i]},{north[i]},{longitudes[i]},{east[i]}"
+        gga = f"{talker}GGA,{time},{position},1,{satellites[i]:02d},0.9,100.0,M,-34.0,M,,"
+        position = ",,,," if rmc_lost[i] else f"{latitudes[i]},{north[i]},{longitudes[i]},{east[i]}"
+        rmc = f"{talker}RMC,{time},{'V' if rmc_lost[i] else 'A'},{position},{knots:.1f},{track:.1f},{dates[day]},,,A"
+        bodies.extend((rmc, gga) if rmc_first[i] else (gga, rmc))
+        if extra_sentences:
+            bodies.append(f"{talker}VTG,{track:.1f},T,,M,{knots:.1f},N,{knots * 1.852:.1f},K,A")
+            bodies.append(f"{talker}GSA,A,3,01,03,06,11,14,17,19,22,,,,,1.8,0.9,1.5")
+    return [f"${body}*{checksum:02X}\n" for body, checksum in zip(bodies, _checksums(bodies))]
+
+
+def _degrees_minutes(values, template, positive, negative):
+    """
+    :return: NMEA degrees and minutes strings of coordinates and their hemisphere letters
+    """
+    minutes = np.round(np.abs(values) * 60, 4)  # rounded first so 59.99999 minutes becomes the next degree
+    whole_degrees = np.floor(minutes / 60)
+    text = [template % (d, m) for d, m in zip(whole_degrees.tolist(), (minutes - whole_degrees * 60).tolist())]
+    return text, np.where(values < 0, negative, positive).tolist()
+
+
+def _checksums(bodies):
+    """
+    :return: XOR of the bytes of each sentence body, between the $ and the *
+    """
+    if not bodies:
+        return []
+    data = np.frombuffer("".join(bodies).encode("ascii"), dtype=np.uint8)
+    starts = np.cumsum([0] + [len(body) for body in bodies[:-1]])
+    return np.bitwise_xor.reduceat(data, starts).tolist()
+
+
+if __name__ == '__main__':
+    # python nmea_generator.py output.txt [number of sentences]
+    count = generate_nmea(sys.argv[1], sentences=int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print(f"Wrote {count} sentences to {sys.argv[1]}")
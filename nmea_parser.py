@@ -0,0 +1,538 @@
+"""
+Columnar NMEA parser shared by GPS_to_KML and GPS_to_CostMap.
+
+The file is read as bytes in large blocks and tokenized with NumPy: newline and comma
+positions are found once per block, then every field is decoded for all sentences at once
+by gathering its bytes into a row per sentence and combining the ASCII digits of the rows
+with array operations, so no Python code runs per sentence.
+
+Sentences are recognized by type whatever their talker, so $GNRMC from a multi-GNSS
+receiver is read like $GPRMC, and the columns of each type are decoded as listed in
+SENTENCE_FIELDS. GGA and RMC give the fixes; VTG and GSA carry no time and belong to the
+epoch of the GGA or RMC sentence before them, giving RMC fixes a speed and track when
+they have none and dropping the fixes of epochs without a fix.
+
+Sentences are validated in the same pass before their fields are decoded: the XOR
+checksum after the '*' must match the bytes between '$' and '*', RMC sentences must be
+active (A) rather than void (V) and GGA sentences must have a fix with an HDOP of at
+most MAX_HDOP. Checksums are computed for all sentences at once with a single XOR reduction
+over the buffer, so validation costs a few percent of the parse. Each
+reason a sentence is skipped has its own profiling counter.
+See: http://aprs.gids.nl/nmea/
+"""
+import bz2
+import gzip
+import lzma
+import numpy as np
+from profiling import count
+
+DOLLAR = ord("$")
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+COMMA = ord(",")
+DOT = ord(".")
+MINUS = ord("-")
+PLUS = ord("+")
+
+# compressed logs are recognized by their first bytes and decompressed as they are read
+COMPRESSED_FORMATS = [(b"\x1f\x8b", gzip.open, ".gz"), (b"BZh", bz2.open, ".bz2"), (b"\xfd7zXZ\x00", lzma.open, ".xz")]
+
+PADDING = 8  # bytes kept before and after a block, so the fields of its first and last lines are found alike
+CHUNK_SIZE = 4 * 1024 * 1024  # small enough for the offset lookups of a block to stay in cache
+EXACT_DIGITS = 15  # digits a float64 holds exactly, numbers with more are decoded with float()
+VERIFY_CHECKSUMS = True  # skip sentences whose checksum is missing or does not match
+MAX_HDOP = 20.0  # GGA sentences with a larger horizontal dilution of precision are skipped
+
+POWERS_OF_TEN = 10.0 ** np.arange(EXACT_DIGITS + 1)
+ASTERISK = ord("*")
+HEX_VALUES = np.full(256, -1, dtype=np.int16)  # value of each hexadecimal digit byte, -1 for other bytes
+HEX_VALUES[np.frombuffer(b"0123456789ABCDEFabcdef", dtype=np.uint8)] = list(range(16)) + list(range(10, 16))
+
+SENTENCE_TYPES = ["GGA", "RMC", "VTG", "GSA"]
+# columns decoded from each type of sentence: name, _Sentences method and the fields it reads
+SENTENCE_FIELDS = {
+    "GGA": [("UTC position", "number", 1), ("latitude", "coordinate", 2, 3, "S"),
+            ("longitude", "coordinate", 4, 5, "W"), ("GPS Fix", "integer", 6), ("# of Satellites", "integer", 7),
+            ("Horizontal dilution of precision", "number", 8), ("antenna altitude", "texts", 9, 10),
+            ("geoidal separation", "texts", 11, 12), ("age of GPS data", "text", 13),
+            ("Differential reference station ID", "text", 14)],
+    "RMC": [("UTC position", "number", 1), ("validity", "text", 2), ("latitude", "coordinate", 3, 4, "S"),
+            ("longitude", "coordinate", 5, 6, "W"), ("speed over ground in knots", "number", 7),
+            ("track made good in degrees", "number", 8), ("UT date", "text", 9), ("variation", "texts", 10, 11),
+            ("mode", "text", 12)],
+    "VTG": [("track made good in degrees", "number", 1), ("magnetic track in degrees", "number", 3),
+            ("speed over ground in knots", "number", 5), ("speed over ground in km/h", "number", 7),
+            ("mode", "text", 9)],
+    "GSA": [("selection mode", "text", 1), ("fix type", "integer", 2), ("PDOP", "number", 15), ("HDOP", "number", 16),
+            ("VDOP", "number", 17)],
+}
+# the GGA and RMC columns giving the time, position, speed and satellites of the fixes, all the scripts read
+FIX_COLUMNS = ("UTC position", "latitude", "longitude", "# of Satellites", "speed over ground in knots",
+               "track made good in degrees", "UT date")
+
+
+def read_nmea(data, chunk_size=CHUNK_SIZE, columns=None):
+    """
+    Parses a whole NMEA file into GPGGA and GPRMC columns.
+    :param data: Name of a txt file where GPS data is retrieved.
+    :param chunk_size: number of bytes read at a time, None reads the whole file
+    :param columns: names of the columns decoded, i.e FIX_COLUMNS, None for every column
+    :return: GPGGA, GPRMC dictionaries of NumPy arrays
+    """
+    chunks = list(iter_nmea(data, chunk_size, columns))
+    if len(chunks) == 1:
+        return chunks[0]
+    return concat_columns([chunk[0] for chunk in chunks]), concat_columns([chunk[1] for chunk in chunks])
+
+
+def iter_nmea(data, chunk_size=CHUNK_SIZE, columns=None):
+    """
+    Parses an NMEA file block by block, splitting blocks on line boundaries.
+    :param data: Name of a txt file where GPS data is retrieved, it may be gzip, bzip2 or xz compressed.
+    :param chunk_size: number of uncompressed bytes read at a time, None reads the whole file
+    :param columns: names of the columns decoded, None for every column
+    :return: generator of GPGGA, GPRMC dictionaries, one pair per block
+    """
+    with open_log(data) as gps_file:
+        if chunk_size is None:
+            yield parse_nmea(gps_file.read(), columns)
+            return
+        remainder = b""
+        while True:
+            buf = _new_buffer(len(remainder) + chunk_size)
+            buf[PADDING:PADDING + len(remainder)] = np.frombuffer(remainder, dtype=np.uint8)
+            size = len(remainder) + gps_file.readinto(memoryview(buf)[PADDING + len(remainder):-2 * PADDING])
+            if size == len(remainder):
+                break
+            decoded, consumed = _parse_buffer(buf, size, False, columns)
+            remainder = buf[PADDING + consumed:PADDING + size].tobytes()
+            yield decoded
+        yield parse_nmea(remainder, columns)
+
+
+def open_log(data):
+    """
+    Opens a log for reading bytes, decompressing it on the fly if it is compressed.
+    :param data: Name of a txt file where GPS data is retrieved.
+    :return: a binary file object
+    """
+    with open(data, "rb") as gps_file:
+        magic = gps_file.read(8)
+    for signature, opener, _ in COMPRESSED_FORMATS:
+        if magic.startswith(signature):
+            return opener(data, "rb")
+    return open(data, "rb")
+
+
+def uncompressed_name(data):
+    """
+    :return: the name of a log without the extension of its compression, i.e log.txt for log.txt.gz
+    """
+    for _, _, extension in COMPRESSED_FORMATS:
+        if data.endswith(extension):
+            return data[:-len(extension)]
+    return data
+
+
+def parse_nmea(data, columns=None):
+    """
+    Parses a block of NMEA sentences.
+    Sentences missing a latitude or longitude are skipped, as are GPRMC sentences whose
+    longitude is not a number. Southern latitudes and western longitudes are negated.
+    Text fields are returned as fixed-width byte strings, empty where a trailing field is absent.
+    :param data: bytes holding whole lines of NMEA sentences
+    :param columns: names of the columns decoded, None for every column
+    :return: GPGGA, GPRMC dictionaries of NumPy arrays
+    """
+    buf = _new_buffer(len(data))
+    buf[PADDING:PADDING + len(data)] = np.frombuffer(data, dtype=np.uint8)
+    buf[PADDING + len(data):] = 0
+    return _parse_buffer(buf, len(data), True, columns)[0]
+
+
+def parse_nmea_blocks(blocks, columns=None):
+    """
+    Parses many small blocks of NMEA sentences in one pass, i.e the lines received from
+    each of many sources, which is much faster than calling parse_nmea on every block.
+    :param blocks: list of bytes, each holding whole lines ending with a newline
+    :param columns: names of the columns decoded, None for every column
+    :return: list of GPGGA, GPRMC dictionaries of NumPy arrays, one per block, as parse_nmea returns
+    """
+    data = b"".join(blocks)
+    buf = _new_buffer(len(data))
+    buf[PADDING:PADDING + len(data)] = np.frombuffer(data, dtype=np.uint8)
+    buf[PADDING + len(data):] = 0
+    sentences, _ = _find_sentences(buf, len(data), final=True)
+    block_ends = PADDING + np.cumsum([len(block) for block in blocks])
+    GPGGA, GPRMC = _decode_sentences(sentences, block_ends, columns)
+    # the rows of each type are in the order of the sentences, so every block has consecutive rows
+    gga_bounds = np.concatenate(([0], np.searchsorted(sentences["GGA"].ends, block_ends)))
+    rmc_bounds = np.concatenate(([0], np.searchsorted(sentences["RMC"].ends, block_ends)))
+    return [({key: column[gga_bounds[i]:gga_bounds[i + 1]] for key, column in GPGGA.items()},
+             {key: column[rmc_bounds[i]:rmc_bounds[i + 1]] for key, column in GPRMC.items()})
+            for i in range(len(blocks))]
+
+
+def validation_parameters():
+    """
+    :return: the settings deciding which sentences are skipped, part of the cache key of parsed tracks
+    """
+    return {"verify checksums": VERIFY_CHECKSUMS, "max HDOP": MAX_HDOP}
+
+
+def concat_columns(columns):
+    """
+    Joins a list of GPGGA or GPRMC column dictionaries into one.
+    :param columns: list of dictionaries with identical keys
+    :return: a single dictionary of NumPy arrays
+    """
+    return {key: np.concatenate([column[key] for column in columns]) for key in columns[0]}
+
+
+def _new_buffer(size):
+    """
+    :return: an uninitialized byte array with zeroed padding before the data and room for padding after it
+    """
+    buf = np.empty(PADDING + size + 2 * PADDING, dtype=np.uint8)
+    buf[:PADDING] = 0
+    return buf
+
+
+def _parse_buffer(buf, size, final, columns=None):
+    """
+    Parses the `size` data bytes of a padded buffer.
+    :param final: whether a trailing line without a newline is complete
+    :param columns: names of the columns decoded, None for every column
+    :return: (GPGGA, GPRMC) and the number of bytes consumed
+    """
+    sentences, consumed = _find_sentences(buf, size, final)
+    return _decode_sentences(sentences, columns=columns), consumed
+
+
+def _find_sentences(buf, size, final):
+    """
+    Finds the lines and commas of the `size` data bytes of a padded buffer.
+    :return: dictionary of the _Sentences of each of SENTENCE_TYPES, from any talker, and the number of bytes consumed
+    """
+    data = buf[PADDING:PADDING + size]
+    newlines = np.flatnonzero(data == NEWLINE) + PADDING
+    consumed = size if final else (int(newlines[-1]) + 1 - PADDING if len(newlines) else 0)
+    starts = np.concatenate(([PADDING], newlines + 1))
+    ends = np.concatenate((newlines, [PADDING + size]))
+    if not final:
+        starts, ends = starts[:-1], ends[:-1]
+    ends = ends - ((ends > starts) & (buf[ends - 1] == CARRIAGE_RETURN))
+    # the trailing padding is filled with commas so every field lookup finds a comma past its line
+    buf[PADDING + size:] = COMMA
+    commas = np.flatnonzero(buf[PADDING:] == COMMA) + PADDING
+    # "$", two talker letters, the type and a comma, proprietary "$P" sentences are not from a talker
+    heads, _ = _field_bytes(buf, starts, starts + len("$GPGGA,"), len("$GPGGA,"))
+    letters = heads[1:3] - np.uint8(ord("A"))  # wraps around below 'A', so only capitals are under 26
+    talked = (np.all(letters < 26, axis=0) & (heads[1] != ord("P")) & (heads[0] == DOLLAR)
+              & (ends - starts >= len("$GPGGA,")))
+    sentences = {}
+    for sentence_type in SENTENCE_TYPES:
+        type_bytes = np.frombuffer(sentence_type.encode() + b",", dtype=np.uint8)[:, None]
+        matches = talked & np.all(heads[3:] == type_bytes, axis=0)
+        sentences[sentence_type] = _Sentences(buf, commas, starts[matches], ends[matches])
+    if not final and (len(sentences["VTG"].starts) or len(sentences["GSA"].starts)):
+        # the block ends before its last GGA or RMC sentence, which goes to the next block with
+        # the VTG and GSA sentences after it, so they always find the sentence of their epoch
+        last_timed = max([int(sentences[timed].starts[-1]) for timed in ("GGA", "RMC") if len(sentences[timed].starts)],
+                         default=PADDING)
+        if last_timed > PADDING:
+            consumed = last_timed - PADDING
+            for found in sentences.values():
+                found.select(found.starts < last_timed)
+    return sentences, consumed
+
+
+def _decode_sentences(sentences, block_ends=None, columns=None):
+    """
+    Validates and decodes the sentences of every type. VTG and GSA sentences belong to the
+    epoch of the GGA or RMC sentence before them: RMC fixes whose epoch has no fix in any
+    GSA sentence are skipped, and take their speed and track from the VTG sentence of their
+    epoch when they have none.
+    :param sentences: dictionary of the _Sentences of each type, see _find_sentences
+    :param block_ends: offsets of the ends of the blocks of parse_nmea_blocks, sentences only
+        belong to the epochs of their own block, None for a single block
+    :param columns: names of the GGA and RMC columns decoded, None for every column
+    :return: GPGGA, GPRMC dictionaries of NumPy arrays
+    """
+    for sentence_type, found in sentences.items():
+        _count_talkers(found, sentence_type)
+    gga, rmc, vtg, gsa = (sentences[sentence_type] for sentence_type in SENTENCE_TYPES)
+    vtg_epochs, gsa_epochs = np.zeros(0), np.zeros(0)
+    if len(vtg.starts) or len(gsa.starts):
+        timed_starts = np.concatenate((gga.starts, rmc.starts))
+        order = np.argsort(timed_starts, kind="stable")
+        timed = (timed_starts[order], np.concatenate((gga.number(1), rmc.number(1)))[order])
+        vtg_epochs = _epoch_times(vtg.starts, *timed, block_ends)
+        gsa_epochs = _epoch_times(gsa.starts, *timed, block_ends)
+
+    keep = _validate(vtg, "VTG", [("bad checksum", vtg.checksum_valid())])
+    VTG = {"epoch": vtg_epochs[keep], **_decode_fields(vtg, SENTENCE_FIELDS["VTG"])}
+    keep = _validate(gsa, "GSA", [("bad checksum", gsa.checksum_valid())])
+    GSA = {"epoch": gsa_epochs[keep], **_decode_fields(gsa, SENTENCE_FIELDS["GSA"])}
+
+    _validate(gga, "GGA", [("bad checksum", gga.checksum_valid()),
+                           ("empty latitude or longitude", (gga.length(2) > 0) & (gga.length(4) > 0)),
+                           ("no fix", gga.integer(6) > 0), ("high HDOP", ~(gga.number(8) > MAX_HDOP))])
+    begin, end = rmc.bounds(2)
+    _validate(rmc, "RMC", [("bad checksum", rmc.checksum_valid()),
+                           ("void", (end - begin == 1) & (rmc.buf[begin] == ord("A"))),
+                           ("no fix in GSA", _not_in(rmc.number(1), _no_fix_epochs(GSA))),
+                           ("empty latitude or longitude", (rmc.length(3) > 0) & (rmc.length(5) > 0)),
+                           ("bad longitude", ~np.isnan(rmc.number(5)))])
+    return (_decode_fields(gga, SENTENCE_FIELDS["GGA"], columns),
+            _with_vtg(_decode_fields(rmc, SENTENCE_FIELDS["RMC"], columns), VTG))
+
+
+def _decode_fields(sentences, fields, columns=None):
+    """
+    :param sentences: the _Sentences of one type
+    :param fields: list of the name, decoder and fields of each column, see SENTENCE_FIELDS
+    :param columns: names of the columns decoded, None for every column
+    :return: dictionary of NumPy arrays
+    """
+    return {name: getattr(sentences, decoder)(*arguments) for name, decoder, *arguments in fields
+            if columns is None or name in columns}
+
+
+def _validate(sentences, sentence_type, checks):
+    """
+    Keeps only the sentences passing every check, counting the ones each check skips first.
+    :param sentences: the _Sentences of one type
+    :param sentence_type: one of SENTENCE_TYPES, the start of the counter names
+    :param checks: list of (reason, boolean array of the sentences passing the check)
+    :return: boolean array of the sentences kept
+    """
+    keep = np.ones(len(sentences.ends), dtype=bool)
+    for reason, valid in checks:
+        count(f"{sentence_type} skipped: {reason}", np.count_nonzero(keep & ~valid))
+        keep &= valid
+    if not keep.all():
+        sentences.select(keep)
+    return keep
+
+
+def _count_talkers(sentences, sentence_type):
+    """
+    Counts the sentences of a type from each talker, i.e "GNRMC sentences".
+    """
+    if len(sentences.starts) == 0:
+        return
+    talkers = sentences.buf[sentences.starts + 1].astype(np.int64) * 256 + sentences.buf[sentences.starts + 2]
+    for talker in np.flatnonzero(np.bincount(talkers)).tolist():
+        count(f"{chr(talker >> 8)}{chr(talker & 0xFF)}{sentence_type} sentences",
+              np.count_nonzero(talkers == talker))
+
+
+def _epoch_times(starts, timed_starts, timed_times, block_ends=None):
+    """
+    :param starts: offsets of sentences without a time
+    :param timed_starts: sorted offsets of the sentences with a time
+    :param timed_times: their UTC positions
+    :param block_ends: see _decode_sentences
+    :return: the time of the last timed sentence before each sentence, NaN where there is none
+    """
+    before = np.searchsorted(timed_starts, starts) - 1
+    found = before >= 0
+    if block_ends is not None:
+        found &= (np.searchsorted(block_ends, timed_starts[np.maximum(before, 0)], side="right")
+                  == np.searchsorted(block_ends, starts, side="right"))
+    return np.where(found, timed_times[np.maximum(before, 0)] if len(timed_starts) else np.nan, np.nan)
+
+
+def _no_fix_epochs(GSA):
+    """
+    :return: the epochs where every GSA sentence reports no fix, constellations report separately
+    """
+    if len(GSA["epoch"]) == 0:
+        return np.zeros(0)
+    fixed = np.isin(GSA["epoch"], GSA["epoch"][GSA["fix type"] >= 2])
+    return np.unique(GSA["epoch"][(GSA["fix type"] == 1) & ~fixed])
+
+
+def _not_in(values, excluded):
+    """
+    :return: whether each value is not one of excluded
+    """
+    return ~np.isin(values, excluded) if len(excluded) else np.ones(len(values), dtype=bool)
+
+
+def _with_vtg(GPRMC, VTG):
+    """
+    :return: the RMC columns with the speed and track of the VTG sentence of their epoch where they have none
+    """
+    names = [name for name in ("speed over ground in knots", "track made good in degrees") if name in GPRMC]
+    if not names or len(VTG["epoch"]) == 0:
+        return GPRMC
+    missing = np.logical_or.reduce([np.isnan(GPRMC[name]) for name in names])
+    if not missing.any():
+        return GPRMC
+    order = np.argsort(VTG["epoch"], kind="stable")
+    epochs = VTG["epoch"][order]
+    rows = np.flatnonzero(missing)
+    positions = np.minimum(np.searchsorted(epochs, GPRMC["UTC position"][rows]), len(epochs) - 1)
+    found = epochs[positions] == GPRMC["UTC position"][rows]
+    rows, matches = rows[found], order[positions[found]]
+    for name in names:
+        column = GPRMC[name]
+        column[rows] = np.where(np.isnan(column[rows]), VTG[name][matches], column[rows])
+    return GPRMC
+
+
+def _field_bytes(buf, begin, end, width):
+    """
+    :return: the first width bytes of each field as a 2D array, with a row per position in
+        the field and a column per field, and a mask of the bytes inside the field
+    """
+    positions = np.arange(width)[:, None]
+    inside = positions < end - begin
+    return np.take(buf, begin + positions, mode="clip"), inside
+
+
+def _decimal_numbers(buf, begin, end):
+    """
+    Decodes fields of digits around an optional point into float64, NaN where a field is
+    empty or not a number. The digits are combined into an exact integer mantissa, so the
+    single division by a power of ten rounds the same way float() does; the rare fields with
+    more than EXACT_DIGITS digits go through float() instead.
+    """
+    length = end - begin
+    width = min(int(length.max()) if len(length) else 0, EXACT_DIGITS + 1)
+    if width == 0:
+        return np.full(len(begin), np.nan)
+    text, inside = _field_bytes(buf, begin, end, width)
+    digits = text - np.uint8(ord("0"))  # wraps around below '0', so only digits are at most 9
+    is_digit = inside & (digits <= 9)
+    is_dot = inside & (text == DOT)
+    digit_count = np.count_nonzero(is_digit, axis=0)
+    has_dot = is_dot.any(axis=0)
+    valid = ((length <= width) & (digit_count > 0) & (np.count_nonzero(is_dot, axis=0) <= 1)
+             & np.all(is_digit | is_dot | ~inside, axis=0))
+    mantissa = np.zeros(len(begin), dtype=np.int64)
+    for position in range(width):
+        mantissa = np.where(is_digit[position], mantissa * 10 + digits[position], mantissa)
+    fraction_count = np.where(has_dot, length - np.argmax(is_dot, axis=0) - 1, 0)
+    values = mantissa / POWERS_OF_TEN[np.clip(fraction_count, 0, EXACT_DIGITS)]
+    values[~valid] = np.nan
+    for row in np.flatnonzero((length > width) | (digit_count > EXACT_DIGITS)).tolist():
+        field = buf[begin[row]:end[row]].tobytes()
+        values[row] = float(field) if field.replace(b".", b"", 1).isdigit() else np.nan
+    return values
+
+
+class _Sentences:
+    """
+    Field offsets of the sentences of one type in a buffer.
+    Field k of a sentence spans the bytes between its k-th and (k+1)-th commas, the last
+    field ends at the '*' of the checksum.
+    """
+
+    def __init__(self, buf, commas, starts, ends):
+        self.buf = buf
+        self.commas = commas
+        self.starts = starts
+        self.ends = ends
+        self.body_ends = ends - 3 * (buf[np.maximum(ends - 3, starts)] == ASTERISK)
+        self.first_comma = np.searchsorted(commas, starts)
+        self.cache = {}  # comma offsets and decoded numbers by field
+
+    def select(self, mask):
+        """
+        Keeps only the sentences where mask is True.
+        """
+        self.starts = self.starts[mask]
+        self.ends = self.ends[mask]
+        self.body_ends = self.body_ends[mask]
+        self.first_comma = self.first_comma[mask]
+        self.cache = {key: values[mask] for key, values in self.cache.items()}
+
+    def checksum_valid(self):
+        """
+        :return: whether each sentence ends with '*' and two hexadecimal digits equal to the
+            XOR of its bytes between '$' and '*', True everywhere unless VERIFY_CHECKSUMS
+        """
+        if not VERIFY_CHECKSUMS or len(self.ends) == 0:
+            return np.ones(len(self.ends), dtype=bool)
+        star = self.ends - 3
+        high, low = HEX_VALUES[self.buf[star + 1]], HEX_VALUES[self.buf[star + 2]]
+        # XOR of the bytes from the one after '$' up to the '*' of each sentence, every other
+        # range of reduceat being the bytes between sentences
+        total = np.bitwise_xor.reduceat(self.buf, np.column_stack((self.starts + 1, star)).ravel())[::2]
+        return (self.buf[star] == ASTERISK) & (high >= 0) & (low >= 0) & (total == high * 16 + low)
+
+    def bounds(self, field):
+        """
+        :return: start and end offsets of a field, empty at the line end where the sentence is too short
+        """
+        end = np.minimum(self.comma(field), self.body_ends)
+        return np.minimum(self.comma(field - 1) + 1, end), end
+
+    def comma(self, index):
+        """
+        :return: offset of the index-th comma of each sentence, past the line end if it has fewer
+        """
+        if index not in self.cache:
+            self.cache[index] = self.commas[self.first_comma + index]
+        return self.cache[index]
+
+    def length(self, field):
+        begin, end = self.bounds(field)
+        return end - begin
+
+    def number(self, field):
+        """
+        Decodes a numeric field into float64, NaN where the field is empty or not a number,
+        see _decimal_numbers.
+        """
+        if ("number", field) in self.cache:
+            return self.cache["number", field]
+        self.cache["number", field] = values = self._number(field)
+        return values
+
+    def _number(self, field):
+        begin, end = self.bounds(field)
+        first = self.buf[begin]
+        negative = first == MINUS
+        begin = begin + (negative | (first == PLUS))
+        values = _decimal_numbers(self.buf, begin, end)
+        np.negative(values, out=values, where=negative)
+        return values
+
+    def integer(self, field):
+        """
+        Decodes an integer field, 0 where the field is empty.
+        """
+        values = self.number(field)
+        return np.where(np.isnan(values), 0, values).astype(np.int64)
+
+    def coordinate(self, field, hemisphere_field, negative):
+        """
+        Decodes a latitude or longitude, negative where its hemisphere field is the negative letter.
+        """
+        return self.number(field) * self.sign(hemisphere_field, negative)
+
+    def texts(self, *fields):
+        """
+        Decodes text fields side by side, i.e a value and its unit.
+        """
+        return np.stack([self.text(field) for field in fields], axis=1)
+
+    def sign(self, field, negative):
+        """
+        :return: -1.0 where the field is exactly the negative hemisphere letter, else 1.0
+        """
+        begin, end = self.bounds(field)
+        return np.where((end - begin == 1) & (self.buf[begin] == ord(negative)), -1.0, 1.0)
+
+    def text(self, field):
+        """
+        Decodes a field as an array of fixed-width byte strings.
+        """
+        begin, end = self.bounds(field)
+        width = max(int((end - begin).max()) if len(begin) else 1, 1)
+        text, inside = _field_bytes(self.buf, begin, end, width)
+        return np.ascontiguousarray(np.where(inside, text, 0).T).view("S%d" % width).ravel()
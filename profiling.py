@@ -0,0 +1,145 @@
+"""
+Per-stage timing of both scripts, written as JSON reports.
+
+While a file is profiled, every stage wrapped in stage() records its wall time, the rows
+it took and gave, and the peak RSS of the process when it ended, and count() adds up
+events such as skipped sentences or geopy distance calls. Nothing is recorded when no
+file is being profiled, so the instrumentation costs a function call per stage.
+
+profiled() runs a script's main function on one file with profiling on and writes the
+report of the file to PROFILE_DIRECTORY, named after the file and a hash of its directory so
+logs of the same name in different directories do not overwrite each other; it is a module
+level function so run_batch can send it to its workers. write_batch_report() adds up the reports of a whole batch.
+One stage can also be run under cProfile, its statistics are saved next to the report.
+"""
+import cProfile
+import hashlib
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is not reported there
+    resource = None
+
+PROFILE_DIRECTORY = "Profiles/"
+
+_report = None  # report of the file being profiled, None when profiling is off
+_cprofile_stage = None  # name of the stage run under cProfile
+
+
+def profiled(function, file, cprofile_stage=None):
+    """
+    Runs function(file) with profiling on and writes the report of the file.
+    :param function: a script's main function, or a partial of it
+    :param file: the file
+    :param cprofile_stage: name of a stage to run under cProfile, None for none
+    :return: the result of function and the report
+    """
+    global _report, _cprofile_stage
+    _report = {"file": file, "stages": [], "counters": {}}
+    _cprofile_stage = cprofile_stage
+    start = time.perf_counter()
+    try:
+        result = function(file)
+        report = _report
+    finally:
+        _report = None
+    report["seconds"] = time.perf_counter() - start
+    report["peak RSS MB"] = peak_rss()
+    write_report(report, _report_name(file) + ".json")
+    return result, report
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Records a stage of the file being profiled.
+    :param name: name of the stage, i.e "parse"
+    :param rows_in: number of rows the stage takes
+    :return: a dictionary the stage can set "rows out" in
+    """
+    if _report is None:
+        yield {}
+        return
+    record = {"stage": name, "rows in": rows_in, "rows out": None}
+    profiler = cProfile.Profile() if name == _cprofile_stage else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record["seconds"] = time.perf_counter() - start
+        record["peak RSS MB"] = peak_rss()
+        if profiler is not None:
+            record["cprofile"] = _report_name(_report["file"]) + "." + name.replace(" ", "_") + ".prof"
+            os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+            profiler.dump_stats(record["cprofile"])
+        _report["stages"].append(record)
+
+
+def count(name, amount=1):
+    """
+    Adds amount to a counter of the file being profiled, i.e "RMC skipped: bad longitude".
+    """
+    if _report is not None and amount:
+        _report["counters"][name] = _report["counters"].get(name, 0) + int(amount)
+
+
+def peak_rss():
+    """
+    :return: the largest resident memory of this process so far in MB, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)  # bytes on macOS, KB elsewhere
+
+
+def write_batch_report(reports, seconds, name="batch.json"):
+    """
+    Writes the reports of every file of a batch with the totals of each stage and counter.
+    :param reports: list of reports returned by profiled
+    :param seconds: wall time of the whole batch
+    :return: the batch report
+    """
+    stages, counters = {}, {}
+    for report in reports:
+        for record in report["stages"]:
+            total = stages.setdefault(record["stage"], {"seconds": 0.0, "rows in": 0, "rows out": 0, "calls": 0})
+            total["seconds"] += record["seconds"]
+            total["rows in"] += record["rows in"] or 0
+            total["rows out"] += record["rows out"] or 0
+            total["calls"] += 1
+        for counter, amount in report["counters"].items():
+            counters[counter] = counters.get(counter, 0) + amount
+    peaks = [report["peak RSS MB"] for report in reports if report["peak RSS MB"] is not None]
+    batch = {"seconds": seconds, "files": len(reports), "peak RSS MB": max(peaks, default=None),
+             "stages": stages, "counters": counters, "reports": reports}
+    write_report(batch, os.path.join(PROFILE_DIRECTORY, name))
+    return batch
+
+
+def write_report(report, path):
+    """
+    Writes a report as JSON, creating PROFILE_DIRECTORY if needed.
+    """
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    with open(path, "w") as outfile:
+        json.dump(report, outfile, indent=1)
+
+
+def _report_name(file):
+    """
+    :return: path in PROFILE_DIRECTORY of the reports of a file, without extension, i.e
+        "Profiles/drive.txt.3f2a9c1e" for the drive.txt of one directory
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    return os.path.join(PROFILE_DIRECTORY, os.path.basename(file) + "." +
+                        hashlib.sha256(directory.encode()).hexdigest()[:8])
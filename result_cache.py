@@ -0,0 +1,127 @@
+"""
+On-disk cache of parsed tracks and results, so logs that have not changed are not processed again.
+
+Entries are keyed by the SHA-256 of the log's contents, the name of what is stored, the
+analysis parameters and the source code of this directory, so editing a threshold or the
+code itself never returns a stale result. Each entry is a pickle file in CACHE_DIRECTORY;
+when the directory grows past CACHE_SIZE the least recently used entries are deleted.
+"""
+import glob
+import hashlib
+import os
+import pickle
+from profiling import count
+
+CACHE_DIRECTORY = "Cache/"
+CACHE_SIZE = 1024 * 1024 * 1024  # bytes kept on disk before the least recently used entries are deleted
+READ_SIZE = 1024 * 1024  # bytes hashed at a time
+
+
+def cached(content_hash, name, parameters, function):
+    """
+    Returns the stored result for a log, or calls function and stores what it returns.
+    :param content_hash: file_hash of the log the result is computed from
+    :param name: what is stored, i.e "hazards"
+    :param parameters: dictionary of the settings the result depends on
+    :param function: function without arguments computing the result
+    :return: the result
+    """
+    key = cache_key(content_hash, name, parameters)
+    found, result = load(key)
+    count(f"cache {'hits' if found else 'misses'}: {name}")
+    if not found:
+        result = function()
+        store(key, result)
+    return result
+
+
+def file_hash(file):
+    """
+    :return: hex SHA-256 of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with open(file, "rb") as stream:
+        for block in iter(lambda: stream.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parameters_hash(parameters):
+    """
+    :return: hex SHA-256 of a dictionary of settings, recording what a result was computed with
+    """
+    return hashlib.sha256(repr(sorted(parameters.items())).encode()).hexdigest()
+
+
+def cache_key(content_hash, name, parameters):
+    """
+    :return: hex key of a result for the contents, parameters and current source code
+    """
+    description = repr((content_hash, name, sorted(parameters.items()), _code_hash()))
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def load(key):
+    """
+    :return: whether the key is in the cache, and its result
+    """
+    path = os.path.join(CACHE_DIRECTORY, key + ".pkl")
+    try:
+        with open(path, "rb") as stream:
+            result = pickle.load(stream)
+        os.utime(path)  # mark it as recently used
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False, None
+    return True, result
+
+
+def store(key, result):
+    """
+    Writes a result to the cache, then evicts entries if the cache is too large.
+    """
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    path = os.path.join(CACHE_DIRECTORY, key + ".pkl")
+    temporary = f"{path}.{os.getpid()}.tmp"  # renamed once complete so other processes never read half a file
+    with open(temporary, "wb") as stream:
+        pickle.dump(result, stream, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+    evict(CACHE_SIZE)
+
+
+def evict(max_size):
+    """
+    Deletes the least recently used entries until the cache holds at most max_size bytes.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIRECTORY, "*.pkl")):
+        try:
+            status = os.stat(path)
+        except OSError:  # deleted by another process
+            continue
+        entries.append((status.st_mtime, status.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+_code_digest = None
+
+
+def _code_hash():
+    """
+    :return: hex SHA-256 of the python files next to this one, computed once
+    """
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            with open(path, "rb") as stream:
+                digest.update(stream.read())
+        _code_digest = digest.hexdigest()
+    return _code_digest
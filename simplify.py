@@ -0,0 +1,123 @@
+"""
+Line simplification of routes, so long drives give small KML files that render quickly.
+
+Coordinates are projected to meters around the middle latitude of the line, which is
+accurate to well under a percent over the length of a drive. Douglas-Peucker keeps every
+point farther than the tolerance from the simplified line, and is run on all the open
+stretches of a line at once, one level of the recursion per pass. Visvalingam-Whyatt
+drops the points making the smallest triangles with their neighbours first, which keeps
+the shape of gentle curves better, but has to remove one point at a time.
+"""
+import heapq
+import numpy as np
+from spatial_dedup import EARTH_RADIUS
+
+METHODS = ["douglas-peucker", "visvalingam"]
+
+
+def simplify(longitudes, latitudes, tolerance, method="douglas-peucker"):
+    """
+    :param longitudes: array of longitudes in degrees
+    :param latitudes: array of latitudes in degrees
+    :param tolerance: largest distance in meters a point can be from the simplified line,
+        for visvalingam the square root of the smallest triangle area kept, 0 keeps every point
+    :param method: one of METHODS
+    :return: boolean array of the points kept, always including the first and last point
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown simplification method {method}, expected one of {', '.join(METHODS)}")
+    if tolerance <= 0 or len(longitudes) <= 2:
+        return np.ones(len(longitudes), dtype=bool)
+    x, y = project(longitudes, latitudes)
+    if method == "visvalingam":
+        return visvalingam(x, y, tolerance ** 2)
+    return douglas_peucker(x, y, tolerance)
+
+
+def project(longitudes, latitudes):
+    """
+    :return: x and y in meters of an equirectangular projection centered on the points
+    """
+    lambdas = np.radians(np.asarray(longitudes, dtype=float))
+    phis = np.radians(np.asarray(latitudes, dtype=float))
+    middle = (phis.min() + phis.max()) / 2
+    return EARTH_RADIUS * (lambdas - lambdas[0]) * np.cos(middle), EARTH_RADIUS * (phis - middle)
+
+
+def douglas_peucker(x, y, tolerance):
+    """
+    :param x: array of coordinates in meters
+    :param y: array of coordinates in meters
+    :param tolerance: largest distance in meters a point can be from the simplified line
+    :return: boolean array of the points kept
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+    starts, ends = np.array([0]), np.array([len(x) - 1])
+    while True:
+        inside = ends - starts - 1  # points strictly between the ends of each stretch
+        starts, ends, inside = starts[inside > 0], ends[inside > 0], inside[inside > 0]
+        if len(starts) == 0:
+            return keep
+        first = np.cumsum(inside) - inside  # position of each stretch's first point below
+        stretch = np.repeat(np.arange(len(starts)), inside)
+        points = starts[stretch] + 1 + np.arange(len(stretch)) - first[stretch]
+        distances = segment_distance(x[points], y[points], x[starts[stretch]], y[starts[stretch]],
+                                     x[ends[stretch]], y[ends[stretch]])
+        farthest = np.maximum.reduceat(distances, first)
+        # the first point of each stretch at its largest distance
+        candidates = np.flatnonzero(distances == farthest[stretch])
+        _, firsts = np.unique(stretch[candidates], return_index=True)
+        splits = points[candidates[firsts]]
+        split = farthest > tolerance
+        keep[splits[split]] = True
+        starts = np.concatenate((starts[split], splits[split]))
+        ends = np.concatenate((splits[split], ends[split]))
+
+
+def segment_distance(x, y, x1, y1, x2, y2):
+    """
+    :return: distance from the points (x, y) to the segments from (x1, y1) to (x2, y2)
+    """
+    dx, dy = x2 - x1, y2 - y1
+    squared_length = dx * dx + dy * dy
+    along = np.divide((x - x1) * dx + (y - y1) * dy, squared_length,
+                      out=np.zeros(len(x)), where=squared_length > 0)
+    along = np.clip(along, 0, 1)
+    return np.hypot(x - (x1 + along * dx), y - (y1 + along * dy))
+
+
+def visvalingam(x, y, min_area):
+    """
+    :param x: array of coordinates in meters
+    :param y: array of coordinates in meters
+    :param min_area: area in square meters of the smallest triangle kept
+    :return: boolean array of the points kept
+    """
+    count = len(x)
+    x, y = x.tolist(), y.tolist()
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    areas = [0.0] + [_triangle_area(x, y, i - 1, i, i + 1) for i in range(1, count - 1)] + [0.0]
+    heap = [(area, i) for i, area in enumerate(areas) if 0 < i < count - 1]
+    heapq.heapify(heap)
+    keep = np.ones(count, dtype=bool)
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:  # removed, or its area changed since it was pushed
+            continue
+        if area >= min_area:
+            break
+        keep[i] = False
+        before, after = previous[i], following[i]
+        following[before], previous[after] = after, before
+        for neighbour in (before, after):
+            if 0 < neighbour < count - 1:
+                # a point never gets less important than the points removed before it
+                areas[neighbour] = max(area, _triangle_area(x, y, previous[neighbour], neighbour, following[neighbour]))
+                heapq.heappush(heap, (areas[neighbour], neighbour))
+    return keep
+
+
+def _triangle_area(x, y, a, b, c):
+    return abs((x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a])) / 2
@@ -0,0 +1,120 @@
+"""
+Removes hazard points that are within a few meters of an earlier point.
+
+Points are hashed into a grid with cells at least one radius wide, wrapping around at the
+antimeridian, so a point only has to be compared with the points in its own and the 8
+neighbouring cells. Distances are computed for a whole cell at once with the haversine
+formula on a sphere; pairs whose spherical distance is too close to the radius to be sure
+of can be checked again with geopy's ellipsoidal distance, which is what the nested loops
+used before.
+"""
+import numpy as np
+from profiling import count
+
+EARTH_RADIUS = 6371008.8  # mean radius in meters
+TOLERANCE = 0.01  # the sphere is within 1% of the ellipsoid, pairs closer than that to the radius are uncertain
+EXACT_CHECK = True  # verify uncertain pairs with geopy.distance instead of trusting the sphere
+BLOCK_SIZE = 1 << 20  # largest number of distances computed at once
+NEIGHBOURS = [(y, x) for y in (-1, 0, 1) for x in (-1, 0, 1)]
+
+
+def remove_nearby_points(points, radius, earlier_points=None, exact=EXACT_CHECK):
+    """
+    Removes every point closer than radius meters to an earlier point, kept or not,
+    so multiple consecutive points where the car is not moving are removed.
+    :param points: list of [longitude, latitude]
+    :param radius: distance in meters
+    :param earlier_points: points from earlier chunks of the same file, extended with points
+    :param exact: check pairs near the radius with geopy.distance
+    :return: the remaining points
+    """
+    earlier_points = [] if earlier_points is None else earlier_points
+    if not points:
+        return []
+    coordinates = np.array(earlier_points + points, dtype=float).reshape(-1, 2)
+    near = nearby_mask(coordinates[:, 0], coordinates[:, 1], radius, len(earlier_points), exact)
+    earlier_points.extend(points)
+    return [point for point, remove in zip(points, near) if not remove]
+
+
+def nearby_mask(longitudes, latitudes, radius, start=0, exact=EXACT_CHECK):
+    """
+    Finds the points that have an earlier point closer than radius meters.
+    :param longitudes: array of longitudes in degrees
+    :param latitudes: array of latitudes in degrees
+    :param radius: distance in meters
+    :param start: points before start are only compared against, not checked
+    :param exact: check pairs near the radius with geopy.distance
+    :return: boolean array for the points from start on
+    """
+    near = np.zeros(len(longitudes) - start, dtype=bool)
+    if len(near) == 0:
+        return near
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    lambdas = np.radians(longitudes)
+    phis = np.radians(latitudes)
+    cell_size = radius * (1 + TOLERANCE) / EARTH_RADIUS  # in radians of latitude
+    # a longitude cell is at least one radius wide even at the highest latitude of the points,
+    # and the cells wrap around the globe so points either side of the antimeridian are neighbours
+    width = np.cos(min(np.abs(phis).max() + cell_size, np.pi / 2))
+    rows = np.floor(phis / cell_size).astype(np.int64)
+    columns_around = int(2 * np.pi * width / cell_size)
+    if columns_around >= 3:
+        columns = np.floor((lambdas + np.pi) * columns_around / (2 * np.pi)).astype(np.int64) % columns_around
+    else:  # too close to a pole for longitude cells to help
+        columns_around = 1
+        columns = np.zeros(len(longitudes), dtype=np.int64)
+
+    order = np.lexsort((columns, rows))
+    sorted_cells = np.stack((rows[order], columns[order]), axis=1)
+    boundaries = np.flatnonzero(np.any(sorted_cells[1:] != sorted_cells[:-1], axis=1)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(order)]))
+    cells = {(int(sorted_cells[begin, 0]), int(sorted_cells[begin, 1])): order[begin:end]
+             for begin, end in zip(starts, ends)}
+
+    for (row, column), members in cells.items():
+        checked = members[members >= start]
+        if len(checked) == 0:
+            continue
+        neighbours = {(row + y, (column + x) % columns_around) for y, x in NEIGHBOURS}
+        candidates = np.concatenate([cells[cell] for cell in neighbours if cell in cells])
+        block = max(1, BLOCK_SIZE // len(candidates))
+        for begin in range(0, len(checked), block):
+            points = checked[begin:begin + block]
+            near[points - start] = _has_earlier_neighbour(points, candidates, longitudes, latitudes,
+                                                          lambdas, phis, radius, exact)
+    return near
+
+
+def _has_earlier_neighbour(points, candidates, longitudes, latitudes, lambdas, phis, radius, exact):
+    """
+    :return: for each of points, whether one of the candidates before it is closer than radius
+    """
+    earlier = candidates[None, :] < points[:, None]
+    distances = haversine(lambdas[points, None], phis[points, None], lambdas[None, candidates], phis[None, candidates])
+    if not exact:
+        return np.any(earlier & (distances < radius), axis=1)
+    near = np.any(earlier & (distances < radius * (1 - TOLERANCE)), axis=1)
+    uncertain = earlier & (distances < radius * (1 + TOLERANCE))
+    pending = np.flatnonzero(~near & np.any(uncertain, axis=1))
+    if len(pending):
+        from geopy import distance  # slow to import and rarely needed
+    for idx in pending:
+        point = (latitudes[points[idx]], longitudes[points[idx]])
+        for other in candidates[uncertain[idx]]:
+            count("geopy distance calls")
+            if distance.distance(point, (latitudes[other], longitudes[other])).m < radius:
+                near[idx] = True
+                break
+    return near
+
+
+def haversine(longitude1, latitude1, longitude2, latitude2):
+    """
+    Great circle distance in meters between points given in radians.
+    """
+    a = (np.sin((latitude2 - latitude1) / 2) ** 2
+         + np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
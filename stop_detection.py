@@ -0,0 +1,163 @@
+"""
+Stop events: where a car slowed down, stood and drove off again, one event per stop.
+
+The fixes at or above the moving speed split the track into slow stretches, and so do gaps
+of more than MAX_GAP seconds. A stretch with a fix at or below the dwell speed is a stop:
+it decelerates until its first standing fix, dwells until its last one, creeping forward
+in between as in a queue at a light, then accelerates until it is moving again. The time
+spent at each dwell fix is the time until the next fix, so a 10 Hz receiver standing at a
+light counts as much as a 1 Hz one. The dwell fixes are counted in a grid of DWELL_CELL
+meters and the stop is placed at the middle of the fixes of the cell the car stood in the
+longest, which leaves out both the crawl of a queue and the drift of a standing receiver.
+Everything is a few passes over the speed and time columns, without a loop over the fixes.
+
+A track arriving in pieces is only classified up to the end of the last stretch, so a stop
+is never cut, except once it has stood longer than the longest stop: it is parking then,
+dropped whatever follows, and the rest of the stretch is dropped with it.
+"""
+import numpy as np
+from spatial_dedup import EARTH_RADIUS
+from turn_detection import MAX_GAP, TICKS_PER_SECOND, track_ticks
+
+DWELL_CELL = 10  # width in meters of the grid cells dwell fixes are counted in
+PHASES = ["moving", "decelerating", "dwelling", "accelerating"]
+
+
+def stop_phases(ticks, speeds, dwell_speed, moving_speed):
+    """
+    :param ticks: array of times, see turn_detection.track_ticks
+    :param speeds: array of speeds
+    :param dwell_speed: speed at or below which the car is standing
+    :param moving_speed: speed from which the car is moving
+    :return: dictionary of the "phase" of each fix, an index in PHASES, and of arrays of the
+        "start", "first dwell", "last dwell" and "end" fixes of each stop
+    """
+    speeds = np.asarray(speeds, dtype=float)
+    count = len(speeds)
+    if count == 0:
+        return {"phase": np.zeros(0, dtype=np.int64), **{name: np.zeros(0, dtype=np.int64) for name in
+                                                          ("start", "first dwell", "last dwell", "end")}}
+    moving = speeds >= moving_speed
+    dwelling = speeds <= dwell_speed
+    gap = np.concatenate(([True], np.diff(ticks) > MAX_GAP * TICKS_PER_SECOND))
+    starts = np.flatnonzero(gap | np.concatenate(([True], moving[:-1])))
+    fixes = np.arange(count)
+    first_dwell = np.minimum.reduceat(np.where(dwelling, fixes, count), starts)
+    last_dwell = np.maximum.reduceat(np.where(dwelling, fixes, -1), starts)
+    ends = np.concatenate((starts[1:], [count])) - 1
+    ends -= moving[ends]  # a stretch ends with the fix before the car is moving again
+    stops = first_dwell < count
+    events = {"start": starts[stops], "first dwell": first_dwell[stops], "last dwell": last_dwell[stops],
+              "end": ends[stops]}
+    # phases change at the start, first dwell and last dwell of each stop and after its end
+    changes = np.zeros(count + 1, dtype=np.int64)
+    np.add.at(changes, events["start"], 1)
+    np.add.at(changes, events["first dwell"], 1)
+    np.add.at(changes, events["last dwell"] + 1, 1)
+    np.add.at(changes, events["end"] + 1, -3)
+    return {"phase": np.cumsum(changes)[:count], **events}
+
+
+def stop_events(times, longitudes, latitudes, speeds, dwell_speed, moving_speed, durations, begin=0, end=None):
+    """
+    Finds the stops from begin to end.
+    :param times: array of UTC positions, hhmmss.ss
+    :param longitudes: array of longitudes in degrees
+    :param latitudes: array of latitudes in degrees
+    :param speeds: array of speeds
+    :param dwell_speed: speed at or below which the car is standing
+    :param moving_speed: speed from which the car is moving
+    :param durations: shortest and longest time in seconds a stop stands, longer is parking
+    :param begin: first fix, never inside a stop unless it is parking, see settled_stops
+    :param end: fix after the last, never inside a stop unless it is parking, None for every fix
+    :return: dictionary of arrays of the "start", "first dwell", "last dwell" and "end"
+        fixes of each stop, the "duration" it stood in seconds and its "longitude" and "latitude"
+    """
+    ticks = track_ticks(times)
+    end = len(ticks) if end is None else end
+    # the time at each fix, until the next one, is needed for the fixes of the slice only
+    waits = np.minimum(np.diff(ticks[begin:min(end + 1, len(ticks))]), MAX_GAP * TICKS_PER_SECOND)
+    waits = np.concatenate((waits, np.zeros(end - begin - len(waits), dtype=np.int64)))
+    speeds = np.asarray(speeds, dtype=float)
+    parked = _continues_stretch(ticks, speeds, moving_speed, begin)
+    speeds = speeds[begin:end]
+    events = stop_phases(ticks[begin:end], speeds, dwell_speed, moving_speed)
+    standing = (events.pop("phase") == PHASES.index("dwelling")) & (speeds <= dwell_speed)
+    durations_ticks = ticks[begin:end][events["last dwell"]] - ticks[begin:end][events["first dwell"]] \
+        + waits[events["last dwell"]]
+    longitude, latitude = _dwell_location(np.asarray(longitudes, dtype=float)[begin:end],
+                                          np.asarray(latitudes, dtype=float)[begin:end], standing, waits, events)
+    kept = ((durations_ticks >= durations[0] * TICKS_PER_SECOND) & (durations_ticks <= durations[1] * TICKS_PER_SECOND))
+    if parked:  # the rest of a parking settled_stops cut, already too long
+        kept &= events["start"] != 0
+    return {**{name: fixes[kept] + begin for name, fixes in events.items()},
+            "duration": durations_ticks[kept] / TICKS_PER_SECOND, "longitude": longitude[kept],
+            "latitude": latitude[kept]}
+
+
+def settled_stops(ticks, speeds, dwell_speed, moving_speed, max_duration, begin=0, end=None):
+    """
+    :param ticks: array of times, see turn_detection.track_ticks
+    :param speeds: array of speeds
+    :param dwell_speed: speed at or below which the car is standing
+    :param moving_speed: speed from which the car is moving
+    :param max_duration: longest time in seconds a stop stands, longer is parking
+    :param begin: first fix not classified yet
+    :param end: fix after the last one that could be classified otherwise, None for every fix
+    :return: number of fixes that can be classified without cutting a stop that later fixes
+        could extend, the last of them moving or followed by a gap, or standing for longer
+        than max_duration since the first standing fix of its stretch
+    """
+    end = len(ticks) if end is None else end
+    if end >= len(ticks):
+        return end
+    speeds = np.asarray(speeds, dtype=float)
+    cuts = np.flatnonzero((speeds[begin:end] >= moving_speed)
+                          | (np.diff(ticks[begin:end + 1]) > MAX_GAP * TICKS_PER_SECOND))
+    settled = begin + (int(cuts[-1]) + 1 if len(cuts) else 0)
+    if settled == begin and _continues_stretch(ticks, speeds, moving_speed, begin):
+        return end  # still parked since an earlier cut
+    # the last stretch, from settled to end, is parking from the first standing fix that ends
+    # more than max_duration after the first standing fix
+    dwell = np.flatnonzero(speeds[settled:end] <= dwell_speed) + settled
+    if len(dwell):
+        waits = np.minimum(ticks[dwell + 1] - ticks[dwell], MAX_GAP * TICKS_PER_SECOND)
+        parked = np.flatnonzero(ticks[dwell] - ticks[dwell[0]] + waits > max_duration * TICKS_PER_SECOND)
+        if len(parked):
+            return int(dwell[parked[0]]) + 1
+    return settled
+
+
+def _continues_stretch(ticks, speeds, moving_speed, begin):
+    """
+    :return: whether the fix at begin is in the same slow stretch as the one before it
+    """
+    return (0 < begin < len(ticks) and speeds[begin - 1] < moving_speed
+            and ticks[begin] - ticks[begin - 1] <= MAX_GAP * TICKS_PER_SECOND)
+
+
+def _dwell_location(longitudes, latitudes, standing, waits, events):
+    """
+    :return: longitude and latitude of each stop, the middle of its standing fixes in the
+        grid cell where it stood the longest
+    """
+    if len(events["start"]) == 0:
+        return np.zeros(0), np.zeros(0)
+    dwell = np.flatnonzero(standing)
+    stop = np.searchsorted(events["first dwell"], dwell, side="right") - 1
+    rows = np.floor(np.radians(latitudes[dwell]) * EARTH_RADIUS / DWELL_CELL)
+    columns = np.floor(np.radians(longitudes[dwell]) * EARTH_RADIUS * np.cos(np.radians(latitudes[dwell]))
+                       / DWELL_CELL)
+    cells, cell = np.unique(np.column_stack((stop, rows, columns)), axis=0, return_inverse=True)
+    cell = cell.reshape(-1)
+    wait = np.bincount(cell, waits[dwell].astype(float), len(cells))
+    # the first cell of each stop with the largest wait, cells are sorted by stop
+    firsts = np.flatnonzero(np.concatenate(([True], cells[1:, 0] != cells[:-1, 0])))
+    largest = np.maximum.reduceat(wait, firsts)
+    cell_stop = cells[:, 0].astype(np.int64)
+    candidates = np.flatnonzero(wait == largest[cell_stop])
+    _, first_candidates = np.unique(cell_stop[candidates], return_index=True)
+    chosen = candidates[first_candidates]
+    fixes = np.bincount(cell, minlength=len(cells))[chosen]
+    return (np.bincount(cell, longitudes[dwell], len(cells))[chosen] / fixes,
+            np.bincount(cell, latitudes[dwell], len(cells))[chosen] / fixes)
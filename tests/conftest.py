@@ -0,0 +1,46 @@
+"""
+The scripts are flat modules at the root of the repository, imported from there, and the
+fixtures shared by the tests: a seeded random generator and synthetic NMEA logs.
+"""
+import datetime
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nmea_generator import generate_nmea  # noqa: E402
+
+# synthetic logs, by name, with the generate_nmea arguments that make them
+LOGS = {"drive": {"duration": 1200.0, "dropout": 0.02, "outage_every": 400.0, "outage_length": 8.0},
+        "fast": {"duration": 300.0, "rate": 10.0, "order": "random", "stop_every": 100.0, "seed": 1},
+        "parked": {"duration": 1800.0, "stop_every": 600.0, "stop_length": 500.0, "seed": 2},
+        "parked fast": {"duration": 900.0, "rate": 10.0, "stop_every": 400.0, "stop_length": 320.0, "seed": 3},
+        "midnight": {"duration": 600.0, "start_time": datetime.datetime(2026, 3, 15, 23, 55, 0), "seed": 4}}
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(420)
+
+
+@pytest.fixture(scope="session")
+def logs(tmp_path_factory):
+    """
+    :return: the file of each synthetic log of LOGS, by name
+    """
+    directory = tmp_path_factory.mktemp("logs")
+    files = {}
+    for name, arguments in LOGS.items():
+        files[name] = str(directory / (name.replace(" ", "_") + ".txt"))
+        generate_nmea(files[name], **arguments)
+    return files
+
+
+@pytest.fixture(params=list(LOGS))
+def log(request, logs):
+    """
+    :return: the file of one synthetic log of LOGS, every test using it runs with each of them
+    """
+    return logs[request.param]
@@ -0,0 +1,47 @@
+"""
+run_batch returns the results in the order of the files whatever order the workers finish
+in, and reports and skips the files that fail.
+"""
+import os
+import time
+import pytest
+from batch_runner import list_files, run_batch
+
+
+def slow_length(file):
+    """
+    :return: the length of a file, taking longer for the files named first so workers finish out of order
+    """
+    with open(file) as stream:
+        text = stream.read()
+    if text == "fail":
+        raise ValueError(f"cannot read {os.path.basename(file)}")
+    time.sleep(0.05 * (5 - int(os.path.basename(file)[0])) / 5)
+    return len(text), os.getpid()
+
+
+@pytest.fixture
+def files(tmp_path):
+    directory = str(tmp_path) + "/"
+    for index in range(5):
+        with open(f"{directory}{index}.txt", "w") as stream:
+            stream.write("fail" if index == 2 else "x" * (index + 10))
+    os.mkdir(directory + "9 not a file")
+    return list_files(directory)
+
+
+def test_list_files(files):
+    assert [os.path.basename(file) for file in files] == [f"{index}.txt" for index in range(5)]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_results_in_the_order_of_the_files(files, workers, capsys):
+    results = run_batch(slow_length, files, workers)
+    assert [file for file, _ in results] == [files[0], files[1], files[3], files[4]]
+    assert [length for _, (length, _) in results] == [10, 11, 13, 14]
+    assert ({pid for _, (_, pid) in results} == {os.getpid()}) == (workers == 1)
+    assert capsys.readouterr().err == f"Skipping {files[2]}: ValueError: cannot read 2.txt\n"
+
+
+def test_no_files():
+    assert run_batch(slow_length, [], 4) == []
@@ -0,0 +1,59 @@
+"""
+Property tests of conversions: every vectorized conversion gives the same result as its
+scalar counterpart, element by element, on random values.
+"""
+import datetime
+import numpy as np
+import pytest
+from conversions import (degrees, utc_seconds, date_days, convert_speed, convert_coordinate, convert_time,
+                         SPEED_UNITS)
+
+SAMPLES = 100000
+
+
+def test_degrees_matches_convert_coordinate(rng):
+    whole_degrees = rng.integers(0, 181, SAMPLES)
+    minutes = _rounded(rng.uniform(0, 60, SAMPLES), rng.integers(0, 7, SAMPLES))
+    coordinates = (whole_degrees * 100 + minutes) * rng.choice([-1, 1], SAMPLES)
+    coordinates[:4] = [0.0, -0.5, 0.5, -18000.0]  # a negative coordinate under one minute keeps a positive sign
+    expected = [convert_coordinate(coordinate) for coordinate in coordinates.tolist()]
+    np.testing.assert_array_equal(degrees(coordinates), expected)
+
+
+def test_degrees_keeps_nan():
+    assert np.isnan(degrees(np.array([np.nan, 4200.0]))).tolist() == [True, False]
+
+
+def test_utc_seconds_matches_convert_time(rng):
+    seconds = _rounded(rng.uniform(0, 60, SAMPLES), rng.integers(0, 4, SAMPLES))
+    utc_times = rng.integers(0, 24, SAMPLES) * 10000 + rng.integers(0, 60, SAMPLES) * 100 + seconds
+    expected = [convert_time(utc_time) for utc_time in utc_times.tolist()]
+    np.testing.assert_array_equal(utc_seconds(utc_times), expected)
+
+
+def test_date_days_matches_datetime(rng):
+    epoch = datetime.date(1970, 1, 1)
+    first, last = datetime.date(1980, 1, 1).toordinal(), datetime.date(2079, 12, 31).toordinal()
+    dates = [datetime.date.fromordinal(ordinal) for ordinal in rng.integers(first, last + 1, SAMPLES).tolist()]
+    texts = np.array([date.strftime("%d%m%y").encode() for date in dates])
+    np.testing.assert_array_equal(date_days(texts), [(date - epoch).days for date in dates])
+
+
+def test_date_days_of_invalid_dates_is_nan():
+    dates = np.array([b"", b"1503", b"150326", b"320326", b"001326", b"150026", b"15a326", b"1503260"])
+    assert np.isnan(date_days(dates)).tolist() == [True, True, False, True, True, True, True, True]
+
+
+def test_convert_speed(rng):
+    knots = rng.uniform(0, 100, SAMPLES)
+    for unit, factor in SPEED_UNITS.items():
+        np.testing.assert_array_equal(convert_speed(knots, unit), [value * factor for value in knots.tolist()])
+    with pytest.raises(ValueError):
+        convert_speed(knots, "furlongs per fortnight")
+
+
+def _rounded(values, decimals):
+    """
+    :return: each value rounded to its own number of decimals, as receivers write them
+    """
+    return np.round(values * 10.0 ** decimals) / 10.0 ** decimals
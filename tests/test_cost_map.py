@@ -0,0 +1,152 @@
+"""
+CostMap counts every hazard in the cell holding it, replacing a drive gives the map built
+from scratch with its new hazards, and the map comes back the same from its .npz file and
+as the cells of its KML and GeoJSON exports.
+"""
+import json
+import numpy as np
+import pytest
+from lxml import etree
+from cost_map import CostMap, HAZARDS, INTENSITY_COLORS, write_geojson, write_kml
+from kml_writer import KML_NAMESPACE
+
+
+def random_hazards(rng, count, centre=(-76.5, 42.45), spread=0.01):
+    """
+    :return: lists of [longitude, latitude] of stops, left turns and right turns around a centre
+    """
+    return tuple((np.array(centre) + rng.normal(0.0, spread, (count, 2))).tolist() for _ in HAZARDS)
+
+
+def expected_counts(cost_map, drives):
+    """
+    :return: the sorted keys and counts of the cells of all the hazards of drives, counted one by one
+    """
+    counts = {}
+    for hazards in drives:
+        for kind, points in enumerate(hazards):
+            for longitude, latitude in points:
+                key = int(cost_map.cell_keys(np.array([longitude]), np.array([latitude]))[0])
+                counts.setdefault(key, [0] * len(HAZARDS))[kind] += 1
+    keys = sorted(counts)
+    return keys, [counts[key] for key in keys]
+
+
+def assert_same_map(cost_map, expected):
+    np.testing.assert_array_equal(cost_map.keys, expected.keys)
+    np.testing.assert_array_equal(cost_map.counts, expected.counts)
+
+
+def test_counts(rng):
+    drives = [random_hazards(rng, 200, spread=0.001) for _ in range(4)]
+    cost_map = CostMap()
+    for index, hazards in enumerate(drives):
+        assert cost_map.add_drive(f"drive{index}", *hazards, parameters="p")
+    keys, counts = expected_counts(cost_map, drives)
+    assert cost_map.keys.tolist() == keys
+    assert cost_map.counts.tolist() == counts
+    longitude, latitude = drives[0][0][0]
+    key = int(cost_map.cell_keys(np.array([longitude]), np.array([latitude]))[0])
+    assert cost_map.cell_counts(longitude, latitude) == counts[keys.index(key)]
+    assert cost_map.cell_counts(0.0, 0.0) == [0, 0, 0]
+
+
+def test_same_drive_again(rng):
+    hazards = random_hazards(rng, 50)
+    cost_map = CostMap()
+    cost_map.add_drive("drive", *hazards, parameters="p")
+    keys, counts = cost_map.keys.copy(), cost_map.counts.copy()
+    assert not cost_map.add_drive("drive", *random_hazards(rng, 50), parameters="p")
+    assert not cost_map.add_drive("drive", *random_hazards(rng, 50))
+    np.testing.assert_array_equal(cost_map.keys, keys)
+    np.testing.assert_array_equal(cost_map.counts, counts)
+
+
+@pytest.mark.parametrize("saved", [False, True])
+def test_replaced_drive_is_the_map_from_scratch(rng, tmp_path, saved):
+    first, second, replacement = (random_hazards(rng, 100, spread=0.002) for _ in range(3))
+    cost_map = CostMap()
+    cost_map.add_drive("first", *first, parameters="old")
+    cost_map.add_drive("second", *second, parameters="old")
+    if saved:
+        cost_map.save(str(tmp_path / "map.npz"))
+        cost_map = CostMap.load(str(tmp_path / "map.npz"))
+    assert cost_map.add_drive("first", *replacement, parameters="new")
+    from_scratch = CostMap()
+    from_scratch.add_drive("second", *second, parameters="old")
+    from_scratch.add_drive("first", *replacement, parameters="new")
+    assert_same_map(cost_map, from_scratch)
+    # replacing it by nothing leaves no empty cells
+    assert cost_map.add_drive("first", [], [], [], parameters="none")
+    only_second = CostMap()
+    only_second.add_drive("second", *second, parameters="old")
+    assert_same_map(cost_map, only_second)
+    assert cost_map.counts.any(axis=1).all()
+
+
+def test_save_and_load(rng, tmp_path):
+    cost_map = CostMap(cell_size=40)
+    cost_map.add_drive("first", *random_hazards(rng, 100), parameters="p")
+    cost_map.add_drive("second", *random_hazards(rng, 100))
+    cost_map.save(str(tmp_path / "map.npz"))
+    loaded = CostMap.load(str(tmp_path / "map.npz"))
+    assert loaded.cell_size == 40
+    assert loaded.drives == ["first", "second"]
+    assert loaded.drive_parameters == ["p", None]
+    assert_same_map(loaded, cost_map)
+    for name, column in cost_map.hazards.items():
+        np.testing.assert_array_equal(loaded.hazards[name], column)
+    assert CostMap.load(str(tmp_path / "missing.npz")).drives == []
+
+
+def test_cells_hold_their_points_and_boxes_their_cells(rng):
+    stops = random_hazards(rng, 500, centre=(150.0, -60.0), spread=0.003)[0]
+    cost_map = CostMap()
+    cost_map.add_points(stops, [], [])
+    points = np.array(stops)
+    west, south, east, north = cost_map.cell_bounds(cost_map.cell_keys(points[:, 0], points[:, 1]))
+    assert np.all((west <= points[:, 0]) & (points[:, 0] < east) & (south <= points[:, 1]) & (points[:, 1] < north))
+    box = (149.999, -60.002, 150.003, -59.999)
+    keys, counts = cost_map.cells_in(*box)
+    west, south, east, north = cost_map.cell_bounds(cost_map.keys)
+    overlapping = (west < box[2]) & (east > box[0]) & (south < box[3]) & (north > box[1])
+    np.testing.assert_array_equal(keys, cost_map.keys[overlapping])
+    np.testing.assert_array_equal(counts, cost_map.counts[overlapping])
+
+
+def test_exports(rng, tmp_path):
+    cost_map = CostMap()
+    cost_map.add_drive("drive", *random_hazards(rng, 300, spread=0.0005), parameters="p")
+    costs = cost_map.costs()
+    bounds = np.stack(cost_map.cell_bounds(cost_map.keys), axis=1)
+
+    write_kml(cost_map, str(tmp_path / "map.kml"))
+    document = etree.parse(str(tmp_path / "map.kml")).getroot()[0]
+    placemarks = document.findall(f"{{{KML_NAMESPACE}}}Placemark")
+    assert len(placemarks) == len(cost_map.keys)
+    assert [float(placemark.findtext(f"{{{KML_NAMESPACE}}}name")) for placemark in placemarks] == \
+        pytest.approx(costs.tolist(), rel=1e-5)
+    styles = {style.get("id") for style in document.findall(f"{{{KML_NAMESPACE}}}Style")}
+    assert styles == {f"cost{level}" for level in range(len(INTENSITY_COLORS))}
+    assert {placemark.findtext(f"{{{KML_NAMESPACE}}}styleUrl")[1:] for placemark in placemarks} <= styles
+    for placemark, (west, south, east, north) in zip(placemarks, bounds.tolist()):
+        ring = placemark.findtext(f".//{{{KML_NAMESPACE}}}coordinates")
+        corners = [[float(value) for value in corner.split(",")] for corner in ring.split()]
+        assert corners == [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+    write_geojson(cost_map, str(tmp_path / "map.geojson"))
+    with open(tmp_path / "map.geojson") as infile:
+        features = json.load(infile)["features"]
+    assert [feature["properties"]["cell"] for feature in features] == cost_map.keys.tolist()
+    assert [[feature["properties"][hazard] for hazard in HAZARDS] for feature in features] == \
+        cost_map.counts.tolist()
+    assert [feature["properties"]["cost"] for feature in features] == costs.tolist()
+    assert [feature["geometry"]["coordinates"][0][2] for feature in features] == bounds[:, 2:].tolist()
+
+
+def test_empty_exports(tmp_path):
+    write_kml(CostMap(), str(tmp_path / "map.kml"))
+    write_geojson(CostMap(), str(tmp_path / "map.geojson"))
+    assert etree.parse(str(tmp_path / "map.kml")).getroot()[0].findall(f"{{{KML_NAMESPACE}}}Placemark") == []
+    with open(tmp_path / "map.geojson") as infile:
+        assert json.load(infile) == {"type": "FeatureCollection", "features": []}
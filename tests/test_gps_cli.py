@@ -0,0 +1,134 @@
+"""
+gps_cli parses the options of each command, takes those not given from the settings of the
+scripts, and runs the commands like the scripts' main functions.
+"""
+import runpy
+import shutil
+import sys
+import zipfile
+import pytest
+from lxml import etree
+import GPS_to_CostMap
+import GPS_to_KML
+import gps_cli
+import result_cache
+from gps_cli import build_parser, main, settings_of, _script_defaults
+from kml_writer import KML_NAMESPACE
+
+SCRIPT_MODULES = [GPS_to_KML, GPS_to_CostMap, result_cache]
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch, tmp_path):
+    """
+    Restores the settings the commands configure, and runs them in an empty directory.
+    """
+    for module in SCRIPT_MODULES:
+        for name in dir(module):
+            if name.isupper():
+                monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.chdir(tmp_path)
+
+
+def parsed(argv):
+    arguments = build_parser().parse_args(argv)
+    _script_defaults(arguments)
+    return arguments
+
+
+def test_defaults_from_the_scripts(monkeypatch):
+    arguments = parsed(["batch"])
+    assert arguments.inputs == ["FILES_TO_WORK/"]
+    assert (arguments.stream, arguments.workers, arguments.cache, arguments.kmz) == (False, None, False, False)
+    assert (arguments.no_cost_map, arguments.no_hazard_store) == (True, True)
+    monkeypatch.setattr(GPS_to_KML, "KMZ_OUTPUT", True)
+    monkeypatch.setattr(GPS_to_KML, "WORKERS", 3)
+    monkeypatch.setattr(GPS_to_KML, "USE_CACHE", True)
+    monkeypatch.setattr(GPS_to_CostMap, "STREAMING", True)
+    monkeypatch.setattr(GPS_to_CostMap, "INPUT_DIRECTORY", "logs/")
+    arguments = parsed(["batch"])
+    assert arguments.inputs == ["FILES_TO_WORK/", "logs/"]
+    assert (arguments.stream, arguments.workers, arguments.cache, arguments.kmz) == (True, 3, False, True)
+    assert (parsed(["route"]).kmz, parsed(["route"]).cache) == (True, True)
+    assert (parsed(["hazards"]).kmz, parsed(["hazards"]).cache) == (False, False)
+    monkeypatch.setattr(GPS_to_CostMap, "UPDATE_COST_MAP", True)
+    arguments = parsed(["hazards"])
+    assert (arguments.no_cost_map, arguments.no_hazard_store) == (False, True)
+    arguments = parsed(["hazards", "--no-cost-map", "--hazard-store"])
+    assert (arguments.no_cost_map, arguments.no_hazard_store, arguments.hazard_store) == (True, False, "")
+    arguments = parsed(["batch", "drive.txt", "--no-kmz", "--cache", "--no-stream", "--workers", "2"])
+    assert arguments.inputs == ["drive.txt"]
+    assert (arguments.stream, arguments.workers, arguments.cache, arguments.kmz) == (False, 2, True, False)
+
+
+def test_settings_of_the_options():
+    arguments = build_parser().parse_args(["batch", "--route-output", "routes", "--simplify", "2",
+                                           "--turn-speeds", "5", "20", "--cache-dir", "cache"])
+    assert settings_of(arguments) == {"GPS_to_KML": {"OUTPUT_DIRECTORY": "routes/", "SIMPLIFY_TOLERANCE": 2.0},
+                                      "GPS_to_CostMap": {"TURN_SPEEDS": (5.0, 20.0)},
+                                      "result_cache": {"CACHE_DIRECTORY": "cache/"}}
+    assert settings_of(build_parser().parse_args(["route"])) == {"GPS_to_KML": {}, "GPS_to_CostMap": {},
+                                                                 "result_cache": {}}
+
+
+def test_route(logs, tmp_path):
+    assert main(["route", logs["drive"], "-o", "cli", "--workers", "1", "--cache"]) == 0
+    GPS_to_KML.OUTPUT_DIRECTORY = "script/"
+    GPS_to_KML.main(logs["drive"], cache=False)
+    assert (tmp_path / "cli" / "drive.kml").read_bytes() == (tmp_path / "script" / "drive.kml").read_bytes()
+    assert (tmp_path / "Cache").is_dir()
+
+
+def test_kmz_and_cache_from_the_settings(logs, tmp_path, monkeypatch):
+    monkeypatch.setattr(GPS_to_KML, "KMZ_OUTPUT", True)
+    monkeypatch.setattr(GPS_to_KML, "USE_CACHE", True)
+    assert main(["route", logs["drive"], "-o", "out", "--workers", "1"]) == 0
+    assert zipfile.ZipFile(tmp_path / "out" / "drive.kmz").namelist() == ["doc.kml"]
+    assert (tmp_path / "Cache").is_dir()
+    assert main(["route", logs["drive"], "-o", "out", "--workers", "1", "--no-kmz"]) == 0
+    assert (tmp_path / "out" / "drive.kml").exists()
+
+
+def test_hazards(logs, tmp_path):
+    assert main(["hazards", logs["drive"], logs["fast"], "-o", "out", "--workers", "1", "--no-cache",
+                 "--no-cost-map", "--no-hazard-store", "--stop-radius", "30"]) == 0
+    GPS_to_CostMap.STOP_RADIUS = 30
+    for name in ("drive", "fast"):
+        stops, left_turns, right_turns = GPS_to_CostMap.main(logs[name], cache=False)
+        document = etree.parse(str(tmp_path / "out" / f"{name}_Hazards.kml")).getroot()[0]
+        urls = [node.text for node in document.iter(f"{{{KML_NAMESPACE}}}styleUrl")]
+        assert urls == ["#stop"] * len(stops) + ["#left_turn"] * len(left_turns) + ["#right_turn"] * len(right_turns)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["out"]
+
+
+def test_script_writes_only_the_hazards(logs, tmp_path, monkeypatch):
+    (tmp_path / "FILES_TO_WORK").mkdir()
+    shutil.copy(logs["drive"], tmp_path / "FILES_TO_WORK" / "drive.txt")
+    monkeypatch.setattr(sys, "argv", ["GPS_to_CostMap.py"])
+    with pytest.raises(SystemExit) as exit_status:
+        runpy.run_path(GPS_to_CostMap.__file__, run_name="__main__")
+    assert exit_status.value.code == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["FILES_TO_WORK", "Output_CostMap"]
+    assert [path.name for path in (tmp_path / "Output_CostMap").iterdir()] == ["Example_Hazards.kml"]
+
+
+def test_cost_map_and_hazard_store_when_asked(logs, tmp_path, monkeypatch):
+    assert main(["hazards", logs["drive"], "-o", "out", "--workers", "1", "--cost-map", "cm.npz"]) == 0
+    assert (tmp_path / "cm.npz").exists() and (tmp_path / "out" / "Cost_Map.kml").exists()
+    assert not (tmp_path / "Hazard_Store").exists()
+    monkeypatch.setattr(GPS_to_CostMap, "UPDATE_HAZARD_STORE", True)
+    assert main(["hazards", logs["drive"], "-o", "out", "--workers", "1"]) == 0
+    assert (tmp_path / "Hazard_Store").is_dir() and (tmp_path / "out" / "Hazard_Tiles").is_dir()
+    assert not (tmp_path / "Cost_Map.npz").exists()
+
+
+def test_inputs(logs, tmp_path, capsys):
+    assert gps_cli.expand_inputs([logs["drive"], str(tmp_path / "missing*.txt"), logs["drive"]]) == [logs["drive"]]
+    assert "No files match" in capsys.readouterr().err
+    assert main(["route", str(tmp_path / "missing.txt")]) == 1
+    assert "No input files" in capsys.readouterr().err
+    broken = tmp_path / "broken.txt.gz"
+    broken.write_bytes(b"\x1f\x8b damaged")
+    assert main(["route", str(broken), logs["drive"], "-o", "out", "--workers", "1", "--no-cache"]) == 1
+    assert "Skipping" in capsys.readouterr().err
+    assert (tmp_path / "out" / "drive.kml").exists()
@@ -0,0 +1,42 @@
+"""
+Streaming gives what the whole log gives: the fixes iter_gps_data streams, the routes
+GPS_to_KML draws and the hazards GPS_to_CostMap finds, whatever the size of the chunks.
+"""
+import os
+import pandas as pd
+import pytest
+import GPS_to_CostMap
+import GPS_to_KML
+from gps_stream import iter_gps_data
+from gps_track import Track
+
+CHUNK_SIZES = [4096, 65537]
+
+
+@pytest.mark.parametrize("drop_poor_fixes", [False, True])
+def test_streamed_fixes(log, drop_poor_fixes):
+    whole = Track(log, False).frame(drop_poor_fixes)
+    for chunk_size in CHUNK_SIZES:
+        pd.testing.assert_frame_equal(pd.concat(list(iter_gps_data(log, drop_poor_fixes, chunk_size))), whole)
+
+
+def test_streamed_route(log, tmp_path, monkeypatch):
+    routes = []
+    for stream, chunk_size in [(False, None)] + [(True, chunk_size) for chunk_size in CHUNK_SIZES]:
+        directory = tmp_path / f"chunks_{chunk_size}"
+        monkeypatch.setattr(GPS_to_KML, "OUTPUT_DIRECTORY", str(directory) + "/")
+        frames = iter_gps_data(log, True, chunk_size) if stream else None
+        GPS_to_KML.main(log, stream, False, False, frames=frames)
+        routes.append((directory / os.path.basename(log).replace(".txt", ".kml")).read_bytes())
+    assert all(route == routes[0] for route in routes[1:])
+
+
+def test_streamed_hazards(log):
+    whole = GPS_to_CostMap.main(log, False, False)
+    assert any(whole)
+    for chunk_size in CHUNK_SIZES:
+        streamed = [], [], []
+        for found in GPS_to_CostMap.stream_hazards(log, chunk_size):
+            for hazards, new in zip(streamed, found):
+                hazards += new
+        assert streamed == tuple(whole)
@@ -0,0 +1,36 @@
+"""
+Turn and stop detection: the same drive gives the same hazards at any sample rate, and
+detect_hazards gives the hazards of the whole track however the track is cut into pieces.
+"""
+import numpy as np
+import pytest
+import GPS_to_CostMap
+from gps_track import Track
+from nmea_generator import generate_nmea
+
+
+
+def test_pieces_give_the_whole_track(log, rng):
+    whole = GPS_to_CostMap.main(log, False, False)
+    GPSData = Track(log, False).frame()
+    columns = {name: GPSData[name].values for name in GPS_to_CostMap.HAZARD_COLUMNS}
+    for pieces in (1, 7, 200, len(GPSData) // 3):
+        cuts = np.sort(rng.integers(0, len(GPSData), pieces - 1))
+        frames = [{name: column[start:end] for name, column in columns.items()}
+                  for start, end in zip(np.r_[0, cuts], np.r_[cuts, len(GPSData)])]
+        found = [], [], []
+        for new in GPS_to_CostMap.detect_hazards(frames):
+            for hazards, points in zip(found, new):
+                hazards += points
+        assert found == tuple(whole), pieces
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_same_hazards_at_every_rate(tmp_path, seed):
+    counts = []
+    for rate in (1.0, 5.0, 10.0):
+        file = str(tmp_path / f"rate_{rate}.txt")
+        generate_nmea(file, duration=1200.0, rate=rate, seed=seed)
+        counts.append([len(hazards) for hazards in GPS_to_CostMap.main(file, False, False)])
+    assert counts[0] == counts[1] == counts[2]
+    assert all(counts[0])
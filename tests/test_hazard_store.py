@@ -0,0 +1,197 @@
+"""
+HazardStore puts every hazard in the tile of its quadkey, merges drives into the tiles
+they share, replaces a drive like a store built from scratch with its new hazards, reads
+regions back like a filter of every hazard, and write_tiles exports a KML file per tile
+under a root of network links.
+"""
+import json
+import os
+import numpy as np
+import pytest
+from lxml import etree
+from hazard_store import (HazardStore, HAZARDS, INDEX_FILE, hazard_lists, quadkey, tile_coordinates, tile_position,
+                          write_tiles)
+from kml_writer import KML_NAMESPACE
+from spatial_dedup import haversine
+
+
+def random_hazards(rng, count, centre=(-76.5, 42.45), spread=0.03):
+    """
+    :return: lists of [longitude, latitude] of stops, left turns and right turns around a centre
+    """
+    hazards = []
+    for _ in HAZARDS:
+        points = np.array(centre) + rng.normal(0.0, spread, (count, 2))
+        points[:, 0] = (points[:, 0] + 180.0) % 360.0 - 180.0
+        hazards.append(points.tolist())
+    return tuple(hazards)
+
+
+def all_hazards(store):
+    """
+    :return: sorted (quadkey, longitude, latitude, kind, drive name) of every saved hazard
+    """
+    found = []
+    for key in store.tiles:
+        columns = store.tile(key)
+        found += [(key, longitude, latitude, kind, store.drives[drive]) for longitude, latitude, kind, drive in
+                  zip(*(columns[name].tolist() for name in ("longitude", "latitude", "kind", "drive")))]
+    return sorted(found)
+
+
+def expected_hazards(drives, zoom):
+    """
+    :return: what all_hazards gives for drives, by name, bucketed one hazard at a time
+    """
+    found = []
+    for name, hazards in drives.items():
+        for kind, points in enumerate(hazards):
+            for longitude, latitude in points:
+                x, y = tile_coordinates(np.array([longitude]), np.array([latitude]), zoom)
+                found.append((quadkey(int(x[0]), int(y[0]), zoom), longitude, latitude, kind, name))
+    return sorted(found)
+
+
+def test_quadkeys():
+    assert quadkey(3, 5, 3) == "213"
+    assert tile_position("213") == (3, 5)
+    for x, y in [(0, 0), (8191, 0), (4660, 6020), (16383, 16383)]:
+        assert tile_position(quadkey(x, y, 14)) == (x, y)
+
+
+def test_tiles_hold_their_hazards_and_parents_prefix_them(rng, tmp_path):
+    drives = {"first": random_hazards(rng, 200), "second": random_hazards(rng, 200, centre=(179.99, -45.0))}
+    store = HazardStore(str(tmp_path / "store"))
+    for name, hazards in drives.items():
+        assert store.add_drive(name, *hazards, parameters="p")
+    written = store.save()
+    assert sorted(written) == sorted(store.tiles)
+    assert all_hazards(store) == expected_hazards(drives, store.zoom)
+    for key in store.tiles:
+        west, south, east, north = store.tile_bounds(key)
+        columns = store.tile(key)
+        assert np.all((west <= columns["longitude"]) & (columns["longitude"] <= east)
+                      & (south <= columns["latitude"]) & (columns["latitude"] <= north))
+        assert store.tiles[key] == len(columns["kind"])
+        x, y = tile_coordinates(columns["longitude"], columns["latitude"], store.zoom - 3)
+        assert {quadkey(tile_x, tile_y, store.zoom - 3) for tile_x, tile_y in zip(x.tolist(), y.tolist())} == \
+            {key[:-3]}
+
+
+def test_merged_drives_only_rewrite_their_tiles(rng, tmp_path):
+    store = HazardStore(str(tmp_path / "store"))
+    first = random_hazards(rng, 300)
+    store.add_drive("first", *first, parameters="p")
+    store.save()
+    second = random_hazards(rng, 5, spread=0.001)
+    store = HazardStore.open(str(tmp_path / "store"))
+    store.add_drive("second", *second, parameters="p")
+    written = store.save()
+    assert 0 < len(written) < len(store.tiles)
+    assert set(written) == {key for key, *_ in expected_hazards({"second": second}, store.zoom)}
+    assert all_hazards(HazardStore.open(str(tmp_path / "store"))) == \
+        expected_hazards({"first": first, "second": second}, store.zoom)
+    assert not store.add_drive("second", *second, parameters="p")
+    assert not store.add_drive("first", *second)
+    assert store.save() == []
+
+
+@pytest.mark.parametrize("saved", [False, True])
+def test_replaced_drive_is_the_store_from_scratch(rng, tmp_path, saved):
+    first, second = random_hazards(rng, 100), random_hazards(rng, 100)
+    replacement = random_hazards(rng, 20, centre=(-76.0, 42.0), spread=0.005)
+    store = HazardStore(str(tmp_path / "store"))
+    store.add_drive("first", *first, parameters="old")
+    store.add_drive("second", *second, parameters="old")
+    if saved:
+        store.save()
+        store = HazardStore.open(str(tmp_path / "store"))
+    assert store.add_drive("first", *replacement, parameters="new")
+    store.save()
+    from_scratch = HazardStore(str(tmp_path / "scratch"))
+    from_scratch.add_drive("second", *second, parameters="old")
+    from_scratch.add_drive("first", *replacement, parameters="new")
+    from_scratch.save()
+    assert all_hazards(store) == all_hazards(from_scratch)
+    assert store.tiles == from_scratch.tiles
+    # the tiles only the replaced hazards were in are gone
+    assert sorted(name[:-len(".npz")] for name in os.listdir(tmp_path / "store") if name.endswith(".npz")) == \
+        sorted(store.tiles)
+
+
+def test_index(rng, tmp_path):
+    store = HazardStore(str(tmp_path / "store"), zoom=12)
+    store.add_drive("first", *random_hazards(rng, 50), parameters="p")
+    store.add_drive("second", *random_hazards(rng, 50))
+    store.save()
+    with open(tmp_path / "store" / INDEX_FILE) as infile:
+        index = json.load(infile)
+    assert index["zoom"] == 12 and index["drives"] == ["first", "second"]
+    assert index["drive parameters"] == ["p", None]
+    opened = HazardStore.open(str(tmp_path / "store"))
+    assert (opened.zoom, opened.tiles, opened.drives, opened.drive_tiles) == \
+        (12, store.tiles, store.drives, store.drive_tiles)
+    assert HazardStore.open(str(tmp_path / "missing")).tiles == {}
+
+
+def test_regions(rng, tmp_path):
+    drives = {"first": random_hazards(rng, 300), "second": random_hazards(rng, 300)}
+    store = HazardStore(str(tmp_path / "store"))
+    for name, hazards in drives.items():
+        store.add_drive(name, *hazards)
+    store.save()
+    tiles = [store.tile(key) for key in store.tiles]
+    every = {name: np.concatenate([columns[name] for columns in tiles]) for name in tiles[0]}
+    box = (-76.52, 42.43, -76.47, 42.47)
+    found = store.hazards_in(*box)
+    inside = ((every["longitude"] >= box[0]) & (every["longitude"] <= box[2])
+              & (every["latitude"] >= box[1]) & (every["latitude"] <= box[3]))
+    assert 0 < np.count_nonzero(inside) < len(inside)
+    assert sorted(zip(found["longitude"].tolist(), found["latitude"].tolist())) == \
+        sorted(zip(every["longitude"][inside].tolist(), every["latitude"][inside].tolist()))
+    assert len(store.tiles_in(*box)) < len(store.tiles)
+    near = store.hazards_near(-76.5, 42.45, 1500.0)
+    distances = haversine(np.radians(-76.5), np.radians(42.45), np.radians(every["longitude"]),
+                          np.radians(every["latitude"]))
+    assert sorted(near["longitude"].tolist()) == sorted(every["longitude"][distances <= 1500.0].tolist())
+    assert 0 < len(near["longitude"])
+
+
+@pytest.mark.parametrize("kmz", [False, True])
+def test_write_tiles(rng, tmp_path, kmz):
+    store = HazardStore(str(tmp_path / "store"))
+    store.add_drive("first", *random_hazards(rng, 100))
+    store.save()
+    extension = ".kmz" if kmz else ".kml"
+    root = write_tiles(store, str(tmp_path / "tiles"), kmz=kmz)
+    assert root == str(tmp_path / "tiles") + extension
+    assert sorted(os.listdir(tmp_path / "tiles")) == sorted(key + extension for key in store.tiles)
+    if kmz:
+        return
+    links = etree.parse(root).getroot()[0].findall(f"{{{KML_NAMESPACE}}}NetworkLink")
+    assert [link.findtext(f"{{{KML_NAMESPACE}}}name") for link in links] == sorted(store.tiles)
+    for link in links:
+        key = link.findtext(f"{{{KML_NAMESPACE}}}name")
+        assert link.findtext(f".//{{{KML_NAMESPACE}}}href") == f"tiles/{key}.kml"
+        box = [float(link.findtext(f".//{{{KML_NAMESPACE}}}{edge}")) for edge in ("west", "south", "east", "north")]
+        assert box == pytest.approx(store.tile_bounds(key))
+        placemarks = etree.parse(str(tmp_path / "tiles" / f"{key}.kml")).getroot()[0].findall(
+            f"{{{KML_NAMESPACE}}}Placemark")
+        stops, left_turns, right_turns = hazard_lists(store.tile(key))
+        assert [placemark.findtext(f"{{{KML_NAMESPACE}}}styleUrl") for placemark in placemarks] == \
+            ["#stop"] * len(stops) + ["#left_turn"] * len(left_turns) + ["#right_turn"] * len(right_turns)
+
+
+def test_write_only_the_tiles_written(rng, tmp_path):
+    store = HazardStore(str(tmp_path / "store"))
+    store.add_drive("first", *random_hazards(rng, 100))
+    write_tiles(store, str(tmp_path / "tiles"), store.save())
+    store.add_drive("second", *random_hazards(rng, 2, spread=0.001))
+    written = store.save()
+    before = {name: os.stat(tmp_path / "tiles" / name).st_mtime_ns for name in os.listdir(tmp_path / "tiles")}
+    os.utime(tmp_path / "tiles", ns=(0, 0))
+    for name in before:
+        os.utime(tmp_path / "tiles" / name, ns=(0, 0))
+    write_tiles(store, str(tmp_path / "tiles"), written)
+    rewritten = {name for name in os.listdir(tmp_path / "tiles") if os.stat(tmp_path / "tiles" / name).st_mtime_ns}
+    assert rewritten == {key + ".kml" for key in written}
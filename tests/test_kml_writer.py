@@ -0,0 +1,87 @@
+"""
+kml_file writes the document a whole pykml tree of the same elements would give, declaring
+the KML namespace once, with the shared styles before the placemarks referring to them,
+and as the doc.kml of a zip archive for a KMZ.
+"""
+import zipfile
+from lxml import etree
+from pykml.factory import GX_ElementMaker as GX, KML_ElementMaker as KML
+from kml_writer import KML_NAMESPACE, kml_file, shared_style, style_url
+
+GX_NAMESPACE = "http://www.google.com/kml/ext/2.2"
+STYLES = [shared_style("stop", KML.IconStyle(KML.color("ff780078"))),
+          shared_style("route", KML.LineStyle(KML.color("ff0000ff"), KML.width(3)))]
+
+
+def placemarks():
+    """
+    :return: the elements appended to the documents, built anew as appending changes them
+    """
+    return [KML.Placemark(KML.description("Stop"), style_url("stop"), KML.Point(KML.coordinates("-76.5,42.4,0.0"))),
+            KML.Folder(KML.Placemark(style_url("route"), KML.LineString(KML.coordinates("-76.5,42.4,0.0\n")))),
+            KML.Placemark(GX.Track(KML.when("2026-03-15T12:00:00Z"), GX.coord("-76.5 42.4 0")))]
+
+
+def structure(tree):
+    """
+    :return: the tag, attributes and text of every element, which serializations may not change
+    """
+    return [(node.tag, dict(node.attrib), (node.text or "").strip()) for node in tree.iter()]
+
+
+def write(filename, kmz=False):
+    with kml_file(filename, STYLES, kmz) as document:
+        for element in placemarks():
+            document.append(element)
+
+
+def test_same_document_as_a_tree(tmp_path):
+    filename = str(tmp_path / "hazards.kml")
+    write(filename)
+    written = etree.parse(filename)
+    expected = KML.kml(KML.Document(*STYLES, *placemarks()))
+    assert structure(written) == structure(expected)
+
+
+def test_namespaces_declared_once(tmp_path):
+    filename = tmp_path / "hazards.kml"
+    write(str(filename))
+    text = filename.read_bytes()
+    assert text.count(f'xmlns="{KML_NAMESPACE}"'.encode()) == 1
+    assert b"ns0:" not in text and b"kml:" not in text
+    tree = etree.parse(str(filename))
+    assert {etree.QName(node).namespace for node in tree.iter()} == {KML_NAMESPACE, GX_NAMESPACE}
+    assert [etree.QName(node).localname for node in tree.iter(f"{{{GX_NAMESPACE}}}*")] == ["Track", "coord"]
+
+
+def test_shared_styles(tmp_path):
+    filename = str(tmp_path / "hazards.kml")
+    write(filename)
+    document = etree.parse(filename).getroot()[0]
+    style_ids = [node.get("id") for node in document if etree.QName(node).localname == "Style"]
+    assert style_ids == ["stop", "route"]
+    assert all(etree.QName(node).localname == "Style" for node in document[:len(style_ids)])
+    urls = [node.text for node in document.iter(f"{{{KML_NAMESPACE}}}styleUrl")]
+    assert urls == ["#stop", "#route"]
+    assert {url[1:] for url in urls} <= set(style_ids)
+    # the styles are copied, so the same ones can be written to the next file
+    assert all(etree.QName(style).namespace == KML_NAMESPACE for style in STYLES)
+
+
+def test_kmz_holds_the_document(tmp_path):
+    write(str(tmp_path / "hazards.kml"))
+    write(str(tmp_path / "hazards.kmz"), kmz=True)
+    with zipfile.ZipFile(tmp_path / "hazards.kmz") as archive:
+        assert archive.namelist() == ["doc.kml"]
+        assert archive.getinfo("doc.kml").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.testzip() is None
+        text = archive.read("doc.kml")
+    assert text == (tmp_path / "hazards.kml").read_bytes()
+    assert etree.QName(etree.fromstring(text)).text == f"{{{KML_NAMESPACE}}}kml"
+
+
+def test_no_placemarks(tmp_path):
+    filename = str(tmp_path / "empty.kml")
+    with kml_file(filename):
+        pass
+    assert structure(etree.parse(filename)) == structure(KML.kml(KML.Document()))
@@ -0,0 +1,123 @@
+"""
+The live server finds the hazards GPS_to_CostMap.main finds in the whole log of each
+vehicle, however the bytes of the vehicles arrive and interleave, and keeps its event loop
+responsive while it classifies a thousand vehicles.
+"""
+import asyncio
+import time
+import pytest
+import GPS_to_CostMap
+import live_server
+from live_server import NMEAServer
+
+DATAGRAM_SIZE = 1400  # bytes of whole lines sent in a UDP datagram
+LOAD_VEHICLES = 1000  # vehicles sending at once in the load test
+LOAD_LINES = 20  # lines each of them sends per flush
+
+
+
+def collector():
+    """
+    :return: the hazards found by vehicle, and the on_hazards function of an NMEAServer adding to them
+    """
+    found = {}
+
+    def on_hazards(vehicle, stops, left_turns, right_turns):
+        for hazards, new in zip(found.setdefault(vehicle, ([], [], [])), (stops, left_turns, right_turns)):
+            hazards += new
+    return found, on_hazards
+
+
+def test_interleaved_vehicles(logs, rng):
+    found, on_hazards = collector()
+    server = NMEAServer(on_hazards)
+    data = {vehicle: open(file, "rb").read() for vehicle, file in logs.items()}
+    sent = dict.fromkeys(data, 0)
+    while sent:
+        vehicle = list(sent)[rng.integers(0, len(sent))]
+        end = min(sent[vehicle] + int(rng.integers(1, 20000)), len(data[vehicle]))
+        server.receive(vehicle, data[vehicle][sent[vehicle]:end])
+        sent[vehicle] = end
+        if end == len(data[vehicle]):
+            del sent[vehicle]
+        if rng.random() < 0.3:
+            server.flush()
+    for vehicle in logs:
+        server.finish(vehicle)
+    for vehicle, file in logs.items():
+        assert found.get(vehicle, ([], [], [])) == tuple(GPS_to_CostMap.main(file, False, False)), vehicle
+
+
+def test_sockets(logs, monkeypatch):
+    monkeypatch.setattr(live_server, "FLUSH_INTERVAL", 0.01)
+    found, on_hazards = collector()
+
+    async def send():
+        server = NMEAServer(on_hazards)
+        started = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(server.run("127.0.0.1", 0, 0, started))
+        tcp_port, udp_port = await started
+        _, writer = await asyncio.open_connection("127.0.0.1", tcp_port)
+        writer.write(open(logs["drive"], "rb").read())
+        await writer.drain()
+        writer.close()
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=("127.0.0.1", udp_port))
+        datagram = b""
+        for line in open(logs["fast"], "rb"):
+            if len(datagram) + len(line) > DATAGRAM_SIZE:
+                transport.sendto(datagram)
+                datagram = b""
+                await asyncio.sleep(0)  # the server shares the loop, so it reads before the socket fills up
+            datagram += line
+        transport.sendto(datagram)
+        await asyncio.sleep(0.2)
+        transport.close()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(send())
+    assert sorted(vehicle.split(":")[0] for vehicle in found) == ["tcp", "udp"]
+    for vehicle, hazards in found.items():
+        file = logs["drive"] if vehicle.startswith("tcp") else logs["fast"]
+        assert hazards == tuple(GPS_to_CostMap.main(file, False, False)), vehicle
+
+
+def test_loop_responsive_while_classifying(logs, monkeypatch):
+    monkeypatch.setattr(live_server, "FLUSH_INTERVAL", 0.01)
+    lines = open(logs["drive"], "rb").read().splitlines(keepends=True)
+    durations = []
+    classify = live_server._classify
+
+    def timed_classify(updates, finished):
+        start = time.perf_counter()
+        found = classify(updates, finished)
+        if updates:
+            durations.append(time.perf_counter() - start)
+        return found
+    monkeypatch.setattr(live_server, "_classify", timed_classify)
+
+    async def serve():
+        server = NMEAServer(lambda *hazards: None)
+        started = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(server.run("127.0.0.1", None, None, started))
+        await started
+        lags = []
+        for start in range(0, len(lines), LOAD_LINES):
+            for vehicle in range(LOAD_VEHICLES):
+                server.receive(f"load:{vehicle}", b"".join(lines[start:start + LOAD_LINES]))
+            while len(durations) <= start // LOAD_LINES:  # until the worker has classified these lines
+                before = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - before - 0.005)
+            if len(durations) == 3:
+                break
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return lags
+
+    lags = asyncio.run(serve())
+    # the loop waits a few switch intervals of the interpreter, not the whole classification
+    assert max(lags) < max(durations) / 4, (max(lags), max(durations))
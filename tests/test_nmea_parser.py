@@ -0,0 +1,218 @@
+"""
+Regression tests of the NMEA parser: the numbers of _decimal_numbers against float(),
+including the fields with more digits than it decodes exactly, the
+checksums of _Sentences.checksum_valid, sentences from any talker with the VTG and GSA
+sentences of their epoch, and blocks parsed one at a time giving the same columns as a
+whole log.
+"""
+import re
+from functools import reduce
+import numpy as np
+import pytest
+import nmea_parser
+import GPS_to_CostMap
+from nmea_parser import parse_nmea, parse_nmea_blocks, read_nmea, EXACT_DIGITS, FIX_COLUMNS
+from nmea_generator import generate_nmea
+
+NUMBER = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)")
+CHECKED = re.compile(r"\$([^*]*)\*([0-9A-Fa-f]{2})")
+# ways of damaging a sentence, see damaged
+DAMAGES = ["none", "digit", "checksum", "lowercase", "no checksum", "one hex digit", "not hex", "carriage return"]
+
+
+def sentence(body):
+    """
+    :return: a line of NMEA with the checksum of its body
+    """
+    return f"${body}*{reduce(lambda x, y: x ^ y, body.encode(), 0):02X}\n"
+
+
+def rmc_log(speeds):
+    """
+    :return: a log of RMC sentences with the speed fields given, the only column that differs
+    """
+    return "".join(sentence(f"GPRMC,120000.00,A,4200.0000,N,07600.0000,W,{speed},90.0,150326,,,A")
+                   for speed in speeds).encode()
+
+
+def expected_number(text):
+    """
+    :return: float of a field made of digits around an optional point, NaN otherwise
+    """
+    return float(text) if NUMBER.fullmatch(text) else np.nan
+
+
+def random_numbers(rng, count, layouts):
+    """
+    :return: texts of numbers with the given number of (whole, fraction) digits, a fraction of 0
+        digits has no point and one of -1 digits ends with it
+    """
+    texts = []
+    for whole, fraction in (layouts[index] for index in rng.integers(0, len(layouts), count)):
+        digits = "".join(rng.choice(list("0123456789"), whole + max(fraction, 0)))
+        texts.append(digits[:whole] + ("." if fraction else "") + digits[whole:])
+    return texts
+
+
+def decoded_speeds(texts):
+    _, GPRMC = parse_nmea(rmc_log(texts))
+    return GPRMC["speed over ground in knots"]
+
+
+def test_numbers_of_one_layout(rng):
+    texts = random_numbers(rng, 10000, [(3, 2)])
+    np.testing.assert_array_equal(decoded_speeds(texts), [float(text) for text in texts])
+
+
+@pytest.mark.parametrize("layout", [(1, 0), (8, 0), (0, 8), (8, 8), (5, 3), (2, -1), (1, 7), (7, 1)])
+def test_every_layout(rng, layout):
+    texts = random_numbers(rng, 1000, [layout])
+    np.testing.assert_array_equal(decoded_speeds(texts), [float(text) for text in texts])
+
+
+def test_mixed_layouts(rng):
+    layouts = [(whole, fraction) for whole in range(1, 9) for fraction in range(-1, 9)]
+    texts = random_numbers(rng, 10000, layouts)
+    np.testing.assert_array_equal(decoded_speeds(texts), [float(text) for text in texts])
+
+
+def test_numbers_with_more_digits_than_exact(rng):
+    texts = random_numbers(rng, 100, [(9, 2), (2, 9), (8, 8), (12, 6), (EXACT_DIGITS, 0), (EXACT_DIGITS, 1)])
+    np.testing.assert_array_equal(decoded_speeds(texts), [float(text) for text in texts])
+
+
+def test_signs_empty_fields_and_text_among_numbers(rng):
+    texts = random_numbers(rng, 1000, [(2, 1)])
+    odd = ["", "-12.5", "+12.5", "1.2.3", "abc", "12a.5", "1e5", "-", "12.", ".5", ".", "99999999.99999999",
+           "1234567890123.5", "12345678901234567.5", "1.2.3456789012345678", "-0.0", "12.50", " 12.5"]
+    positions = rng.choice(len(texts), len(odd), replace=False)
+    for position, text in zip(positions.tolist(), odd):
+        texts[position] = text
+    np.testing.assert_array_equal(decoded_speeds(texts), [expected_number(text) for text in texts])
+
+
+@pytest.mark.parametrize("first", ["N/A", ".", "-", ""])
+def test_first_row_not_a_number(rng, first):
+    texts = [first] + random_numbers(rng, 100, [(2, 1)]) + [".", "1"]
+    np.testing.assert_array_equal(decoded_speeds(texts), [expected_number(text) for text in texts])
+
+
+def damaged(line, damage, rng):
+    """
+    :return: a sentence with a valid checksum damaged in one of DAMAGES
+    """
+    body, checksum = line.rstrip("\n").split("*")
+    if damage == "digit":  # another digit in the speed field, still a well formed sentence
+        position = body.index(",W,") + 3 + int(rng.integers(0, body[body.index(",W,") + 3:].index(".")))
+        body = body[:position] + str((int(body[position]) + 1) % 10) + body[position + 1:]
+    elif damage == "checksum":
+        checksum = f"{(int(checksum, 16) + 1) % 256:02X}"
+    elif damage == "lowercase":
+        checksum = checksum.lower()
+    elif damage == "no checksum":
+        return body + "\n"
+    elif damage == "one hex digit":
+        checksum = checksum[1]
+    elif damage == "not hex":
+        checksum = checksum[0] + "G"
+    elif damage == "carriage return":
+        return f"{body}*{checksum}\r\n"
+    return f"{body}*{checksum}\n"
+
+
+def checksum_matches(line):
+    """
+    :return: whether a line ends with '*' and the two hexadecimal digits of the XOR of its body
+    """
+    match = CHECKED.fullmatch(line.rstrip("\r\n"))
+    return match is not None and reduce(lambda x, y: x ^ y, match.group(1).encode(), 0) == int(match.group(2), 16)
+
+
+def test_checksums(rng):
+    # speeds of every length so the sentences are of every length and start at every offset
+    speeds = random_numbers(rng, 5000, [(whole, fraction) for whole in range(1, 9) for fraction in range(1, 9)])
+    lines = [damaged(line, DAMAGES[rng.integers(0, len(DAMAGES))], rng)
+             for line in rmc_log(speeds).decode().splitlines(keepends=True)]
+    valid = [checksum_matches(line) for line in lines]
+    assert 0 < sum(valid) < len(lines)
+    _, GPRMC = parse_nmea("".join(lines).encode())
+    np.testing.assert_array_equal(GPRMC["speed over ground in knots"],
+                                  [float(speed) for speed, kept in zip(speeds, valid) if kept])
+
+
+def test_checksums_not_verified(rng, monkeypatch):
+    monkeypatch.setattr(nmea_parser, "VERIFY_CHECKSUMS", False)
+    speeds = random_numbers(rng, 100, [(2, 1)])
+    lines = [damaged(line, "checksum", rng) for line in rmc_log(speeds).decode().splitlines(keepends=True)]
+    _, GPRMC = parse_nmea("".join(lines).encode())
+    np.testing.assert_array_equal(GPRMC["speed over ground in knots"], [float(speed) for speed in speeds])
+
+
+def test_blocks_give_the_whole_log(tmp_path):
+    log = str(tmp_path / "drive.txt")
+    generate_nmea(log, 5000, rate=10.0, order="random", dropout=0.05, outage_every=100.0, outage_length=5.0)
+    whole = read_nmea(log, None)
+    for chunk_size in (4096, 65537):
+        for expected, parsed in zip(whole, read_nmea(log, chunk_size)):
+            assert expected.keys() == parsed.keys()
+            for name in expected:
+                np.testing.assert_array_equal(parsed[name], expected[name], err_msg=name)
+
+
+def test_blocks_with_vtg_and_gsa_give_the_whole_log(tmp_path):
+    log = str(tmp_path / "gnss.txt")
+    generate_nmea(log, 1000, rate=10.0, order="random", dropout=0.05, talker="GN", extra_sentences=True)
+    whole = read_nmea(log, None)
+    for chunk_size in (200, 4096, 65537):  # blocks of 200 bytes hold less than an epoch
+        for expected, parsed in zip(whole, read_nmea(log, chunk_size)):
+            for name in expected:
+                np.testing.assert_array_equal(parsed[name], expected[name], err_msg=name)
+
+
+def test_any_talker_gives_the_same_track(tmp_path):
+    logs = {}
+    for talker, extra_sentences in (("GP", False), ("GN", True), ("GL", True), ("GA", False)):
+        logs[talker] = str(tmp_path / f"{talker}.txt")
+        generate_nmea(logs[talker], duration=600.0, talker=talker, extra_sentences=extra_sentences)
+    expected = read_nmea(logs["GP"], columns=FIX_COLUMNS)
+    hazards = GPS_to_CostMap.main(logs["GP"], False, False)
+    assert any(hazards)
+    for talker in ("GN", "GL", "GA"):
+        for columns, parsed in zip(expected, read_nmea(logs[talker], columns=FIX_COLUMNS)):
+            for name in columns:
+                np.testing.assert_array_equal(parsed[name], columns[name], err_msg=f"{talker} {name}")
+        assert GPS_to_CostMap.main(logs[talker], False, False) == hazards, talker
+
+
+def test_vtg_fills_the_speed_and_track_of_its_epoch():
+    log = "".join(sentence(body) for body in [
+        "GNRMC,120000.00,A,4200.0000,N,07600.0000,W,,,150326,,,A",
+        "GNVTG,45.0,T,,M,10.0,N,18.5,K,A",
+        "GNRMC,120001.00,A,4200.0000,N,07600.0000,W,,,150326,,,A",
+        "GNRMC,120002.00,A,4200.0000,N,07600.0000,W,12.0,50.0,150326,,,A",
+        "GNVTG,55.0,T,,M,11.0,N,20.4,K,A",
+        "PGRME,15.0,M,45.0,M,25.0,M",  # proprietary sentences are not from a talker
+    ]).encode()
+    _, GPRMC = parse_nmea(log)
+    np.testing.assert_array_equal(GPRMC["speed over ground in knots"], [10.0, np.nan, 12.0])
+    np.testing.assert_array_equal(GPRMC["track made good in degrees"], [45.0, np.nan, 50.0])
+
+
+def test_vtg_of_another_block_is_not_its_epoch():
+    blocks = [sentence("GNRMC,120000.00,A,4200.0000,N,07600.0000,W,,,150326,,,A").encode(),
+              sentence("GNVTG,45.0,T,,M,10.0,N,18.5,K,A").encode()]
+    (_, GPRMC), _ = parse_nmea_blocks(blocks)
+    assert np.isnan(GPRMC["speed over ground in knots"]).all()
+
+
+def test_fixes_without_a_fix_in_any_gsa_are_skipped():
+    log = "".join(sentence(body) for body in [
+        "GNRMC,120000.00,A,4200.0000,N,07600.0000,W,10.0,90.0,150326,,,A",
+        "GPGSA,A,1,,,,,,,,,,,,,,,",
+        "GNRMC,120001.00,A,4200.0000,N,07600.0000,W,11.0,90.0,150326,,,A",
+        "GPGSA,A,1,,,,,,,,,,,,,,,",
+        "GLGSA,A,3,65,66,,,,,,,,,,,1.8,0.9,1.5",  # constellations report separately
+        "GNRMC,120002.00,A,4200.0000,N,07600.0000,W,12.0,90.0,150326,,,A",
+    ]).encode()
+    _, GPRMC = parse_nmea(log)
+    np.testing.assert_array_equal(GPRMC["UTC position"], [120001.0, 120002.0])
@@ -0,0 +1,116 @@
+"""
+profiling records the stages and counters of the file being profiled, and nothing otherwise,
+writes a report per file named so that logs of the same name do not collide, and adds up the
+reports of a batch.
+"""
+import json
+import os
+import pstats
+import shutil
+from functools import partial
+import pytest
+import GPS_to_CostMap
+import profiling
+from gps_cli import main
+from profiling import profiled, stage, count, write_batch_report
+
+
+@pytest.fixture(autouse=True)
+def profile_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIRECTORY", str(tmp_path / "Profiles") + "/")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "Profiles"
+
+
+def report_files(directory):
+    return sorted(path.name for path in directory.iterdir() if path.suffix == ".json")
+
+
+def test_stages_of_a_file(logs, profile_directory):
+    function = partial(GPS_to_CostMap.main, cache=False)
+    hazards, report = profiled(function, logs["drive"])
+    assert hazards == function(logs["drive"])
+    names = [record["stage"] for record in report["stages"]]
+    assert names == ["parse", "merge", "data frame", "turn detection", "dedup"]
+    assert sum(record["seconds"] for record in report["stages"]) <= report["seconds"]
+    records = {record["stage"]: record for record in report["stages"]}
+    assert records["turn detection"]["rows in"] == records["data frame"]["rows out"] > 0
+    assert records["dedup"]["rows out"] == sum(len(points) for points in hazards)
+    [name] = report_files(profile_directory)
+    assert name.startswith("drive.txt.")
+    assert json.loads((profile_directory / name).read_text()) == json.loads(json.dumps(report))
+
+
+def test_nothing_recorded_when_off(profile_directory):
+    with stage("parse", 10) as record:
+        record["rows out"] = 5
+    count("route points", 3)
+    assert not profile_directory.exists()
+
+
+def test_counters_and_failures(tmp_path, profile_directory):
+    log = str(tmp_path / "drive.txt")
+
+    def function(file):
+        with stage("parse", 10) as record:
+            record["rows out"] = 5
+        count("route points", 3)
+        count("route points", 4)
+        count("route points drawn", 0)
+        return file
+
+    result, report = profiled(function, log)
+    assert result == log
+    assert report["counters"] == {"route points": 7}
+    assert [(record["stage"], record["rows in"], record["rows out"]) for record in report["stages"]] == \
+        [("parse", 10, 5)]
+
+    def failing(file):
+        raise ValueError(file)
+
+    with pytest.raises(ValueError):
+        profiled(failing, log)
+    with stage("parse") as record:  # profiling is off again after a failure
+        assert record == {}
+
+
+def test_cprofile_stage(logs, profile_directory):
+    _, report = profiled(partial(GPS_to_CostMap.main, cache=False), logs["drive"], cprofile_stage="turn detection")
+    [record] = [record for record in report["stages"] if "cprofile" in record]
+    assert record["stage"] == "turn detection"
+    assert os.path.dirname(record["cprofile"]) + "/" == profiling.PROFILE_DIRECTORY
+    assert pstats.Stats(record["cprofile"]).total_calls > 0
+
+
+def test_same_names_in_other_directories(logs, tmp_path, profile_directory):
+    for directory in ("monday", "tuesday"):
+        (tmp_path / directory).mkdir()
+        shutil.copy(logs["drive"], tmp_path / directory / "drive.txt")
+        profiled(partial(GPS_to_CostMap.main, cache=False), str(tmp_path / directory / "drive.txt"))
+    assert len(report_files(profile_directory)) == 2
+    profiled(partial(GPS_to_CostMap.main, cache=False), os.path.join("monday", "drive.txt"))
+    assert len(report_files(profile_directory)) == 2  # the same file by a relative path
+
+
+def test_batch_report(profile_directory):
+    reports = [{"file": "a.txt", "seconds": 2.0, "peak RSS MB": 100.0, "counters": {"route points": 10},
+                "stages": [{"stage": "parse", "rows in": None, "rows out": 50, "seconds": 1.0},
+                           {"stage": "dedup", "rows in": 50, "rows out": 5, "seconds": 0.5}]},
+               {"file": "b.txt", "seconds": 1.0, "peak RSS MB": None, "counters": {"route points": 2, "calls": 1},
+                "stages": [{"stage": "parse", "rows in": None, "rows out": 20, "seconds": 0.25}]}]
+    batch = write_batch_report(reports, 2.5)
+    assert batch["stages"] == {"parse": {"seconds": 1.25, "rows in": 0, "rows out": 70, "calls": 2},
+                               "dedup": {"seconds": 0.5, "rows in": 50, "rows out": 5, "calls": 1}}
+    assert batch["counters"] == {"route points": 12, "calls": 1}
+    assert (batch["seconds"], batch["files"], batch["peak RSS MB"]) == (2.5, 2, 100.0)
+    assert json.loads((profile_directory / "batch.json").read_text()) == batch
+    assert write_batch_report([], 0.0, "empty.json")["peak RSS MB"] is None
+
+
+def test_profile_command(logs, profile_directory, monkeypatch):
+    monkeypatch.setattr(GPS_to_CostMap, "OUTPUT_DIRECTORY", GPS_to_CostMap.OUTPUT_DIRECTORY)  # set by -o
+    assert main(["hazards", logs["drive"], logs["fast"], "-o", "out", "--workers", "1", "--profile"]) == 0
+    assert len(report_files(profile_directory)) == 3
+    batch = json.loads((profile_directory / "batch.json").read_text())
+    assert sorted(report["file"] for report in batch["reports"]) == sorted([logs["drive"], logs["fast"]])
+    assert batch["stages"]["dedup"]["calls"] == 2
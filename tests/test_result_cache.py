@@ -0,0 +1,104 @@
+"""
+The result cache: a stored result is returned instead of computed again, a change of the
+log, the parameters or the source code computes it again, and the least recently used
+entries are the ones evicted.
+"""
+import glob
+import os
+import shutil
+import pytest
+import result_cache
+from result_cache import cached, cache_key, evict, file_hash, load, store
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    monkeypatch.setattr(result_cache, "CACHE_DIRECTORY", str(directory) + "/")
+    return directory
+
+
+def counted(result):
+    """
+    :return: a function returning result, and the list of its calls
+    """
+    calls = []
+
+    def function():
+        calls.append(result)
+        return result
+    return function, calls
+
+
+def test_hits(tmp_path):
+    log = tmp_path / "drive.txt"
+    log.write_bytes(b"$GPRMC\n")
+    function, calls = counted([1.0, 2.0])
+    for _ in range(3):
+        assert cached(file_hash(str(log)), "hazards", {"radius": 10}, function) == [1.0, 2.0]
+    assert len(calls) == 1
+
+
+def test_changed_log_or_parameters_or_name_is_computed_again(tmp_path):
+    log = tmp_path / "drive.txt"
+    log.write_bytes(b"$GPRMC\n")
+    function, calls = counted("result")
+    cached(file_hash(str(log)), "hazards", {"radius": 10}, function)
+    cached(file_hash(str(log)), "hazards", {"radius": 12}, function)
+    cached(file_hash(str(log)), "route", {"radius": 10}, function)
+    log.write_bytes(b"$GPGGA\n")
+    cached(file_hash(str(log)), "hazards", {"radius": 10}, function)
+    assert len(calls) == 4
+    cached(file_hash(str(log)), "hazards", {"radius": 10}, function)
+    assert len(calls) == 4
+
+
+def test_parameter_order_does_not_matter():
+    assert cache_key("log", "hazards", {"a": 1, "b": 2}) == cache_key("log", "hazards", {"b": 2, "a": 1})
+
+
+def test_changed_source_is_computed_again(tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    for path in glob.glob(os.path.join(os.path.dirname(result_cache.__file__), "*.py")):
+        shutil.copy(path, source)
+    monkeypatch.setattr(result_cache, "__file__", str(source / "result_cache.py"))
+    monkeypatch.setattr(result_cache, "_code_digest", None)
+    function, calls = counted("result")
+    cached("log", "hazards", {}, function)
+    cached("log", "hazards", {}, function)
+    with open(source / "GPS_to_CostMap.py", "a") as stream:
+        stream.write("\n# edited\n")
+    monkeypatch.setattr(result_cache, "_code_digest", None)  # as in a new run
+    cached("log", "hazards", {}, function)
+    assert len(calls) == 2
+
+
+def test_damaged_entry_is_a_miss(cache_directory):
+    store("key", list(range(100)))
+    path = cache_directory / "key.pkl"
+    path.write_bytes(path.read_bytes()[:10])
+    assert load("key") == (False, None)
+    assert load("missing") == (False, None)
+
+
+def test_least_recently_used_are_evicted(cache_directory, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_SIZE", 1 << 30)
+    for age, key in enumerate(["newest", "middle", "oldest"]):
+        store(key, bytes(1000))
+        os.utime(cache_directory / f"{key}.pkl", (1e9 - age * 100, 1e9 - age * 100))
+    assert load("oldest")[0]  # now the most recently used
+    size = (cache_directory / "oldest.pkl").stat().st_size
+    evict(2 * size)
+    assert sorted(path.name for path in cache_directory.iterdir()) == ["newest.pkl", "oldest.pkl"]
+    evict(size)
+    assert [path.name for path in cache_directory.iterdir()] == ["oldest.pkl"]
+
+
+def test_store_evicts_past_cache_size(cache_directory, monkeypatch):
+    store("first", bytes(1000))
+    size = (cache_directory / "first.pkl").stat().st_size
+    os.utime(cache_directory / "first.pkl", (1e9, 1e9))
+    monkeypatch.setattr(result_cache, "CACHE_SIZE", size)
+    store("second", bytes(1000))
+    assert [path.name for path in cache_directory.iterdir()] == ["second.pkl"]
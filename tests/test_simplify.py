@@ -0,0 +1,144 @@
+"""
+simplify against plain recursive Douglas-Peucker and point by point Visvalingam-Whyatt:
+the same points kept, every dropped point within the tolerance, the ends always kept, and
+repeated points and closed loops handled.
+"""
+import numpy as np
+import pytest
+from simplify import METHODS, project, simplify
+
+
+def random_route(rng, count, step=5.0):
+    """
+    :return: longitudes and latitudes of a wandering route about step meters between points
+    """
+    headings = np.cumsum(rng.normal(0.0, 0.4, count))
+    east = np.cumsum(step * np.cos(headings))
+    north = np.cumsum(step * np.sin(headings))
+    latitudes = 42.45 + np.degrees(north / 6371008.8)
+    return -76.5 + np.degrees(east / 6371008.8 / np.cos(np.radians(42.45))), latitudes
+
+
+def distance_to_segment(point, start, end):
+    segment, offset = end - start, point - start
+    if not segment.any():
+        return np.hypot(*offset)
+    along = min(max(offset @ segment / (segment @ segment), 0.0), 1.0)
+    return np.hypot(*(offset - along * segment))
+
+
+def reference_douglas_peucker(points, tolerance, first, last, keep):
+    distances = [distance_to_segment(points[index], points[first], points[last]) for index in range(first + 1, last)]
+    if distances and max(distances) > tolerance:
+        split = first + 1 + int(np.argmax(distances))
+        keep[split] = True
+        reference_douglas_peucker(points, tolerance, first, split, keep)
+        reference_douglas_peucker(points, tolerance, split, last, keep)
+
+
+def reference_visvalingam(points, min_area):
+    """
+    Removes the point of smallest area one at a time, the first of equal areas first, the
+    neighbours of a removed point getting an area no smaller than its area.
+    """
+    def area(a, b, c):
+        (ax, ay), (bx, by), (cx, cy) = points[a], points[b], points[c]
+        return abs((bx - ax) * (cy - ay) - (cx - ax) * (by - ay)) / 2
+
+    kept = list(range(len(points)))
+    areas = {index: area(index - 1, index, index + 1) for index in range(1, len(points) - 1)}
+    while len(kept) > 2:
+        position = min(range(1, len(kept) - 1), key=lambda position: (areas[kept[position]], kept[position]))
+        removed = areas[kept[position]]
+        if removed >= min_area:
+            break
+        del kept[position]
+        for neighbour in (position - 1, position):
+            if 0 < neighbour < len(kept) - 1:
+                areas[kept[neighbour]] = max(removed, area(kept[neighbour - 1], kept[neighbour], kept[neighbour + 1]))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[kept] = True
+    return keep
+
+
+def projected(longitudes, latitudes):
+    return np.stack(project(longitudes, latitudes), axis=1)
+
+
+@pytest.mark.parametrize("tolerance", [0.5, 2.0, 10.0, 100.0])
+def test_douglas_peucker(rng, tolerance):
+    longitudes, latitudes = random_route(rng, 600)
+    keep = simplify(longitudes, latitudes, tolerance)
+    points = projected(longitudes, latitudes)
+    expected = np.zeros(len(points), dtype=bool)
+    expected[[0, -1]] = True
+    reference_douglas_peucker(points, tolerance, 0, len(points) - 1, expected)
+    np.testing.assert_array_equal(keep, expected)
+    kept = np.flatnonzero(keep)
+    assert 2 < len(kept) < len(points)
+    for start, end in zip(kept[:-1], kept[1:]):
+        for index in range(start + 1, end):
+            assert distance_to_segment(points[index], points[start], points[end]) <= tolerance
+
+
+@pytest.mark.parametrize("tolerance", [0.5, 2.0, 10.0])
+def test_visvalingam(rng, tolerance):
+    longitudes, latitudes = random_route(rng, 200)
+    keep = simplify(longitudes, latitudes, tolerance, "visvalingam")
+    np.testing.assert_array_equal(keep, reference_visvalingam(projected(longitudes, latitudes), tolerance ** 2))
+    assert 2 < np.count_nonzero(keep) < len(keep)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_larger_tolerances_keep_fewer_points(rng, method):
+    longitudes, latitudes = random_route(rng, 300)
+    kept = [simplify(longitudes, latitudes, tolerance, method) for tolerance in (0.5, 2.0, 10.0, 50.0)]
+    assert all(np.count_nonzero(finer) >= np.count_nonzero(coarser) for finer, coarser in zip(kept[:-1], kept[1:]))
+    if method == "douglas-peucker":  # a coarser line is one of the recursion steps of a finer one
+        assert all(np.all(finer | ~coarser) for finer, coarser in zip(kept[:-1], kept[1:]))
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_ends_and_short_lines(rng, method):
+    longitudes, latitudes = random_route(rng, 100)
+    keep = simplify(longitudes, latitudes, 1e6, method)
+    assert np.flatnonzero(keep).tolist() == [0, len(keep) - 1]
+    assert simplify(longitudes, latitudes, 0, method).all()
+    for count in (0, 1, 2):
+        assert simplify(longitudes[:count], latitudes[:count], 10.0, method).tolist() == [True] * count
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_degenerate_segments(rng, method):
+    # a car parked at the same place, then repeating every point of a route
+    longitudes, latitudes = np.full(50, -76.5), np.full(50, 42.45)
+    assert np.flatnonzero(simplify(longitudes, latitudes, 1.0, method)).tolist() == [0, 49]
+    longitudes, latitudes = (np.repeat(values, 3) for values in random_route(rng, 100))
+    keep = simplify(longitudes, latitudes, 2.0, method)
+    points = projected(longitudes, latitudes)
+    kept = np.flatnonzero(keep)
+    if method == "douglas-peucker":
+        for start, end in zip(kept[:-1], kept[1:]):
+            assert all(distance_to_segment(points[index], points[start], points[end]) <= 2.0
+                       for index in range(start + 1, end))
+    else:
+        np.testing.assert_array_equal(keep, reference_visvalingam(points, 4.0))
+
+
+def test_closed_loop(rng):
+    # ending where it started, the first segment tried has no length
+    angles = np.linspace(0.0, 2 * np.pi, 200)
+    longitudes = -76.5 + 0.001 * np.cos(angles)
+    latitudes = 42.45 + 0.001 * np.sin(angles)
+    keep = simplify(longitudes, latitudes, 1.0)
+    points = projected(longitudes, latitudes)
+    expected = np.zeros(len(points), dtype=bool)
+    expected[[0, -1]] = True
+    reference_douglas_peucker(points, 1.0, 0, len(points) - 1, expected)
+    np.testing.assert_array_equal(keep, expected)
+    assert 4 < np.count_nonzero(keep) < len(keep)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match="unknown simplification method"):
+        simplify(np.zeros(3), np.zeros(3), 1.0, "radial")
@@ -0,0 +1,64 @@
+"""
+remove_nearby_points and nearby_mask against a brute force of geopy's ellipsoidal distance
+between every pair, for a whole list of points and for the same points in chunks.
+"""
+import numpy as np
+import pytest
+from geopy import distance
+from spatial_dedup import remove_nearby_points, nearby_mask
+
+RADIUS = 15.0  # meters
+# centres of the clusters of points, as (longitude, latitude), far from and across the
+# antimeridian and near a pole where a degree of longitude is a few meters
+CENTRES = {"ithaca": (-76.5, 42.45), "equator": (10.0, 0.0), "antimeridian": (180.0, -17.0),
+           "pole": (45.0, 89.9999)}
+
+
+def clustered_points(rng, centre, count):
+    """
+    :return: list of [longitude, latitude] scattered a few radii around a centre, with repeats
+    """
+    longitude, latitude = centre
+    north = rng.normal(0.0, 2 * RADIUS, count)
+    east = rng.normal(0.0, 2 * RADIUS, count)
+    latitudes = np.clip(latitude + np.degrees(north / 6371008.8), -90.0, 90.0)
+    longitudes = longitude + np.degrees(east / 6371008.8 / np.cos(np.radians(latitudes)))
+    longitudes = (longitudes + 180.0) % 360.0 - 180.0
+    points = np.stack((longitudes, latitudes), axis=1).tolist()
+    return points + [points[index] for index in rng.integers(0, count, count // 10)]
+
+
+def brute_force(points, radius):
+    """
+    :return: the points that are not closer than radius to any earlier point, by geopy
+    """
+    return [point for index, point in enumerate(points)
+            if not any(distance.distance(point[::-1], earlier[::-1]).m < radius for earlier in points[:index])]
+
+
+@pytest.mark.parametrize("centre", list(CENTRES))
+def test_whole_points(rng, centre):
+    points = clustered_points(rng, CENTRES[centre], 150)
+    expected = brute_force(points, RADIUS)
+    assert 0 < len(expected) < len(points)
+    assert remove_nearby_points(points, RADIUS) == expected
+    array = np.array(points)
+    near = nearby_mask(array[:, 0], array[:, 1], RADIUS)
+    assert [point for point, remove in zip(points, near) if not remove] == expected
+
+
+@pytest.mark.parametrize("centre", list(CENTRES))
+def test_chunked_points(rng, centre):
+    points = clustered_points(rng, CENTRES[centre], 150)
+    expected = brute_force(points, RADIUS)
+    cuts = np.sort(rng.integers(0, len(points), 6)).tolist()
+    earlier_points, kept = [], []
+    for begin, end in zip([0] + cuts, cuts + [len(points)]):
+        kept += remove_nearby_points(points[begin:end], RADIUS, earlier_points)
+    assert kept == expected
+    assert earlier_points == points
+
+
+def test_no_points():
+    assert remove_nearby_points([], RADIUS) == []
+    assert len(nearby_mask(np.zeros(3), np.zeros(3), RADIUS, start=3)) == 0
@@ -0,0 +1,110 @@
+"""
+Stop detection on speed profiles built by hand: the phases of a stop, the time it stood at
+any sample rate, where it stood, gaps and parking, and the STOP_DURATIONS of GPS_to_CostMap.
+"""
+import numpy as np
+import pytest
+import GPS_to_CostMap
+from stop_detection import stop_phases, stop_events, settled_stops, PHASES
+from turn_detection import track_ticks
+
+DWELL_SPEED, MOVING_SPEED = 2.0, 10.0
+# a stop at a light: slows down, stands, creeps forward at fix 8, stands again and drives off
+SPEEDS = [20, 15, 8, 3, 1, 0, 0, 1.5, 3, 0, 5, 12, 20]
+PHASE_NAMES = ["moving"] * 2 + ["decelerating"] * 2 + ["dwelling"] * 6 + ["accelerating"] + ["moving"] * 2
+
+
+def utc(seconds):
+    """
+    :return: array of UTC positions, hhmmss.ss, of seconds after noon
+    """
+    seconds = 12 * 3600 + np.asarray(seconds, dtype=float)
+    return seconds // 3600 * 10000 + seconds % 3600 // 60 * 100 + seconds % 60
+
+
+def events_of(seconds, speeds, durations=(2.0, 300.0), longitudes=None, latitudes=None):
+    longitudes = np.full(len(speeds), -76.0) if longitudes is None else longitudes
+    latitudes = np.full(len(speeds), 42.0) if latitudes is None else latitudes
+    return stop_events(utc(seconds), longitudes, latitudes, speeds, DWELL_SPEED, MOVING_SPEED, durations)
+
+
+def test_phases_of_a_stop():
+    events = stop_phases(track_ticks(utc(np.arange(len(SPEEDS)))), SPEEDS, DWELL_SPEED, MOVING_SPEED)
+    assert [PHASES[phase] for phase in events.pop("phase")] == PHASE_NAMES
+    assert {name: fixes.tolist() for name, fixes in events.items()} == \
+        {"start": [2], "first dwell": [4], "last dwell": [9], "end": [10]}
+
+
+def test_no_stop_without_a_standing_fix():
+    speeds = [20, 8, 3, 5, 20, 3, 1]  # the last stretch stands until the end of the track
+    events = stop_phases(track_ticks(utc(np.arange(len(speeds)))), speeds, DWELL_SPEED, MOVING_SPEED)
+    assert [PHASES[phase] for phase in events["phase"]] == ["moving"] * 5 + ["decelerating", "dwelling"]
+    assert events["start"].tolist() == [5]
+    empty = stop_phases(np.zeros(0, dtype=np.int64), [], DWELL_SPEED, MOVING_SPEED)
+    assert all(len(fixes) == 0 for fixes in empty.values())
+
+
+def test_a_gap_splits_a_stop():
+    seconds = np.r_[0:6, 20:27]  # no fix for 14 seconds, more than MAX_GAP
+    speeds = [20, 8, 0, 0, 0, 3, 3, 0, 0, 0, 0, 5, 20]
+    events = events_of(seconds, speeds)
+    assert events["start"].tolist() == [1, 6]
+    assert events["first dwell"].tolist() == [2, 7]
+    assert events["end"].tolist() == [5, 11]
+    assert events["duration"].tolist() == [3.0, 4.0]  # the time at the last fix before the gap is not counted
+
+
+@pytest.mark.parametrize("rate", [1, 5, 10])
+def test_duration_at_any_rate(rate):
+    speeds = np.repeat(SPEEDS, rate).astype(float)
+    events = events_of(np.arange(len(speeds)) / rate, speeds)
+    # stands from the first standing fix until the one after the last, 4 s to 10 s
+    assert events["duration"].tolist() == [6.0]
+    assert (events["first dwell"].tolist(), events["last dwell"].tolist()) == ([4 * rate], [10 * rate - 1])
+
+
+def test_shortest_and_longest_stop():
+    seconds = np.arange(len(SPEEDS))
+    assert len(events_of(seconds, SPEEDS, (6.0, 6.0))["start"]) == 1
+    assert len(events_of(seconds, SPEEDS, (6.5, 300.0))["start"]) == 0  # too short
+    assert len(events_of(seconds, SPEEDS, (2.0, 5.5))["start"]) == 0  # parking
+
+
+def test_stop_placed_where_it_stood_longest():
+    longitudes = np.full(len(SPEEDS), -76.0)
+    latitudes = np.full(len(SPEEDS), 42.0)
+    latitudes[9:] += 0.0005  # about 55 meters further on after creeping forward
+    longitudes[5:7] += [0.00001, -0.00001]  # drift of a standing receiver
+    events = events_of(np.arange(len(SPEEDS)), SPEEDS, longitudes=longitudes, latitudes=latitudes)
+    assert events["longitude"] == pytest.approx([-76.0])
+    assert events["latitude"] == pytest.approx([42.0])
+    latitudes[4:8] += 0.0005  # now stands longest at the second place
+    latitudes[9] -= 0.0005
+    events = events_of(np.arange(len(SPEEDS)), SPEEDS, longitudes=longitudes, latitudes=latitudes)
+    assert events["latitude"] == pytest.approx([42.0005])
+
+
+def test_parking_is_settled_once_too_long():
+    speeds = np.r_[20, 5, np.zeros(20), 20]
+    ticks = track_ticks(utc(np.arange(len(speeds))))
+    # the stretch is a stop until it has stood longer than 10 s, from fix 2 to the end of fix 12
+    assert settled_stops(ticks, speeds, DWELL_SPEED, MOVING_SPEED, 10.0, 0, 12) == 1
+    assert settled_stops(ticks, speeds, DWELL_SPEED, MOVING_SPEED, 10.0, 0, 15) == 13
+    assert settled_stops(ticks, speeds, DWELL_SPEED, MOVING_SPEED, 10.0, 13, 15) == 15  # still parked
+    assert settled_stops(ticks, speeds, DWELL_SPEED, MOVING_SPEED, 10.0, 0, None) == len(speeds)
+    # the rest of the parking is not a stop of its own
+    times = utc(np.arange(len(speeds)))
+    rest = stop_events(times, np.full(len(speeds), -76.0), np.full(len(speeds), 42.0), speeds, DWELL_SPEED,
+                       MOVING_SPEED, (2.0, 10.0), 13)
+    assert len(rest["start"]) == 0
+
+
+def test_stop_durations_of_the_script(logs, monkeypatch):
+    # the drive stands about 20 s at each stop, the parked drive 500 s
+    assert len(GPS_to_CostMap.main(logs["drive"], False, False)[0]) == 4
+    assert len(GPS_to_CostMap.main(logs["parked"], False, False)[0]) == 0
+    for durations, stops in (((10.0, 30.0), 4), ((2.0, 10.0), 0), ((30.0, 300.0), 0)):
+        monkeypatch.setattr(GPS_to_CostMap, "STOP_DURATIONS", durations)
+        assert len(GPS_to_CostMap.main(logs["drive"], False, False)[0]) == stops, durations
+    monkeypatch.setattr(GPS_to_CostMap, "STOP_DURATIONS", (2.0, 600.0))
+    assert len(GPS_to_CostMap.main(logs["parked"], False, False)[0]) == 3
@@ -0,0 +1,126 @@
+"""
+The track archive: a log comes back from its Parquet file as the merged track it was
+archived from, filed under its vehicle and date, and drives are listed and reanalysed
+with the vehicles, times and box asked for.
+"""
+import datetime
+import os
+import numpy as np
+import pytest
+import GPS_to_CostMap
+import track_archive
+from gps_stream import convert_to_track, iter_merged_data
+from gps_track import Track
+from nmea_generator import generate_nmea
+from track_archive import add_log, archived_drives, drive_hazards, fix_filter
+from track_format import COLUMNS
+
+pq = pytest.importorskip("pyarrow.parquet")
+ds = pytest.importorskip("pyarrow.dataset")
+
+
+def merged_columns(log):
+    chunks = list(iter_merged_data(log))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name, _ in COLUMNS}
+
+
+def timestamp(year, month, day, hour=0, minute=0):
+    return datetime.datetime(year, month, day, hour, minute, tzinfo=datetime.timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("chunk_size", [4096, None])
+def test_round_trip(log, tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(track_archive, "ROW_GROUP_SIZE", 1000)
+    path = add_log(log, "car", str(tmp_path / "archive"), **({"chunk_size": chunk_size} if chunk_size else {}))
+    expected = merged_columns(log)
+    first = Track(log, False).frame()["seconds"].iloc[0]
+    date = datetime.datetime.fromtimestamp(first, datetime.timezone.utc).date()
+    assert os.path.relpath(path, tmp_path) == os.path.join("archive", "vehicle=car", f"date={date}",
+                                                           os.path.basename(path))
+    table = pq.read_table(path)
+    assert table.column_names == [name for name, _ in COLUMNS]
+    for name, dtype in COLUMNS:
+        column = table.column(name).to_numpy()
+        assert column.dtype == np.dtype(dtype)
+        np.testing.assert_array_equal(column, expected[name], err_msg=name)
+    metadata = pq.ParquetFile(path).metadata
+    assert [metadata.row_group(group).num_rows for group in range(metadata.num_row_groups)][:-1] == \
+        [1000] * (metadata.num_row_groups - 1)
+    seconds = table.column_names.index("seconds")
+    assert all(metadata.row_group(group).column(seconds).statistics.has_min_max
+               for group in range(metadata.num_row_groups))
+
+
+def test_archived_once(logs, tmp_path):
+    directory = str(tmp_path / "archive")
+    assert add_log(logs["drive"], "car", directory) is not None
+    assert add_log(logs["drive"], "car", directory) is None
+    assert add_log(logs["drive"], "van", directory) is not None
+    assert len(archived_drives(directory)) == 2
+    assert not [name for name in os.listdir(directory) if name.startswith("_")]
+
+
+def test_logs_that_cannot_be_archived(logs, tmp_path):
+    track_file = str(tmp_path / "drive.trk")
+    convert_to_track(logs["drive"], track_file)
+    with pytest.raises(ValueError, match="track file"):
+        add_log(track_file, "car", str(tmp_path / "archive"))
+    undated = tmp_path / "undated.txt"
+    undated.write_bytes(b"".join(line for line in open(logs["drive"], "rb") if b"RMC" not in line))
+    assert add_log(str(undated), "car", str(tmp_path / "archive")) is None
+    assert archived_drives(str(tmp_path / "archive")) == []
+    assert archived_drives(str(tmp_path / "missing")) == []
+
+
+def test_archived_drives(tmp_path):
+    directory = str(tmp_path / "archive")
+    paths = {}
+    for vehicle, day in (("car", 14), ("car", 16), ("van", 15), ("van", 20)):
+        log = str(tmp_path / f"{vehicle}{day}.txt")
+        generate_nmea(log, duration=120.0, start_time=datetime.datetime(2026, 3, day, 23, 59, 0), seed=day)
+        paths[vehicle, day] = add_log(log, vehicle, directory)
+    assert archived_drives(directory) == sorted(paths.values())
+    assert archived_drives(directory, ["van"]) == sorted([paths["van", 15], paths["van", 20]])
+    # drives filed under the day before the start can still have fixes after it
+    assert archived_drives(directory, start=timestamp(2026, 3, 16)) == \
+        sorted([paths["car", 16], paths["van", 20], paths["van", 15]])
+    assert archived_drives(directory, end=timestamp(2026, 3, 15, 12)) == sorted([paths["car", 14], paths["van", 15]])
+    assert archived_drives(directory, ["car"], timestamp(2026, 3, 15), timestamp(2026, 3, 15, 12)) == \
+        [paths["car", 14]]
+
+
+def test_drive_hazards(log, tmp_path):
+    path = add_log(log, "car", str(tmp_path / "archive"))
+    assert drive_hazards(path, batch_size=700) == tuple(GPS_to_CostMap.main(log, False, False))
+
+
+def test_filtered_drive_hazards(logs, tmp_path):
+    path = add_log(logs["drive"], "car", str(tmp_path / "archive"))
+    frame = Track(logs["drive"], False).frame()
+    start, end = frame["seconds"].quantile([0.1, 0.8]).tolist()
+    bbox = (frame["longitude"].quantile(0.05), frame["latitude"].min() - 1, frame["longitude"].max() + 1,
+            frame["latitude"].quantile(0.9))
+    inside = ((frame["seconds"] >= start) & (frame["seconds"] <= end) & (frame["longitude"] >= bbox[0])
+              & (frame["longitude"] <= bbox[2]) & (frame["latitude"] >= bbox[1]) & (frame["latitude"] <= bbox[3]))
+    assert 0 < inside.sum() < len(frame)
+    expected = [], [], []
+    for found in GPS_to_CostMap.detect_hazards([frame[inside]]):
+        for hazards, new in zip(expected, found):
+            hazards += new
+    assert drive_hazards(path, start, end, bbox, batch_size=300) == expected
+    assert any(expected)
+
+
+def test_fix_filter(logs, tmp_path):
+    path = add_log(logs["drive"], "car", str(tmp_path / "archive"))
+    table = pq.read_table(path)
+    seconds, longitudes = table.column("seconds").to_numpy(), table.column("longitude").to_numpy()
+    latitudes = table.column("latitude").to_numpy()
+    assert fix_filter() is None
+    start, end = np.nanquantile(seconds, [0.25, 0.5])
+    bbox = (np.nanmedian(longitudes), np.nanmin(latitudes), np.nanmax(longitudes), np.nanmax(latitudes))
+    for arguments, expected in (((start, None, None), seconds >= start), ((None, end, None), seconds <= end),
+                                ((None, None, bbox), (longitudes >= bbox[0]) & (latitudes >= bbox[1])
+                                 & (longitudes <= bbox[2]) & (latitudes <= bbox[3]))):
+        filtered = ds.dataset(path, format="parquet").to_table(filter=fix_filter(*arguments))
+        np.testing.assert_array_equal(filtered.column("seconds").to_numpy(), seconds[expected])
@@ -0,0 +1,75 @@
+"""
+Track files give back the merged columns they were written from, whole or in chunks, and
+files that are not track files of this version are told apart and refused.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from gps_stream import convert_to_track, iter_merged_data
+from gps_track import Track
+from track_format import COLUMNS, MAGIC, ROW_SIZE, is_track_file, iter_track, read_track, write_track
+
+
+def merged_columns(log):
+    chunks = list(iter_merged_data(log))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name, _ in COLUMNS}
+
+
+def test_round_trip(log, tmp_path):
+    track_file = str(tmp_path / "drive.trk")
+    convert_to_track(log, track_file)
+    expected = merged_columns(log)
+    GPSData = read_track(track_file)
+    assert list(GPSData) == [name for name, _ in COLUMNS]
+    for name, dtype in COLUMNS:
+        assert GPSData[name].dtype == np.dtype(dtype)
+        assert not GPSData[name].flags.writeable
+        np.testing.assert_array_equal(GPSData[name], expected[name], err_msg=name)
+    for chunk_size in (ROW_SIZE, 1000, 1 << 20):
+        chunks = list(iter_track(track_file, chunk_size))
+        assert all(len(chunk["time"]) <= max(1, chunk_size // ROW_SIZE) for chunk in chunks)
+        for name in expected:
+            np.testing.assert_array_equal(np.concatenate([chunk[name] for chunk in chunks]), expected[name])
+
+
+def test_track_file_gives_the_track_of_its_log(log, tmp_path):
+    track_file = str(tmp_path / "drive.trk")
+    convert_to_track(log, track_file)
+    for drop_poor_fixes in (False, True):
+        pd.testing.assert_frame_equal(Track(track_file, False).frame(drop_poor_fixes),
+                                      Track(log, False).frame(drop_poor_fixes))
+
+
+def test_empty_track(tmp_path):
+    track_file = str(tmp_path / "empty.trk")
+    write_track({name: np.zeros(0, dtype) for name, dtype in COLUMNS}, track_file)
+    assert all(len(column) == 0 for column in read_track(track_file).values())
+    assert list(iter_track(track_file)) == []
+
+
+def test_is_track_file(logs, tmp_path):
+    track_file = str(tmp_path / "drive.trk")
+    convert_to_track(logs["drive"], track_file)
+    assert is_track_file(track_file)
+    assert not is_track_file(logs["drive"])
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert not is_track_file(str(empty))
+
+
+@pytest.mark.parametrize("start, message", [(b"$GPRMC,1", "is not a track file"),
+                                            (MAGIC[:-2] + b"01", "another version")])
+def test_bad_magic(logs, tmp_path, start, message):
+    track_file = tmp_path / "drive.trk"
+    convert_to_track(logs["drive"], str(track_file))
+    track_file.write_bytes(start + track_file.read_bytes()[len(MAGIC):])
+    with pytest.raises(ValueError, match=message):
+        read_track(str(track_file))
+
+
+def test_truncated(logs, tmp_path):
+    track_file = tmp_path / "drive.trk"
+    convert_to_track(logs["drive"], str(track_file))
+    track_file.write_bytes(track_file.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        read_track(str(track_file))
@@ -0,0 +1,221 @@
+"""
+Archive of merged tracks as a Parquet dataset partitioned by vehicle and date, so months of
+drives can be analysed again with new settings without parsing their NMEA logs again.
+
+Each log is one Parquet file named by its file_hash in
+ARCHIVE_DIRECTORY/vehicle=<vehicle>/date=<yyyy-mm-dd>/, the UTC date of its first dated
+GPRMC fix. It holds the columns of track_format, before any fix is dropped, with the
+"seconds" of each fix counted from that fix, so fixes before it are dated too. Logs are
+parsed and written a parser block at a time in row groups of ROW_GROUP_SIZE fixes, each
+with the minimum and maximum of its columns, so archiving takes bounded memory.
+
+Reanalysis lists only the partitions of the vehicles and dates asked for, reads only the
+HAZARD_COLUMNS of GPS_to_CostMap, and pushes a time range and a bounding box down to the
+reader, which skips the row groups whose statistics are outside them. Each drive is
+classified by GPS_to_CostMap.detect_hazards BATCH_SIZE fixes at a time, so memory does not
+grow with the length of the drives, and drives are spread over processes by the reanalyze
+command of gps_cli, see batch_runner.
+
+pyarrow is only needed here and is imported on first use, the scripts run without it.
+"""
+import functools
+import glob
+import operator
+import os
+import time
+import numpy as np
+from nmea_parser import iter_nmea, CHUNK_SIZE, FIX_COLUMNS
+from gps_stream import merge_gps_data, clean_frames, elapsed_seconds
+from track_format import COLUMNS, is_track_file
+from conversions import SECONDS_PER_DAY, date_days, utc_seconds
+from result_cache import file_hash
+from GPS_to_CostMap import HAZARD_COLUMNS, detect_hazards
+
+ARCHIVE_DIRECTORY = "Track_Archive/"
+ROW_GROUP_SIZE = 10000  # fixes per row group, about 17 minutes at 10 Hz, the smallest part a filter skips
+BATCH_SIZE = 10000  # fixes read and classified at a time during reanalysis
+DRIVE_DAYS = 1  # days a drive can go on past the date it is filed under, read for times after that date
+
+
+def add_log(file, vehicle, directory=ARCHIVE_DIRECTORY, chunk_size=CHUNK_SIZE):
+    """
+    Adds the merged track of a NMEA log to the archive, unless it is already there.
+    :param file: the NMEA log
+    :param vehicle: name of the vehicle that logged it
+    :param directory: the archive
+    :param chunk_size: number of bytes parsed at a time
+    :return: name of the Parquet file written, None if the log was already archived or has no dated fix
+    """
+    pa, _, pq = _arrow()
+    if is_track_file(file):
+        raise ValueError(f"{file} is a track file, its fixes have no date, archive its NMEA log instead")
+    content_hash = file_hash(file)
+    vehicle_directory = os.path.join(directory, f"vehicle={vehicle}")
+    if glob.glob(os.path.join(glob.escape(vehicle_directory), "date=*", content_hash + ".parquet")):
+        return None
+    os.makedirs(directory, exist_ok=True)
+    # named like the files the dataset reader ignores until it is complete
+    temporary = os.path.join(directory, f"_{content_hash}.{os.getpid()}.tmp")
+    schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in COLUMNS])
+    clock = {}  # day and seconds of the first dated GPRMC fix, then of the last fix stamped
+    waiting = []  # merged chunks received before the first date
+    buffered = []  # stamped chunks not written yet
+    try:
+        with pq.ParquetWriter(temporary, schema) as writer:
+            for GPSData in merge_gps_data(_dated(iter_nmea(file, chunk_size, FIX_COLUMNS), clock)):
+                waiting.append(GPSData)
+                if not clock:
+                    continue
+                buffered += [{**chunk, "seconds": elapsed_seconds(chunk["time"], clock)} for chunk in waiting]
+                waiting = []
+                buffered = _write_row_groups(writer, schema, buffered, final=False)
+            _write_row_groups(writer, schema, buffered, final=True)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    first_day = clock.get("first day")
+    if first_day is None:
+        os.remove(temporary)
+        return None
+    partition = os.path.join(vehicle_directory, f"date={np.datetime64(first_day, 'D')}")
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, content_hash + ".parquet")
+    os.replace(temporary, path)
+    return path
+
+
+def archived_drives(directory=ARCHIVE_DIRECTORY, vehicles=None, start=None, end=None):
+    """
+    Lists the drives of some vehicles that can have fixes between two times, from the names
+    of their partitions only.
+    :param directory: the archive
+    :param vehicles: list of names of vehicles, None for every vehicle
+    :param start: seconds since 1970, None for the first drive
+    :param end: seconds since 1970, None for the last drive
+    :return: sorted list of the Parquet files of the drives
+    """
+    pa, ds, _ = _arrow()
+    if not os.path.isdir(directory):
+        return []
+    conditions = []
+    if vehicles is not None:
+        conditions.append(ds.field("vehicle").isin(list(vehicles)))
+    if start is not None:  # drives are filed under the day they start
+        conditions.append(ds.field("date") >= _date(start - DRIVE_DAYS * SECONDS_PER_DAY))
+    if end is not None:
+        conditions.append(ds.field("date") <= _date(end))
+    dataset = ds.dataset(directory, format="parquet", partitioning=ds.partitioning(
+        pa.schema([("vehicle", pa.string()), ("date", pa.string())]), flavor="hive"))
+    return sorted(fragment.path for fragment in dataset.get_fragments(filter=_all(conditions)))
+
+
+def drive_hazards(path, start=None, end=None, bbox=None, batch_size=BATCH_SIZE):
+    """
+    Finds the stops and turns of an archived drive with the settings of GPS_to_CostMap, a
+    batch at a time. Only the fixes between start and end and inside bbox are classified,
+    so a turn or stop cut by the edge of the box can be missed.
+    :param path: a Parquet file of the archive, see archived_drives
+    :param start: seconds since 1970, None for the first fix
+    :param end: seconds since 1970, None for the last fix
+    :param bbox: west, south, east and north edges in degrees, None for everywhere
+    :param batch_size: number of fixes read at a time
+    :return: stops, left turns and right turns as lists of [longitude, latitude], see GPS_to_CostMap.main
+    """
+    _, ds, _ = _arrow()
+    # one thread per drive, the drives are spread over processes
+    columns = HAZARD_COLUMNS + ["seconds"]  # and the times duplicates are dropped by
+    batches = ds.dataset(path, format="parquet").to_batches(columns=columns, filter=fix_filter(start, end, bbox),
+                                                            batch_size=batch_size, use_threads=False)
+    chunks = ({name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns} for batch in batches)
+    stops, left_turns, right_turns = [], [], []
+    for new_stops, new_left_turns, new_right_turns in detect_hazards(
+            GPSData for GPSData, in clean_frames(chunks) if len(GPSData)):
+        stops += new_stops
+        left_turns += new_left_turns
+        right_turns += new_right_turns
+    return stops, left_turns, right_turns
+
+
+def fix_filter(start=None, end=None, bbox=None):
+    """
+    :return: pyarrow.dataset expression of the fixes from start to end, in seconds since 1970,
+        and inside bbox, None for every fix
+    """
+    _, ds, _ = _arrow()
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("seconds") >= start)
+    if end is not None:
+        conditions.append(ds.field("seconds") <= end)
+    if bbox is not None:
+        west, south, east, north = bbox
+        conditions += [ds.field("longitude") >= west, ds.field("longitude") <= east,
+                       ds.field("latitude") >= south, ds.field("latitude") <= north]
+    return _all(conditions)
+
+
+def _dated(chunks, clock):
+    """
+    Passes parser chunks on, setting the "first day" and "day" of clock, in days since 1970,
+    and its "seconds" to those of the first dated GPRMC fix, see gps_stream.elapsed_seconds.
+    """
+    for GPGGA, GPRMC in chunks:
+        if not clock:
+            days = date_days(GPRMC["UT date"])
+            dated = np.flatnonzero(~np.isnan(days) & ~np.isnan(GPRMC["UTC position"]))
+            if len(dated):
+                clock.update({"first day": int(days[dated[0]]), "day": int(days[dated[0]]),
+                              "seconds": float(utc_seconds(GPRMC["UTC position"][dated[0]]))})
+        yield GPGGA, GPRMC
+
+
+def _write_row_groups(writer, schema, chunks, final):
+    """
+    Writes the fixes of chunks as row groups of ROW_GROUP_SIZE, and the last ones as a smaller one if final.
+    :return: list of the chunk of fixes left, if any
+    """
+    rows = sum(len(chunk["time"]) for chunk in chunks)
+    written = rows if final else rows - rows % ROW_GROUP_SIZE
+    if written == 0:
+        return chunks
+    columns = {name: np.concatenate([np.asarray(chunk[name], dtype) for chunk in chunks]) for name, dtype in COLUMNS}
+    writer.write_table(_table(schema, {name: column[:written] for name, column in columns.items()}),
+                       row_group_size=ROW_GROUP_SIZE)
+    return [{name: column[written:] for name, column in columns.items()}] if written < rows else []
+
+
+def _table(schema, columns):
+    """
+    :return: pyarrow Table of NumPy columns with the archive schema
+    """
+    pa, _, _ = _arrow()
+    return pa.Table.from_arrays([pa.array(columns[name], type=field.type) for name, field in
+                                 zip(schema.names, schema)], schema=schema)
+
+
+def _date(seconds):
+    """
+    :return: the UTC date of a time in seconds since 1970, as yyyy-mm-dd like the partitions
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(seconds))
+
+
+def _all(conditions):
+    """
+    :return: expression true where every condition is, None when there is none
+    """
+    return functools.reduce(operator.and_, conditions) if conditions else None
+
+
+def _arrow():
+    """
+    :return: the pyarrow, pyarrow.dataset and pyarrow.parquet modules, imported on first use
+    """
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("the track archive needs pyarrow, i.e pip install pyarrow") from error
+    return pyarrow, pyarrow.dataset, pyarrow.parquet
@@ -0,0 +1,79 @@
+"""
+Compact binary file for merged GPS tracks, so a log only has to be parsed from NMEA text once.
+
+A track file starts with MAGIC and the number of fixes as a little-endian uint64, followed by
+each column of COLUMNS stored whole, one after the other, as fixed-width little-endian
+values. Reading a track memory-maps the file and returns NumPy views of the columns, so
+nothing is copied or parsed until the values are used.
+
+The file holds the GPRMC/GPGGA merge of gps_stream.merge_gps_data, before fixes with
+NaNs, duplicated times or few satellites are dropped, so each script can still clean the
+track its own way. See gps_stream.convert_to_track to write one from a NMEA log.
+"""
+import numpy as np
+from nmea_parser import CHUNK_SIZE
+
+MAGIC = b"GPSTRK02"
+HEADER_SIZE = 16
+COLUMNS = [("time", "<f8"), ("seconds", "<f8"), ("latitude", "<f8"), ("longitude", "<f8"), ("speed", "<f8"),
+           ("angle", "<f8"), ("satellites", "<i4")]
+ROW_SIZE = sum(np.dtype(dtype).itemsize for _, dtype in COLUMNS)
+
+
+def write_track(GPSData, track_file):
+    """
+    :param GPSData: dictionary of merged columns, see merge_gps_data
+    :param track_file: name of the track file to write
+    """
+    count = len(GPSData["time"])
+    with open(track_file, "wb") as outfile:
+        outfile.write(MAGIC)
+        outfile.write(np.uint64(count).astype("<u8").tobytes())
+        for name, dtype in COLUMNS:
+            outfile.write(np.ascontiguousarray(GPSData[name], dtype=dtype).tobytes())
+
+
+def read_track(track_file):
+    """
+    Memory-maps a track file.
+    :param track_file: name of the track file
+    :return: dictionary of read-only NumPy arrays backed by the file
+    """
+    if not is_track_file(track_file):
+        raise ValueError(f"{track_file} is not a track file")
+    with open(track_file, "rb") as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{track_file} is a track file of another version, convert its NMEA log again")
+        count = int(np.frombuffer(infile.read(HEADER_SIZE - len(MAGIC)), dtype="<u8")[0])
+    if count == 0:
+        return {name: np.zeros(0, dtype) for name, dtype in COLUMNS}
+    buffer = np.memmap(track_file, dtype=np.uint8, mode="r")
+    if len(buffer) < HEADER_SIZE + count * ROW_SIZE:
+        raise ValueError(f"{track_file} is truncated")
+    GPSData = {}
+    offset = HEADER_SIZE
+    for name, dtype in COLUMNS:
+        size = count * np.dtype(dtype).itemsize
+        GPSData[name] = buffer[offset:offset + size].view(dtype)
+        offset += size
+    return GPSData
+
+
+def iter_track(track_file, chunk_size=CHUNK_SIZE):
+    """
+    :param track_file: name of the track file
+    :param chunk_size: approximate number of bytes in each chunk
+    :return: generator of dictionaries of consecutive slices of the columns
+    """
+    GPSData = read_track(track_file)
+    rows = max(1, chunk_size // ROW_SIZE)
+    for start in range(0, len(GPSData["time"]), rows):
+        yield {name: column[start:start + rows] for name, column in GPSData.items()}
+
+
+def is_track_file(file):
+    """
+    :return: whether a file starts like a track file of any version rather than a NMEA log
+    """
+    with open(file, "rb") as infile:
+        return infile.read(len(MAGIC))[:-2] == MAGIC[:-2]
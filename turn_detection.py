@@ -0,0 +1,152 @@
+"""
+Turn detection from the heading of a track over time, whatever the rate of the receiver.
+
+Each fix gets the change in heading since the fix before it, wrapped to -180..180 degrees
+and positive to the right. Changes are only trusted while the car moves faster than the
+lowest turning speed, when the fixes are at most MAX_GAP seconds apart and when they imply
+less than MAX_RATE degrees per second, so jitter at a standstill, outages and heading flips
+do not add up to turns. The changes within half a window of each fix are summed and divided
+by the window length, which gives a yaw rate in degrees per second that means the same at
+1 Hz and at 10 Hz. A run of fixes turning faster than the turn rate in the same direction
+is one turn event, kept if the heading changed by at least the turn angle across the
+windows of the run; it starts at the first fix of the run, ends at the last one and peaks
+at the fix with the largest windowed change.
+
+Times are kept in integer hundredths of a second and changes in integer thousandths of a
+degree, so sums over any slice of a track are exact and a track classified in pieces gives
+the same events as the whole track. Everything is cumulative sums, searchsorted and diff
+over whole columns, without a loop over the fixes.
+"""
+import numpy as np
+from conversions import SECONDS_PER_DAY, utc_seconds
+
+MAX_GAP = 5.0  # seconds between fixes over which the change in heading is not counted
+MAX_RATE = 90.0  # degrees per second between two fixes above which the heading is noise
+TICKS_PER_SECOND = 100  # times are counted in hundredths of a second, the resolution of NMEA times
+STEPS_PER_DEGREE = 1000  # heading changes are counted in thousandths of a degree
+
+
+def track_ticks(times):
+    """
+    :param times: array of UTC positions, hhmmss.ss
+    :return: array of hundredths of a second since the first fix, never decreasing: a time
+        earlier than the one before it counts as almost a day later, like midnight
+    """
+    ticks = np.round(utc_seconds(np.asarray(times, dtype=float)) * TICKS_PER_SECOND).astype(np.int64)
+    if len(ticks) == 0:
+        return ticks
+    steps = np.diff(ticks) % (SECONDS_PER_DAY * TICKS_PER_SECOND)
+    return np.concatenate(([0], np.cumsum(steps)))
+
+
+def heading_changes(ticks, angles, speeds, min_speed):
+    """
+    :param ticks: array of times, see track_ticks
+    :param angles: array of directions in degrees, 0 is due north
+    :param speeds: array of speeds
+    :param min_speed: speed at or below which the direction is not trusted
+    :return: array of the change in direction of each fix from the one before it in
+        thousandths of a degree, positive to the right, 0 for the first fix and where not trusted
+    """
+    angles = np.asarray(angles, dtype=float)
+    if len(angles) == 0:
+        return np.zeros(0, dtype=np.int64)
+    change = (np.diff(angles) + 180) % 360 - 180
+    seconds = np.diff(ticks) / TICKS_PER_SECOND
+    trusted = ((seconds > 0) & (seconds <= MAX_GAP) & (np.asarray(speeds)[1:] > min_speed)
+               & (np.abs(change) <= MAX_RATE * seconds))
+    return np.concatenate(([0], np.where(trusted, np.round(change * STEPS_PER_DEGREE), 0).astype(np.int64)))
+
+
+def turn_windows(times, angles, speeds, window, rate, speed_limits):
+    """
+    Sums the heading changes around every fix.
+    :param times: array of UTC positions, hhmmss.ss
+    :param angles: array of directions in degrees
+    :param speeds: array of speeds
+    :param window: seconds of heading change summed around each fix
+    :param rate: degrees per second above which a fix is turning
+    :param speed_limits: lowest and highest speeds of a turn
+    :return: dictionary of the "ticks" of the fixes, the "cumulative" change before each
+        fix, the "low" and "high" ends of the window of each fix in it, the "change" in
+        each window and the "direction" each fix is turning, -1 left, 1 right, 0 none
+    """
+    ticks = track_ticks(times)
+    cumulative = np.concatenate(([0], np.cumsum(heading_changes(ticks, angles, speeds, speed_limits[0]))))
+    half = int(round(window * TICKS_PER_SECOND / 2))
+    low = np.searchsorted(ticks, ticks - half, side="left")
+    high = np.searchsorted(ticks, ticks + half, side="right")
+    change = cumulative[high] - cumulative[low]
+    turning = np.abs(change) >= rate * window * STEPS_PER_DEGREE
+    return {"ticks": ticks, "cumulative": cumulative, "low": low, "high": high, "change": change,
+            "direction": np.where(turning, np.sign(change), 0)}
+
+
+def settled_fixes(windows, window, begin=0, end=None, final=True):
+    """
+    :param windows: see turn_windows
+    :param window: seconds of heading change summed around each fix
+    :param begin: first fix not classified yet
+    :param end: fix after the last one that could be classified otherwise, None for every fix
+    :param final: no more fixes will follow
+    :return: number of fixes whose turns are known, never inside a run of turning fixes
+        that later fixes could extend
+    """
+    ticks = windows["ticks"]
+    end = len(ticks) if end is None else end
+    if not final and len(ticks):  # a fix is known once a fix more than half a window after it has arrived
+        end = min(end, int(np.searchsorted(ticks, ticks[-1] - int(round(window * TICKS_PER_SECOND / 2)), side="left")))
+    direction = windows["direction"]
+    if begin < end < len(ticks) and direction[end - 1] != 0:  # the run of the last fix can go on, it waits
+        others = np.flatnonzero(direction[begin:end] != direction[end - 1])
+        end = begin + (int(others[-1]) + 1 if len(others) else 0)
+    return max(end, begin)
+
+
+def context_start(windows, window, end):
+    """
+    :return: first fix the windows of the fixes from end on still need, with the one before it
+        so its change in heading can be computed again
+    """
+    ticks = windows["ticks"]
+    if end >= len(ticks):
+        return end
+    return max(int(np.searchsorted(ticks, ticks[end] - int(round(window * TICKS_PER_SECOND / 2)), side="left")) - 1, 0)
+
+
+def turn_events(windows, speeds, min_angle, speed_limits, begin=0, end=None):
+    """
+    Finds the turns made of runs of turning fixes from begin to end.
+    :param windows: see turn_windows
+    :param speeds: array of speeds
+    :param min_angle: smallest change in heading in degrees of a turn
+    :param speed_limits: lowest and highest speeds of a turn, at its peak
+    :param begin: first fix, never inside a run, see settled_fixes
+    :param end: fix after the last, never inside a run, None for every fix
+    :return: dictionary of arrays of the "start", "peak" and "end" fixes of each turn, its
+        "angle" in degrees, negative to the left, and its "duration" in seconds
+    """
+    direction = windows["direction"][begin:end]
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], direction, [0]))) != 0)
+    starts, lasts = edges[:-1], edges[1:] - 1
+    turning = direction[starts] != 0
+    starts, lasts = starts[turning] + begin, lasts[turning] + begin
+    # the peak is the first fix of each run with the largest change in its window
+    lengths = lasts - starts + 1
+    firsts = np.cumsum(lengths) - lengths  # position of each run's first fix below
+    run = np.repeat(np.arange(len(starts)), lengths)
+    fixes = starts[run] + np.arange(len(run)) - firsts[run]
+    magnitude = np.abs(windows["change"][fixes])
+    peaks = np.zeros(0, dtype=np.int64)
+    if len(starts):
+        largest = np.maximum.reduceat(magnitude, firsts)
+        candidates = np.flatnonzero(magnitude == largest[run])
+        _, first_candidates = np.unique(run[candidates], return_index=True)
+        peaks = fixes[candidates[first_candidates]]
+    cumulative = windows["cumulative"]
+    angles = (cumulative[windows["high"][lasts]] - cumulative[windows["low"][starts]]) / STEPS_PER_DEGREE
+    speeds = np.asarray(speeds, dtype=float)
+    kept = (np.abs(angles) >= min_angle) & (speeds[peaks] > speed_limits[0]) & (speeds[peaks] < speed_limits[1])
+    ticks = windows["ticks"]
+    return {"start": starts[kept], "peak": peaks[kept], "end": lasts[kept], "angle": angles[kept],
+            "duration": (ticks[lasts] - ticks[starts])[kept] / TICKS_PER_SECOND}